@@ -5,7 +5,7 @@ from django.urls import path
 from channels.http import AsgiHandler
 from channels.routing import ProtocolTypeRouter, URLRouter
 
-from apps.pokerboard.consumers import SessionConsumer
+from apps.pokerboard.consumers import BoardConsumer, SessionConsumer
 
 from .token_auth import TokenAuthMiddleware
 
@@ -13,7 +13,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'PokerPlanner.settings')
 django.setup()
 
 ws_patterns = [
-    path("ws/session/<int:id>", SessionConsumer.as_asgi())
+    path("ws/session/<int:id>", SessionConsumer.as_asgi()),
+    path("ws/board/<int:id>", BoardConsumer.as_asgi()),
 ]
 
 application = ProtocolTypeRouter({
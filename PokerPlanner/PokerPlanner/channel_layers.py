@@ -0,0 +1,178 @@
+"""
+Channel layers spreading session groups over several Redis hosts.
+
+Group and channel names are placed on hosts by a consistent hash ring, so
+all traffic of a group goes through one host and adding a host only moves
+the groups of the ring arcs it takes over.
+"""
+import asyncio
+import bisect
+import contextvars
+import hashlib
+
+from channels_redis import pubsub
+from channels_redis.core import RedisChannelLayer
+
+# Host of the group whose message is being sent, see ShardedRedisChannelLayer
+_group_index = contextvars.ContextVar('group_index', default=None)
+
+
+def node_name(host):
+    """
+    Stable name of a Redis host, as given in the layer's hosts.
+    """
+    if isinstance(host, dict):
+        return str(host.get('address', sorted(host.items())))
+    return str(host)
+
+
+class HashRing:
+    """
+    Consistent hash ring of nodes, each placed at replicas points.
+
+    get(key) returns the index of the node owning the first point after
+    the key's hash.
+    """
+
+    def __init__(self, nodes, replicas=100):
+        points = sorted(
+            (self.hash(f'{node}#{replica}'), index)
+            for index, node in enumerate(nodes) for replica in range(replicas)
+        )
+        self.hashes = [point for point, _ in points]
+        self.nodes = [index for _, index in points]
+
+    @staticmethod
+    def hash(value):
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+    def get(self, key):
+        index = bisect.bisect(self.hashes, self.hash(key))
+        return self.nodes[index % len(self.nodes)]
+
+
+class ShardedRedisChannelLayer(RedisChannelLayer):
+    """
+    RedisChannelLayer placing groups and channels on its hosts with a
+    consistent hash ring instead of a modulo of the host count.
+
+    Group memberships and messages sent to a group live on the group's
+    host, so a board's traffic stays on one host. A worker's channels
+    therefore get messages on every host, each host's queue of the worker
+    is read by a task of its own.
+    """
+
+    def __init__(self, hosts=None, replicas=100, **kwargs):
+        super().__init__(hosts=hosts, **kwargs)
+        self.ring = HashRing([node_name(host) for host in self.hosts], replicas)
+        # Messages read by the tasks of each event loop, and those tasks
+        self.inboxes = {}
+        self.readers = {}
+
+    def consistent_hash(self, value):
+        if self.ring_size == 1:
+            return 0
+        if '!' in value:
+            # Channels of a worker share its queue
+            value = self.non_local_name(value)
+        return self.ring.get(value)
+
+    async def group_send(self, group, message):
+        token = _group_index.set(self.consistent_hash(group))
+        try:
+            await super().group_send(group, message)
+        finally:
+            _group_index.reset(token)
+
+    def _map_channel_keys_to_connection(self, channel_names, message):
+        connection_to_channel_keys, messages, capacities = super()._map_channel_keys_to_connection(
+            channel_names, message
+        )
+        index = _group_index.get()
+        if index is not None:
+            connection_to_channel_keys = {
+                index: [key for keys in connection_to_channel_keys.values() for key in keys]
+            }
+        return connection_to_channel_keys, messages, capacities
+
+    async def receive_single(self, channel):
+        if self.ring_size == 1 or '!' not in channel:
+            return await super().receive_single(channel)
+        content = await self.inbox(channel).get()
+        message = self.deserialize(content)
+        if '__asgi_channel__' in message:
+            channel = message.pop('__asgi_channel__')
+        return channel, message
+
+    def inbox(self, channel):
+        """
+        Returns the messages of the worker's queue on every host, read by a
+        task per host started on first use.
+        """
+        loop = asyncio.get_event_loop()
+        if loop not in self.inboxes:
+            self.inboxes[loop] = asyncio.Queue(self.capacity)
+            self.readers[loop] = [
+                asyncio.ensure_future(self.read(index, self.prefix + channel, self.inboxes[loop]))
+                for index in range(self.ring_size)
+            ]
+        return self.inboxes[loop]
+
+    async def read(self, index, channel_key, inbox):
+        """
+        Moves messages of a host's queue to the inbox. A message is removed
+        from the backup queue once in the inbox, until then a cancelled
+        reader leaves it to the next one.
+        """
+        while True:
+            content = await self._brpop_with_clean(index, channel_key, timeout=self.brpop_timeout)
+            if content is not None:
+                await inbox.put(content)
+                await self._clean_receive_backup(index, channel_key)
+
+    async def close_pools(self):
+        loop = asyncio.get_event_loop()
+        readers = self.readers.pop(loop, [])
+        self.inboxes.pop(loop, None)
+        for reader in readers:
+            reader.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+        await super().close_pools()
+
+
+class ShardedRedisPubSubLoopLayer(pubsub.RedisPubSubLoopLayer):
+    """
+    Pub/sub layer of an event loop, placing channels and groups on its
+    hosts with a consistent hash ring.
+    """
+
+    def __init__(self, hosts=None, replicas=100, **kwargs):
+        super().__init__(hosts=hosts, **kwargs)
+        self.ring = HashRing(
+            [node_name(host) for host in hosts or [('localhost', 6379)]], replicas
+        )
+
+    def _get_shard(self, channel_or_group_name):
+        return self._shards[self.ring.get(channel_or_group_name)]
+
+
+class ShardedRedisPubSubChannelLayer(pubsub.RedisPubSubChannelLayer):
+    """
+    Channel layer publishing each group's messages once, on the group's
+    host, to the workers subscribed to it.
+
+    Unlike RedisChannelLayer, group memberships are kept by each worker
+    and messages to a group never touch the other hosts, so a board's
+    traffic stays on one host. Messages to workers which are not
+    subscribed (not running, disconnected) are lost, like with any
+    pub/sub. A worker can only discard its own channels from a group, so
+    the presence reaper can't discard the connections of a dead worker.
+    """
+
+    def _get_layer(self):
+        loop = asyncio.get_running_loop()
+        layer = self._layers.get(loop)
+        if layer is None:
+            layer = self._layers[loop] = ShardedRedisPubSubLoopLayer(*self._args, **self._kwargs)
+            pubsub._wrap_close(self, loop)
+        return layer
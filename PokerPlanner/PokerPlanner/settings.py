@@ -1,7 +1,7 @@
 import os
 
 from atlassian import Jira
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -52,8 +52,22 @@ AUTHENTICATION_BACKENDS = (
 
 REST_FRAMEWORK = {
    'DEFAULT_AUTHENTICATION_CLASSES': (
-       'rest_framework.authentication.TokenAuthentication',
+       'apps.user.authentication.CachedTokenAuthentication',
    ),
+   'DEFAULT_PAGINATION_CLASS': 'libs.pagination.KeysetPagination',
+   'PAGE_SIZE': 50,
+}
+
+# Largest page a client can ask for with ?page_size=
+MAX_PAGE_SIZE = 500
+
+# Tokens resolved by REST and websocket authentication are cached this
+# long (seconds), SHARED also keeps them in the default cache. Revoked
+# tokens are announced through the default cache whatever SHARED is.
+TOKEN_CACHE = {
+    'SIZE': 10000,
+    'TTL': 60,
+    'SHARED': config('TOKEN_CACHE_SHARED', default=False, cast=bool),
 }
 
 ROOT_URLCONF = 'PokerPlanner.urls'
@@ -79,14 +93,80 @@ TEMPLATES = [
 # WSGI_APPLICATION = 'PokerPlanner.wsgi.application'
 AUTH_USER_MODEL = 'user.User'
 ASGI_APPLICATION = "PokerPlanner.asgi.application"
+# Session groups are spread over these Redis hosts by consistent hashing
+# of their name, all traffic of a group goes through one host. Group
+# memberships are kept in Redis so the presence reaper can discard the
+# connections of any worker, ShardedRedisPubSubChannelLayer keeps them in
+# each worker and doesn't allow it. Presence, event logs and timer locks
+# live on the first host.
+CHANNEL_REDIS_HOSTS = config('CHANNEL_REDIS_HOSTS', default='redis://localhost:6379', cast=Csv())
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "BACKEND": config(
+            'CHANNEL_LAYER_BACKEND', default='PokerPlanner.channel_layers.ShardedRedisChannelLayer'
+        ),
         "CONFIG": {
-            "hosts": [("localhost", 6379)],
+            "hosts": CHANNEL_REDIS_HOSTS,
         },
     },
 }
+# Users connected to a voting session, shared by all ASGI workers
+POKERBOARD_PRESENCE = {
+    "BACKEND": "apps.pokerboard.presence.RedisPresenceStore",
+    "CONFIG": {
+        "hosts": CHANNEL_REDIS_HOSTS[:1],
+    },
+}
+# Latest events of every voting session, replayed to reconnecting clients
+POKERBOARD_EVENT_LOG = {
+    "BACKEND": "apps.pokerboard.event_log.RedisEventLog",
+    "CONFIG": {
+        "hosts": CHANNEL_REDIS_HOSTS[:1],
+        "size": 200,
+    },
+}
+# Lets a single worker broadcast the expiry of a ticket's voting timer
+POKERBOARD_TIMER_LOCK = {
+    "BACKEND": "apps.pokerboard.timers.RedisTimerLock",
+    "CONFIG": {
+        "hosts": CHANNEL_REDIS_HOSTS[:1],
+    },
+}
+# Limits of messages received from a websocket connection default to
+# apps.pokerboard.constants, POKERBOARD_MAX_FRAME_BYTES and
+# POKERBOARD_RATE_LIMITS override them
+# Frames waiting for a slow websocket client, POKERBOARD_OUTBOUND_QUEUE
+# overrides apps.pokerboard.constants.OUTBOUND_QUEUE. Once size of them are
+# waiting the policy drops superseded votes ("drop_votes"), collapses them
+# into a snapshot ("snapshot") or closes the connection ("close"). A window
+# only suits clients answering pings: at most window frames are then sent
+# and not yet acknowledged by a pong.
+# POKERBOARD_HEARTBEAT overrides how often websocket clients are pinged
+# and how long silent connections live, see apps.pokerboard.constants
+# Threads available to websocket consumers for database queries
+POKERBOARD_DB_THREADS = config('POKERBOARD_DB_THREADS', default=10, cast=int)
+# Votes are held in memory and written to the database in batches this often
+POKERBOARD_VOTE_FLUSH_INTERVAL_MS = 200
+# Lets websocket clients ask for msgpack frames (pokerplanner.msgpack subprotocol)
+POKERBOARD_BINARY_FRAMES = config('POKERBOARD_BINARY_FRAMES', default=False, cast=bool)
+# Session authorization lookups are cached this long (seconds)
+POKERBOARD_ACCESS_CACHE_TTL = 300
+# Pokerboard detail, ticket and member responses are cached this long
+# (seconds), writes to a board stop serving them right away
+POKERBOARD_RESPONSE_CACHE_TTL = 300
+
+# Set CACHE_BACKEND to django_redis.cache.RedisCache (django-redis) to
+# share the cache between workers: pokerboard response versions, session
+# access, auth tokens and their revocations are then invalidated for
+# every process at once. The default in-process cache only suits a single
+# worker.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
@@ -162,6 +242,24 @@ EMAIL_PORT = config('EMAIL_PORT')
 CELERY_BROKER_URL = config('BROKER_URL')
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
+CELERY_BEAT_SCHEDULE = {
+    'drain-jira-outbox': {
+        'task': 'apps.pokerboard.tasks.drain_jira_outbox',
+        'schedule': 30.0,
+    },
+    'reap-presence': {
+        'task': 'apps.pokerboard.tasks.reap_presence',
+        'schedule': 60.0,
+    },
+}
+
+#Jira outbox, estimates and comments are pushed to Jira by celery
+JIRA_OUTBOX = {
+    'MAX_ATTEMPTS': 8,
+    'BACKOFF_SECONDS': 5,
+    'MAX_BACKOFF_SECONDS': 600,
+    'HOST_CONCURRENCY': 4,
+}
 
 PASSWORD_RESET_TIMEOUT_DAYS=1
 
@@ -0,0 +1,12 @@
+"""
+Settings of the test suite, whatever cache the environment configures:
+python manage.py test --settings=PokerPlanner.test_settings
+"""
+from PokerPlanner.settings import *  # noqa: F401,F403
+
+# Tests clear the cache, it is private to the test process
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
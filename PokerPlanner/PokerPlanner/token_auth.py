@@ -1,18 +1,20 @@
+from urllib.parse import parse_qs
+
 from django.contrib.auth.models import AnonymousUser
 
 from channels.middleware import BaseMiddleware
 
-from apps.user.models import Token
+from apps.user import token_cache
+
 
-def get_user(token_key):
+async def get_user(token_key):
     """
     Gets user from a token_key
     """
-    try:
-        token = Token.objects.get(key=token_key)
-        return token.user
-    except Token.DoesNotExist:
+    token = await token_cache.aget_token(token_key)
+    if token is None:
         return AnonymousUser()
+    return token.user
 
 
 class TokenAuthMiddleware(BaseMiddleware):
@@ -21,10 +23,7 @@ class TokenAuthMiddleware(BaseMiddleware):
     """
 
     async def __call__(self, scope, receive, send):
-        try:
-            print(":::", scope['query_string'])
-            token_key = (dict((query.split('=') for query in scope['query_string'].decode().split("&")))).get('token', None)
-        except ValueError:
-            token_key = None
-        scope['user'] = AnonymousUser() if token_key is None else get_user(token_key)
+        query = parse_qs(scope['query_string'].decode(errors='replace'))
+        token_key = query.get('token', [None])[0]
+        scope['user'] = AnonymousUser() if token_key is None else await get_user(token_key)
         return await super().__call__(scope, receive, send)
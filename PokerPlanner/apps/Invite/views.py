@@ -1,14 +1,18 @@
+import functools
+
 from rest_framework import mixins, status, viewsets
 from rest_framework.generics import ListAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from apps.pokerboard import access_cache, response_cache
 from apps.pokerboard import models as pokerboard_models
 from apps.Invite import serializers as Invite_serializers
 from apps.Invite import permissions 
 from apps.pokerboard import constants 
 from apps.pokerboard import serializer as pokerboard_serializers
+from libs import conditional
 
 
 class ManagerListInviteView(ListAPIView):
@@ -18,11 +22,19 @@ class ManagerListInviteView(ListAPIView):
     serializer_class = Invite_serializers.InviteSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        pokerboard_id = self.request.query_params.get('pokerboard')
+        return pokerboard_models.Invite.objects.filter(pokerboard=pokerboard_id)
+
     def list(self, request, *args, **kwargs):
-        pokerboard_id = request.query_params.get('pokerboard')
-        inivites = pokerboard_models.Invite.objects.filter(pokerboard=pokerboard_id)
-        serializer = self.get_serializer(inivites, many=True)
-        return Response(serializer.data)
+        """
+        Lists the invites of ?pokerboard=, which bump its version.
+        """
+        view = functools.partial(super().list, request, *args, **kwargs)
+        pokerboard_id = request.query_params.get('pokerboard', '')
+        if not pokerboard_id.isdigit():
+            return view()
+        return conditional.respond(request, view, [response_cache.version(int(pokerboard_id))])
 
 
 class InviteViewSet(viewsets.ModelViewSet):
@@ -68,5 +80,6 @@ class InviteViewSet(viewsets.ModelViewSet):
         self.create_pokerboard_user(request)
         invite.status = constants.ACCEPTED
         invite.save()
+        access_cache.invalidate_member(invite.pokerboard_id, request.user.id)
         serializer = Invite_serializers.InviteSerializer(instance=invite)
         return Response(data=['Added to the pokerboard'])
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group', '0002_auto_20211025_0939'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='group',
+            index=models.Index(fields=['created_at', 'id'], name='group_created_idx'),
+        ),
+    ]
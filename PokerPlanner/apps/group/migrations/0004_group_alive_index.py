@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group', '0003_group_created_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='group',
+            index=models.Index(condition=models.Q(deleted_at=None), fields=['id'], name='group_alive_id_idx'),
+        ),
+    ]
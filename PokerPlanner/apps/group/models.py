@@ -11,6 +11,13 @@ class Group(util_models.CommonInfo, util_models.SoftDeletionModel):
     name = models.CharField(unique=True, max_length=50, help_text="Name of the group")
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="groups_created", on_delete=models.CASCADE)
     members = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='groups_involved', help_text="Members in a group")
-    
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='group_created_idx'),
+            # Groups of a member are reached from group_group_members by id
+            models.Index(fields=['id'], name='group_alive_id_idx', condition=util_models.ALIVE),
+        ]
+
     def __str__(self):
         return self.name
@@ -83,7 +83,7 @@ class GroupTestCases(APITestCase):
         response = self.client.get(self.GROUP_URL)
 
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data["results"]), 1)
 
     def test_get_group_details(self):
         """
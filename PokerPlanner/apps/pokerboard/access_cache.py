@@ -0,0 +1,85 @@
+"""
+Cache of the lookups authorizing a user to join a ticket's session.
+
+Entries expire after POKERBOARD_ACCESS_CACHE_TTL seconds, views changing
+memberships or deleting pokerboards/tickets invalidate them right away.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.pokerboard import models as poker_models
+
+# Cached for users who are not members, as None means "not cached"
+NOT_MEMBER = False
+
+
+def ttl():
+    return getattr(settings, 'POKERBOARD_ACCESS_CACHE_TTL', 300)
+
+
+def ticket_key(ticket_id):
+    return f'session_access:ticket:{ticket_id}'
+
+
+def board_key(pokerboard_id):
+    return f'session_access:board:{pokerboard_id}'
+
+
+def member_key(pokerboard_id, user_id):
+    return f'session_access:member:{pokerboard_id}:{user_id}'
+
+
+def get_ticket(ticket_id):
+    """
+    Returns {'pokerboard_id', 'manager_id'} of the ticket, None if not cached.
+    """
+    return cache.get(ticket_key(ticket_id))
+
+
+def set_ticket(ticket_id, ticket):
+    cache.set(ticket_key(ticket_id), ticket, ttl())
+
+
+def get_board(pokerboard_id):
+    """
+    Returns {'manager_id'} of the pokerboard, None if not cached.
+    """
+    return cache.get(board_key(pokerboard_id))
+
+
+def set_board(pokerboard_id, board):
+    cache.set(board_key(pokerboard_id), board, ttl())
+
+
+def get_member(pokerboard_id, user_id):
+    """
+    Returns serialized membership of user, NOT_MEMBER or None if not cached.
+    """
+    return cache.get(member_key(pokerboard_id, user_id))
+
+
+def set_member(pokerboard_id, user_id, member):
+    cache.set(member_key(pokerboard_id, user_id), member, ttl())
+
+
+def invalidate_member(pokerboard_id, user_id):
+    cache.delete(member_key(pokerboard_id, user_id))
+
+
+def invalidate_ticket(ticket_id):
+    cache.delete(ticket_key(ticket_id))
+
+
+def invalidate_pokerboard(pokerboard_id):
+    """
+    Forgets every ticket and membership of the pokerboard.
+    """
+    ticket_ids = poker_models.Ticket.all_objects.filter(
+        pokerboard=pokerboard_id).values_list('id', flat=True)
+    user_ids = poker_models.PokerboardUser.all_objects.filter(
+        pokerboard=pokerboard_id).values_list('user_id', flat=True)
+    cache.delete_many(
+        [board_key(pokerboard_id)]
+        + [ticket_key(ticket_id) for ticket_id in ticket_ids]
+        + [member_key(pokerboard_id, user_id) for user_id in user_ids]
+    )
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
-from apps.pokerboard.models import (Invite, ManagerCredentials, Pokerboard,
+from apps.pokerboard.models import (Invite, JiraOutbox, ManagerCredentials, Pokerboard,
                                     PokerboardUser, Ticket, UserTicketEstimate)
 
 admin.site.register(Pokerboard)
@@ -10,3 +10,4 @@ admin.site.register(Invite)
 admin.site.register(PokerboardUser)
 admin.site.register(ManagerCredentials)
 admin.site.register(UserTicketEstimate)
+admin.site.register(JiraOutbox)
@@ -9,4 +9,34 @@ PENDING = 0
 ACCEPTED = 1
 DECLINED = 2
 
-MESSAGE_TYPES = ["estimate", "skip", "vote", "initialise_game", "start_timer"]
+SESSION_MESSAGE_TYPES = ["estimate", "skip", "vote", "initialise_game", "start_timer", "ping", "pong"]
+BOARD_MESSAGE_TYPES = SESSION_MESSAGE_TYPES + ["select_ticket"]
+MESSAGE_TYPES = BOARD_MESSAGE_TYPES
+
+# Largest websocket frame accepted from clients, in bytes
+MAX_FRAME_BYTES = 4096
+# Token buckets of a websocket connection, "default" applies to every message
+RATE_LIMITS = {
+    "default": {"rate": 10, "burst": 20},
+    "vote": {"rate": 5, "burst": 10},
+    "initialise_game": {"rate": 0.5, "burst": 3},
+    "select_ticket": {"rate": 2, "burst": 5},
+}
+# Frames waiting to be sent to a connection, see apps.pokerboard.outbound.
+# No window by default: clients that never answer pings would stall.
+OUTBOUND_QUEUE = {"size": 100, "policy": "snapshot", "window": None}
+# Events still sent to a slow client after its frames collapse into a snapshot
+OUTBOUND_KEPT_TYPES = ("estimate", "skip", "ticket_selected")
+# Close code asking clients to reconnect and resume from their last seq
+RESYNC_CLOSE_CODE = 4000
+# Seconds between pings sent to websocket clients, connections silent for
+# timeout seconds are closed and their presence is reaped
+HEARTBEAT = {"interval": 30, "timeout": 90}
+# Close code of connections silent for longer than the heartbeat timeout
+IDLE_CLOSE_CODE = 4001
+# Group of a pokerboard's board connections, whose events are tagged with
+# the board stream
+BOARD_GROUP_PREFIX = 'board_'
+BOARD_STREAM = 'board'
+# Space between order keys of consecutive tickets, see apps.pokerboard.ordering
+TICKET_ORDER_GAP = 1024
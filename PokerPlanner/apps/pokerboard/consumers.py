@@ -1,21 +1,31 @@
+import asyncio
 import json
+import time
 from datetime import datetime
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
-from django.db.models import Max
 from rest_framework import serializers
 from channels.generic.websocket import AsyncWebsocketConsumer
 
-from apps.pokerboard import (
-    models as poker_models,
-    serializer as poker_serializers
-)
-from apps.user import (
-    serializers as user_serializers
-)
-from atlassian import Jira
+from apps.pokerboard import constants as pokerboard_constants
+from apps.pokerboard import encoding, event_log, outbound, session_queries, tally
+from apps.pokerboard import serializer as poker_serializers
+from apps.pokerboard.presence import get_presence_store, heartbeat
+from apps.user import serializers as user_serializers
+from libs import metrics
+from libs.rate_limit import RateLimiter
 
 
 class SessionConsumer(AsyncWebsocketConsumer):
+    """
+    Voting session of a ticket.
+
+    Handlers never touch the ORM directly, all database work goes through
+    session_queries so it runs off the event loop in a single hop.
+    """
+    seq_field = serializers.IntegerField(min_value=0)
+    # Handlers clients can call, each is a method of the same name
+    message_types = frozenset(pokerboard_constants.SESSION_MESSAGE_TYPES)
 
     async def connect(self):
         """
@@ -25,97 +35,257 @@ class SessionConsumer(AsyncWebsocketConsumer):
         if type(self.scope["user"]) == AnonymousUser:
             await self.close()
         else:
-            diction = dict(
-                (query.split('=') for query in self.scope['query_string'].decode().split("&")))
             self.user = self.scope['user']
-            self.ticket_id = self.scope['url_route']['kwargs']['id']
-            self.pokerboard_id = diction.get('pid', None)
-            self.manager_id = poker_models.Ticket.objects.get(
-                id=self.ticket_id).pokerboard.manager.id
+            ticket_id = self.scope['url_route']['kwargs']['id']
+            self.pokerboard_id, self.manager_id, allowed, member = await session_queries.get_session_access(
+                ticket_id, self.user.id
+            )
 
-            if not poker_models.PokerboardUser.objects.filter(
-                    user=self.user.id, pokerboard=self.pokerboard_id).exists() and self.user.id != self.manager_id:
+            if not allowed:
                 await self.close()
             else:
-                print("::inside else")
-                self.session_group_name = 'session_%s' % self.ticket_id
+                self.user_data = user_serializers.UserSerializer(self.user).data
+                await self.enter_ticket(ticket_id)
+                self.presence_group = self.session_group_name
+                await self.accept_member(member)
 
-                await self.channel_layer.group_add(
-                    self.session_group_name,
-                    self.channel_name,
-                )
-                clients = getattr(self.channel_layer,
-                                  self.session_group_name, [])
-                clients.append(self.scope["user"])
-                setattr(self.channel_layer, self.session_group_name, clients)
-                await self.accept()
+    async def enter_ticket(self, ticket_id):
+        """
+        Subscribes to the ticket's session, its votes are loaded on first
+        use on this worker.
+        """
+        self.ticket_id = ticket_id
+        self.votes = await tally.registry.acquire(ticket_id)
+        self.session_group_name = 'session_%s' % ticket_id
+        await self.channel_layer.group_add(
+            self.session_group_name,
+            self.channel_name,
+        )
+
+    async def leave_ticket(self):
+        await self.channel_layer.group_discard(self.session_group_name, self.channel_name)
+        await tally.registry.release(self.votes)
+        self.ticket_id = self.votes = self.session_group_name = None
+
+    async def accept_member(self, member):
+        """
+        Registers user's presence and accepts the connection, the others
+        are told when it is the user's first connection.
+        """
+        self.rate_limiter = RateLimiter(
+            getattr(settings, 'POKERBOARD_RATE_LIMITS', pokerboard_constants.RATE_LIMITS)
+        )
+        joined = await get_presence_store().join(
+            self.presence_group, self.user.id, self.channel_name
+        )
+        self.binary = (
+            encoding.binary_frames_enabled()
+            and encoding.MSGPACK_SUBPROTOCOL in self.scope.get('subprotocols', [])
+        )
+        await self.accept(encoding.MSGPACK_SUBPROTOCOL if self.binary else None)
+        config = getattr(settings, 'POKERBOARD_OUTBOUND_QUEUE', pokerboard_constants.OUTBOUND_QUEUE)
+        self.outbound = outbound.OutboundQueue(
+            self.write, self.resync_frame, self.resync_close, self.encode({'type': 'ping'}), **config
+        )
+        self.outbound.start()
+        self.last_seen = time.monotonic()
+        self.heartbeat_task = asyncio.ensure_future(self.heartbeat())
+        if joined and member is not None:
+            await self.publish({
+                'type': 'join',
+                'user': member
+            }, group=self.presence_group)
+
+    async def heartbeat(self):
+        """
+        Pings the client every heartbeat interval and keeps its presence
+        fresh, closes the connection once the client went silent.
+        """
+        config = heartbeat()
+        while True:
+            await asyncio.sleep(config['interval'])
+            if time.monotonic() - self.last_seen > config['timeout']:
+                metrics.incr('session.idle_closed')
+                await self.close(code=pokerboard_constants.IDLE_CLOSE_CODE)
+                return
+            await get_presence_store().touch(self.presence_group, self.channel_name)
+            self.outbound.ping()
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
+        self.last_seen = time.monotonic()
+        frame = bytes_data if bytes_data is not None else text_data.encode()
+        if len(frame) > getattr(settings, 'POKERBOARD_MAX_FRAME_BYTES', pokerboard_constants.MAX_FRAME_BYTES):
+            await self.send_message({'type': 'error', 'error': "Message too large"})
+            return
         try:
-            text_data_json = json.loads(text_data)
-            message = text_data_json['message']
-            message_type = text_data_json['message_type']
-            method_to_call = getattr(self, message_type)
-            res = await method_to_call({
+            data = encoding.unpack(frame) if bytes_data is not None else encoding.loads(frame)
+        except ValueError:
+            data = None
+        serializer = poker_serializers.ValidateMessageSerializer(data=data)
+        if not serializer.is_valid() or serializer.validated_data['message_type'] not in self.message_types:
+            await self.send_message({'type': 'error', 'error': "Invalid message"})
+            return
+        message_type = serializer.validated_data['message_type']
+        retry_after = self.rate_limiter.throttle(message_type)
+        if retry_after:
+            metrics.incr('session.throttled')
+            await self.send_message({
+                'type': 'error', 'error': "Too many messages", 'retry_after': round(retry_after, 3)
+            })
+            return
+        try:
+            res = await self.handle_message(message_type, {
                 'type': message_type,
-                'message': message,
+                'message': serializer.validated_data['message'],
                 'user': self.scope["user"].id
             })
             # Send message to room group
             if res:
-                await self.channel_layer.group_send(
-                    self.session_group_name,
-                    {
-                        'type': 'broadcast',
-                        'message': res
-                    }
-                )
+                await self.publish(res)
         except serializers.ValidationError:
-            await self.send(text_data=json.dumps({
-                'type': 'error',
-                'error': "Something went wrong"
-            }))
+            await self.send_message({'type': 'error', 'error': "Something went wrong"})
+
+    async def handle_message(self, message_type, event):
+        return await getattr(self, message_type)(event)
+
+    async def publish(self, message, group=None):
+        """
+        Sends a message to everyone in the session (or given group), encoded
+        only once and numbered by the group's event log.
+        """
+        extra = {'origin': tally.PROCESS_ID}
+        if message["type"] in ("vote", "votes"):
+            votes = [message["vote"]] if message["type"] == "vote" else message["votes"]
+            # Lets other workers update their tally without decoding the message.
+            extra['votes'] = [[vote["user"]["id"], vote["estimate"]] for vote in votes]
+            metrics.incr('session.vote_broadcasts')
+        elif message["type"] in ("start_timer", "estimate", "skip"):
+            # Timer of the ticket on other workers follows this one.
+            extra['deadline'] = self.votes.deadline
+        if message["type"] in pokerboard_constants.OUTBOUND_KEPT_TYPES:
+            # A snapshot of the session doesn't tell, so it is never collapsed.
+            extra['keep'] = True
+        if group is None:
+            group = self.session_group_name
+            extra['ticket'] = self.ticket_id
+        await event_log.publish(self.channel_layer, group, message, **extra)
+
+    async def send_message(self, message):
+        """
+        Sends a message to this connection only.
+        """
+        await self.outbound.put(self.encode(message))
+
+    def encode(self, message):
+        if self.binary:
+            return {'bytes_data': encoding.pack(message)}
+        return {'text_data': encoding.dumps(message)}
+
+    async def write(self, frame):
+        await self.send(**frame)
+
+    async def resync_frame(self):
+        """
+        Session state replacing the frames a slow client could not keep up
+        with, None when no ticket is selected.
+        """
+        if self.ticket_id is None:
+            return None
+        return self.encode(await self.session_state("initialise_game"))
+
+    async def resync_close(self):
+        await self.close(code=pokerboard_constants.RESYNC_CLOSE_CODE)
+
+    def streams(self):
+        """
+        Groups whose events are sent to this connection, by the field
+        numbering them in snapshots ("seq" for the ticket's session).
+        """
+        return {"seq": self.session_group_name}
 
     async def initialise_game(self, event):
         """
-        Initialise game, fetches connceted users and votes already given
-        """
-        votes = poker_models.UserTicketEstimate.objects.filter(
-            ticket_id=self.ticket_id)
-        vote_serializer = poker_serializers.VoteSerializer(
-            instance=votes, many=True)
-        clients = list(
-            set(getattr(self.channel_layer, self.session_group_name, [])))
-        query_set = poker_models.PokerboardUser.objects.filter(user__in=clients, pokerboard=self.pokerboard_id)
-        serializer = poker_serializers.PokerBoardVotingUserSerializer(instance=query_set, many=True)
-        self.session = poker_models.Ticket.objects.filter(
-            id=self.ticket_id).first()
+        Sends session state to the requesting client only, tagged with the
+        sequence number of the latest event it includes. A client sending
+        the last_seq it has seen just gets the events it missed, when they
+        are all still buffered.
+        """
+        resume = await self.missed_events(event["message"])
+        if resume is not None:
+            await self.send_message(resume)
+            return
+        await self.send_message(await self.session_state(event["type"]))
+
+    async def missed_events(self, message):
+        """
+        Events after the client's last_<field> cursor of every stream, None
+        when a cursor is missing or some events are not buffered anymore.
+        """
+        log = event_log.get_event_log()
+        resume = {"type": "resume", "events": []}
+        for field, group in self.streams().items():
+            last_seq = message.get(f"last_{field}")
+            if last_seq is None:
+                return None
+            last_seq = self.seq_field.run_validation(last_seq)
+            events = await log.since(group, last_seq)
+            if events is None:
+                return None
+            resume[field] = last_seq + len(events)
+            resume["events"] += events
+        return resume
+
+    async def session_state(self, message_type):
+        """
+        Snapshot of the session, numbered like the events.
+        """
+        # Read before building the snapshot, so events happening meanwhile
+        # are replayed on top of it by the client rather than lost.
+        log = event_log.get_event_log()
+        seqs = {field: await log.current(group) for field, group in self.streams().items()}
+        clients = await get_presence_store().members(self.presence_group)
+        votes = dict(self.votes.votes)
+        snapshot = await session_queries.get_session_snapshot(
+            self.ticket_id, self.pokerboard_id, clients, list(votes)
+        )
         return {
-            "type": event["type"],
-            "votes": vote_serializer.data,
-            "users": serializer.data,
-            "timer": json.dumps(self.session.start_datetime, default=self.myconverter)
+            "type": message_type,
+            **seqs,
+            "votes": [
+                self.vote_data(snapshot["voters"][user_id], estimate)
+                for user_id, estimate in votes.items() if user_id in snapshot["voters"]
+            ],
+            "users": snapshot["users"],
+            "timer": json.dumps(snapshot["start_datetime"], default=self.myconverter),
+            "expired": self.votes.is_expired(),
         }
 
     async def start_timer(self, event):
         """
-        Starts timer on current voting session
+        Starts timer on current voting session, the server broadcasts
+        timer_expired and closes votes once the pokerboard's timer is over.
         """
-        manager = self.session.pokerboard.manager
-        if self.scope["user"] == manager and self.session.status != poker_models.Ticket.ESTIMATED:
-            now = datetime.now()
-            self.session.start_datetime = now
-            self.session.status = poker_models.Ticket.ONGOING
-            self.session.save()
+        now = None
+        if self.user.id == self.manager_id:
+            now = await session_queries.start_ticket_timer(self.ticket_id)
+        if now:
+            self.votes.start_timer(now)
             return {
                 "type": event["type"],
                 "start_datetime": json.dumps(now, default=self.myconverter),
+                "timer": self.votes.timer,
             }
         else:
-            await self.send(text_data=json.dumps({
-                'type': 'error',
-                'error': "Can't start timer"
-            }))
+            await self.send_message({'type': 'error', 'error': "Can't start timer"})
+
+    async def ping(self, event):
+        await self.send_message({'type': 'pong'})
+
+    async def pong(self, event):
+        """
+        Answer to the server's ping, acknowledging the frames sent before it.
+        """
+        self.outbound.ack()
 
     def myconverter(self, obj):
         """
@@ -124,119 +294,203 @@ class SessionConsumer(AsyncWebsocketConsumer):
         if isinstance(obj, datetime):
             return obj.__str__()
 
+    def vote_data(self, user_data, estimate):
+        return {
+            "estimate": estimate,
+            "ticket_id": self.ticket_id,
+            "user": user_data,
+        }
+
     async def vote(self, event):
         """
-        Places/update a vote on a ticket
+        Places/update a vote on a ticket, it is persisted in the next
+        batch of votes of this ticket.
         """
+        if self.votes.is_expired():
+            await self.send_message({'type': 'error', 'error': "Voting time is over"})
+            return
         try:
-            context = {"user": self.scope['user'].id,
-                       'ticket_id': self.session.id}
-            serializer = poker_serializers.VoteSerializer(
-                data=event["message"], context=context)
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return {
-                "type": event["type"],
-                "vote": serializer.data
-            }
-        except serializers.ValidationError as e:
-            print(e)
-            await self.send(text_data=json.dumps({
-                'type': 'error',
-                'error': "Invalid estimate"
-            }))
+            estimate = self.votes.validate(event["message"].get("estimate"))
+        except (AttributeError, serializers.ValidationError):
+            await self.send_message({'type': 'error', 'error': "Invalid estimate"})
+            return
+        self.votes.apply(self.user.id, estimate)
+        metrics.incr('session.votes')
+        vote = self.vote_data(self.user_data, estimate)
+        if self.votes.coalesce_window:
+            await self.votes.queue_broadcast(self.user.id, vote, self.publish_votes)
+            return
+        return {
+            "type": event["type"],
+            "vote": vote
+        }
+
+    async def publish_votes(self, votes):
+        """
+        Broadcasts votes coalesced by the ticket's vote state.
+        """
+        await self.publish({
+            "type": "votes",
+            "votes": votes
+        })
 
     async def estimate(self, event):
         """
         Finalize estimation of a ticket.
         """
         try:
-            manager = self.session.pokerboard.manager
-            if self.scope["user"] == manager:
-                self.session.status = poker_models.Ticket.ESTIMATED
-                self.session.estimate = event["message"]["estimate"]
-                now = datetime.now()
-                self.session.end_datetime = now
-                jira_manager = poker_models.ManagerCredentials.objects.get(
-                    user=manager)
-                jira = Jira(
-                    url=jira_manager.url,
-                    username=jira_manager.username,
-                    password=jira_manager.password,
+            if self.user.id == self.manager_id:
+                await self.votes.flush_broadcast()
+                await self.votes.flush()
+                await session_queries.estimate_ticket(
+                    self.ticket_id, self.manager_id, event["message"]["estimate"]
                 )
-
-                fields = {'customfield_10016': event["message"]["estimate"]}
-                jira.update_issue_field(self.session.ticket_id, fields)
-
-                self.session.save()
-
+                self.votes.set_deadline(None)
                 return {
                     "type": event["type"],
-                    "estimate": event["message"]["estimate"]
+                    "estimate": event["message"]["estimate"],
+                    "tally": self.votes.tally(),
                 }
             else:
-                await self.send(text_data=json.dumps({
-                        'type': 'error',
-                        "error": "Only Manager can set final estimate"
-                    }))
-        except serializers.ValidationError as e:
-            await self.send(text_data=json.dumps({
-                    'type': 'error',
-                    "error": "Error occoured while estimating"
-                }))
+                await self.send_message({'type': 'error', 'error': "Only Manager can set final estimate"})
+        except serializers.ValidationError:
+            await self.send_message({'type': 'error', 'error': "Error occoured while estimating"})
 
     async def disconnect(self, code):
         """
         Runs when a user disconnects
         """
-        clients = getattr(self.channel_layer, self.session_group_name, [])
-        clients.remove(self.scope["user"])
-        setattr(self.channel_layer, self.session_group_name, clients)
-        serializer = user_serializers.UserSerializer(
-            list(set(clients)), many=True)
-        await self.channel_layer.group_send(
-            self.session_group_name,
-            {
-                'type': 'broadcast',
-                'message': {
-                    'type': 'leave',
-                    'users': serializer.data
-                }
-            }
+        if not hasattr(self, 'presence_group'):
+            return
+        self.outbound.stop()
+        self.heartbeat_task.cancel()
+        if self.ticket_id is not None:
+            await self.leave_ticket()
+        left = await get_presence_store().leave(
+            self.presence_group, self.user.id, self.channel_name
         )
-        await self.channel_layer.group_discard(self.session_group_name, self.channel_name)
+        if left:
+            await self.publish({
+                'type': 'leave',
+                'user': self.user.id
+            }, group=self.presence_group)
 
     async def broadcast(self, event):
         """
         Broadcast a message to connected channels in current group
         """
-        await self.send(text_data=json.dumps(event["message"]))
+        if "ticket" in event and event["ticket"] != self.ticket_id:
+            # Sent before this connection switched to another ticket.
+            return
+        if event.get("origin") != tally.PROCESS_ID:
+            for user_id, estimate in event.get("votes", ()):
+                self.votes.apply(user_id, estimate, persist=False)
+            if "deadline" in event and event["deadline"] != self.votes.deadline:
+                self.votes.set_deadline(event["deadline"])
+        if self.binary and "bytes" in event:
+            frame = {'bytes_data': event["bytes"]}
+        else:
+            frame = {'text_data': event["text"]}
+        voters = frozenset(user_id for user_id, _ in event.get("votes", ())) or None
+        await self.outbound.put(frame, voters, event.get("keep", False))
 
     async def skip(self, event):
         """
         Skip current voting session
         """
-        manager = self.manager_id
-        print(self.scope["user"].id)
-        print(self.session.status)
-        if self.scope["user"].id == manager and self.session.status != poker_models.Ticket.ESTIMATED:
-            self.session.status = poker_models.Ticket.SKIPPED
-            self.session.save()
-            self.move_ticket_to_end()
+        skipped = False
+        if self.user.id == self.manager_id:
+            await self.votes.flush_broadcast()
+            await self.votes.flush()
+            skipped = await session_queries.skip_ticket(self.ticket_id, self.pokerboard_id)
+        if skipped:
+            self.votes.set_deadline(None)
             return {
                 "type": event["type"],
             }
         else:
-            await self.send(text_data=json.dumps({
-                    'type': 'error',
-                    "error": "Can't skip"
-                }
-            ))
-
-    def move_ticket_to_end(self):
-        max_order = poker_models.Ticket.objects.filter(pokerboard=self.pokerboard_id).aggregate(Max('order'))
-        if max_order:
-            val = max_order['order__max']
-            val = val + 1
-            self.session.order = val
-            self.session.save()
+            await self.send_message({'type': 'error', 'error': "Can't skip"})
+
+
+class BoardConsumer(SessionConsumer):
+    """
+    Voting sessions of every ticket of a pokerboard over one connection.
+
+    Presence is kept per pokerboard, the client picks the ticket it votes
+    on with select_ticket instead of opening a socket per ticket.
+
+    Events of the board (join, leave, ticket_selected) are tagged
+    "stream": "board" and numbered by the board's log, the others by the
+    selected ticket's. Snapshots carry both numbers, seq and board_seq,
+    and a client resumes by sending last_seq and last_board_seq.
+    """
+    ticket_field = serializers.IntegerField(min_value=1)
+    message_types = frozenset(pokerboard_constants.BOARD_MESSAGE_TYPES)
+
+    async def connect(self):
+        if type(self.scope["user"]) == AnonymousUser:
+            await self.close()
+        else:
+            self.user = self.scope['user']
+            self.pokerboard_id = self.scope['url_route']['kwargs']['id']
+            self.manager_id, allowed, member = await session_queries.get_board_access(
+                self.pokerboard_id, self.user.id
+            )
+
+            if not allowed:
+                await self.close()
+            else:
+                self.user_data = user_serializers.UserSerializer(self.user).data
+                self.ticket_id = self.votes = self.session_group_name = None
+                self.presence_group = f'{pokerboard_constants.BOARD_GROUP_PREFIX}{self.pokerboard_id}'
+                await self.channel_layer.group_add(self.presence_group, self.channel_name)
+                await self.accept_member(member)
+
+    def streams(self):
+        return {"seq": self.session_group_name, "board_seq": self.presence_group}
+
+    async def publish(self, message, group=None):
+        if group == self.presence_group:
+            message = {**message, "stream": pokerboard_constants.BOARD_STREAM}
+        await super().publish(message, group)
+
+    async def enter_ticket(self, ticket_id):
+        await super().enter_ticket(ticket_id)
+        # The reaper discards a dead connection from its ticket's session too.
+        await get_presence_store().attach(self.presence_group, self.channel_name, self.session_group_name)
+
+    async def leave_ticket(self):
+        await get_presence_store().attach(self.presence_group, self.channel_name, None)
+        await super().leave_ticket()
+
+    async def handle_message(self, message_type, event):
+        if message_type != "select_ticket" and self.ticket_id is None:
+            await self.send_message({'type': 'error', 'error': "Select a ticket first"})
+            return
+        return await super().handle_message(message_type, event)
+
+    async def select_ticket(self, event):
+        """
+        Makes a ticket of the pokerboard the active one and sends its
+        state, managers selecting a ticket tell the others to follow.
+        """
+        ticket_id = self.ticket_field.run_validation(event["message"].get("ticket"))
+        pokerboard_id, _, _, _ = await session_queries.get_session_access(ticket_id, self.user.id)
+        if pokerboard_id != self.pokerboard_id:
+            await self.send_message({'type': 'error', 'error': "Ticket is not part of this pokerboard"})
+            return
+        if ticket_id != self.ticket_id:
+            if self.ticket_id is not None:
+                await self.leave_ticket()
+            await self.enter_ticket(ticket_id)
+        await self.initialise_game({"type": "initialise_game", "message": event["message"]})
+        if self.user.id == self.manager_id:
+            await self.publish({
+                "type": "ticket_selected",
+                "ticket": ticket_id
+            }, group=self.presence_group)
+
+    async def disconnect(self, code):
+        await super().disconnect(code)
+        if hasattr(self, 'presence_group'):
+            await self.channel_layer.group_discard(self.presence_group, self.channel_name)
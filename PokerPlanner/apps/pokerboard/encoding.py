@@ -0,0 +1,61 @@
+import json
+
+from django.conf import settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Websocket subprotocol a client offers to receive msgpack frames
+MSGPACK_SUBPROTOCOL = 'pokerplanner.msgpack'
+
+
+def dumps(message):
+    """
+    Encodes a message as JSON text, with orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(message).decode()
+    return json.dumps(message)
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def binary_frames_enabled():
+    return msgpack is not None and getattr(settings, 'POKERBOARD_BINARY_FRAMES', False)
+
+
+def pack(message):
+    return msgpack.packb(message, use_bin_type=True)
+
+
+def unpack(data):
+    try:
+        return msgpack.unpackb(data, raw=False)
+    except msgpack.UnpackException as err:
+        raise ValueError(str(err))
+
+
+def broadcast_event(message, **extra):
+    """
+    Channel layer event for the consumers' broadcast handler. The message
+    is encoded here once, receivers forward the encoded frame untouched.
+    """
+    event = {
+        'type': 'broadcast',
+        'text': dumps(message),
+        **extra,
+    }
+    if binary_frames_enabled():
+        event['bytes'] = pack(message)
+    return event
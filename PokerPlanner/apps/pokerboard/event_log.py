@@ -0,0 +1,169 @@
+from collections import deque
+
+from django.conf import settings
+from django.test.signals import setting_changed
+from django.utils.module_loading import import_string
+
+from apps.pokerboard import encoding
+from libs import redis_pool
+
+
+class BaseEventLog:
+    """
+    Numbers the events of a session group and keeps the latest ones.
+
+    Every event gets the next sequence number of its group, clients which
+    missed some events replay them from the buffer instead of asking for
+    a whole new snapshot.
+    """
+
+    def __init__(self, size=200, **kwargs):
+        self.size = size
+
+    async def append(self, group, message):
+        """
+        Stores an event, returns its sequence number.
+        """
+        raise NotImplementedError
+
+    async def current(self, group):
+        """
+        Returns sequence number of the latest event of the group.
+        """
+        raise NotImplementedError
+
+    async def since(self, group, seq):
+        """
+        Returns events after seq, or None if some of them are not
+        buffered anymore.
+        """
+        raise NotImplementedError
+
+
+class InMemoryEventLog(BaseEventLog):
+    """
+    Event log living in the current process, only correct with a single
+    worker. Used for local development and tests.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.seqs = {}
+        self.events = {}
+
+    async def append(self, group, message):
+        seq = self.seqs[group] = self.seqs.get(group, 0) + 1
+        self.events.setdefault(group, deque(maxlen=self.size)).append({**message, 'seq': seq})
+        return seq
+
+    async def current(self, group):
+        return self.seqs.get(group, 0)
+
+    async def since(self, group, seq):
+        current = self.seqs.get(group, 0)
+        if seq > current:
+            return None
+        events = [event for event in self.events.get(group, ()) if event['seq'] > seq]
+        if len(events) != current - seq:
+            return None
+        return events
+
+
+class RedisEventLog(BaseEventLog):
+    """
+    Event log shared by all workers through Redis.
+
+    Each group uses a counter and a capped list of "<seq>:<json>" entries,
+    both updated by a single Lua call so sequence numbers follow the order
+    of the list.
+    """
+    APPEND_SCRIPT = """
+        local seq = redis.call('INCR', KEYS[1])
+        redis.call('RPUSH', KEYS[2], seq .. ':' .. ARGV[1])
+        redis.call('LTRIM', KEYS[2], -tonumber(ARGV[2]), -1)
+        redis.call('EXPIRE', KEYS[1], ARGV[3])
+        redis.call('EXPIRE', KEYS[2], ARGV[3])
+        return seq
+    """
+
+    def __init__(self, hosts=None, prefix='events', expiry=86400, **kwargs):
+        super().__init__(**kwargs)
+        self.host = (hosts or [('localhost', 6379)])[0]
+        self.prefix = prefix
+        self.expiry = expiry
+
+    def _keys(self, group):
+        return [
+            f'{self.prefix}:{group}:seq',
+            f'{self.prefix}:{group}:events',
+        ]
+
+    async def _connection(self):
+        return await redis_pool.get_redis_pool(self.host)
+
+    async def append(self, group, message):
+        redis = await self._connection()
+        return await redis.eval(
+            self.APPEND_SCRIPT, keys=self._keys(group),
+            args=[encoding.dumps(message), self.size, self.expiry]
+        )
+
+    async def current(self, group):
+        redis = await self._connection()
+        return int(await redis.get(self._keys(group)[0]) or 0)
+
+    async def since(self, group, seq):
+        redis = await self._connection()
+        seq_key, events_key = self._keys(group)
+        transaction = redis.multi_exec()
+        transaction.get(seq_key)
+        transaction.lrange(events_key, 0, -1)
+        current, entries = await transaction.execute()
+        current = int(current or 0)
+        if seq > current:
+            return None
+        events = []
+        for entry in entries:
+            entry_seq, data = entry.split(b':', 1)
+            if int(entry_seq) > seq:
+                events.append({**encoding.loads(data), 'seq': int(entry_seq)})
+        if len(events) != current - seq:
+            return None
+        return events
+
+
+_event_log = None
+
+
+def get_event_log():
+    """
+    Returns the event log configured in settings.POKERBOARD_EVENT_LOG.
+    """
+    global _event_log
+    if _event_log is None:
+        config = getattr(settings, 'POKERBOARD_EVENT_LOG', {})
+        backend = import_string(
+            config.get('BACKEND', 'apps.pokerboard.event_log.InMemoryEventLog')
+        )
+        _event_log = backend(**config.get('CONFIG', {}))
+    return _event_log
+
+
+def _reset_event_log(setting, **kwargs):
+    global _event_log
+    if setting == 'POKERBOARD_EVENT_LOG':
+        _event_log = None
+
+
+setting_changed.connect(_reset_event_log)
+
+
+async def publish(channel_layer, group, message, **extra):
+    """
+    Numbers a message and sends it to everyone in the group.
+    """
+    seq = await get_event_log().append(group, message)
+    await channel_layer.group_send(
+        group, encoding.broadcast_event({**message, 'seq': seq}, **extra)
+    )
+    return seq
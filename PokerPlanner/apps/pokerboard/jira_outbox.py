@@ -0,0 +1,144 @@
+from datetime import timedelta
+from urllib.parse import urlparse
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from apps.pokerboard import event_log
+from apps.pokerboard import models as poker_models
+from apps.pokerboard import tasks as poker_tasks
+from atlassian import Jira
+
+DEFAULTS = {
+    'MAX_ATTEMPTS': 8,
+    'BACKOFF_SECONDS': 5,
+    'MAX_BACKOFF_SECONDS': 600,
+    'HOST_CONCURRENCY': 4,
+    'BATCH_SIZE': 50,
+    'SENDING_TIMEOUT_SECONDS': 300,
+}
+# Arbitrary key of the advisory lock serialising claims between drain tasks
+CLAIM_LOCK_ID = 7310
+
+
+def outbox_setting(name):
+    return getattr(settings, 'JIRA_OUTBOX', {}).get(name, DEFAULTS[name])
+
+
+def enqueue(manager_id, ticket, action, payload):
+    """
+    Queues a Jira write, the outbox is drained once the current
+    transaction commits.
+    """
+    credentials = poker_models.ManagerCredentials.objects.get(user=manager_id)
+    if action == poker_models.JiraOutbox.ESTIMATE:
+        # Only the latest estimate of a ticket is worth sending.
+        poker_models.JiraOutbox.objects.filter(
+            ticket=ticket, action=action, status=poker_models.JiraOutbox.PENDING
+        ).update(status=poker_models.JiraOutbox.SUPERSEDED, updated_at=timezone.now())
+    entry = poker_models.JiraOutbox.objects.create(
+        manager_id=manager_id,
+        ticket=ticket,
+        action=action,
+        payload=payload,
+        host=urlparse(credentials.url).netloc,
+    )
+    transaction.on_commit(lambda: poker_tasks.drain_jira_outbox.delay())
+    return entry
+
+
+def claim_due_entries():
+    """
+    Marks due entries as sending and returns their ids, keeping at most
+    HOST_CONCURRENCY entries in flight per Jira host.
+    """
+    now = timezone.now()
+    limit = outbox_setting('HOST_CONCURRENCY')
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [CLAIM_LOCK_ID])
+        # Entries of a crashed worker are retried.
+        poker_models.JiraOutbox.objects.filter(
+            status=poker_models.JiraOutbox.SENDING,
+            updated_at__lt=now - timedelta(seconds=outbox_setting('SENDING_TIMEOUT_SECONDS')),
+        ).update(status=poker_models.JiraOutbox.PENDING, updated_at=now)
+        in_flight = dict(
+            poker_models.JiraOutbox.objects.filter(
+                status=poker_models.JiraOutbox.SENDING
+            ).values('host').annotate(count=Count('id')).values_list('host', 'count')
+        )
+        due = poker_models.JiraOutbox.objects.filter(
+            status=poker_models.JiraOutbox.PENDING, next_attempt_at__lte=now
+        ).order_by('next_attempt_at', 'id').values_list('id', 'host')[:outbox_setting('BATCH_SIZE')]
+        claimed = []
+        for entry_id, host in due:
+            if in_flight.get(host, 0) >= limit:
+                continue
+            in_flight[host] = in_flight.get(host, 0) + 1
+            claimed.append(entry_id)
+        poker_models.JiraOutbox.objects.filter(id__in=claimed).update(
+            status=poker_models.JiraOutbox.SENDING, updated_at=now
+        )
+    return claimed
+
+
+def notify_session(ticket_id, message):
+    """
+    Sends a message to everyone in the ticket's voting session.
+    """
+    async_to_sync(event_log.publish)(
+        get_channel_layer(), 'session_%s' % ticket_id, message, ticket=ticket_id
+    )
+
+
+def send_to_jira(entry):
+    credentials = poker_models.ManagerCredentials.objects.get(user=entry.manager_id)
+    jira = Jira(
+        url=credentials.url,
+        username=credentials.username,
+        password=credentials.password,
+    )
+    if entry.action == poker_models.JiraOutbox.ESTIMATE:
+        fields = {'customfield_10016': entry.payload['estimate']}
+        jira.update_issue_field(entry.ticket.ticket_id, fields)
+    else:
+        jira.issue_add_comment(entry.ticket.ticket_id, entry.payload['comment'])
+
+
+def push_entry(entry_id):
+    """
+    Pushes a claimed entry to Jira, on failure it is retried with
+    exponential backoff until MAX_ATTEMPTS is reached.
+    """
+    entry = poker_models.JiraOutbox.objects.select_related('ticket').get(id=entry_id)
+    if entry.status != poker_models.JiraOutbox.SENDING:
+        return
+    message = {
+        'ticket': entry.ticket_id,
+        'action': entry.get_action_display().lower(),
+    }
+    try:
+        send_to_jira(entry)
+    except Exception as err:
+        entry.attempts += 1
+        entry.last_error = str(err)
+        if entry.attempts >= outbox_setting('MAX_ATTEMPTS'):
+            entry.status = poker_models.JiraOutbox.FAILED
+            entry.save()
+            notify_session(entry.ticket_id, {**message, 'type': 'jira_failed', 'error': entry.last_error})
+            return
+        backoff = min(
+            outbox_setting('BACKOFF_SECONDS') * 2 ** (entry.attempts - 1),
+            outbox_setting('MAX_BACKOFF_SECONDS'),
+        )
+        entry.status = poker_models.JiraOutbox.PENDING
+        entry.next_attempt_at = timezone.now() + timedelta(seconds=backoff)
+        entry.save()
+        return
+    entry.status = poker_models.JiraOutbox.SYNCED
+    entry.save()
+    notify_session(entry.ticket_id, {**message, 'type': 'jira_synced'})
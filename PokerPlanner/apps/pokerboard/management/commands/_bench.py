@@ -0,0 +1,236 @@
+"""
+Helpers shared by the benchmark management commands.
+"""
+import json
+import statistics
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from django.urls import path
+
+from apps.pokerboard import models as poker_models
+from apps.pokerboard import ordering
+from apps.pokerboard.consumers import SessionConsumer
+from apps.user import models as user_models
+
+IN_MEMORY_SESSION_SETTINGS = {
+    'CHANNEL_LAYERS': {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+            "CONFIG": {"capacity": 10000},
+        },
+    },
+    'POKERBOARD_PRESENCE': {
+        "BACKEND": "apps.pokerboard.presence.InMemoryPresenceStore",
+    },
+    'POKERBOARD_EVENT_LOG': {
+        "BACKEND": "apps.pokerboard.event_log.InMemoryEventLog",
+    },
+    'POKERBOARD_TIMER_LOCK': {
+        "BACKEND": "apps.pokerboard.timers.InMemoryTimerLock",
+    },
+    # Simulated clients send as fast as they can.
+    'POKERBOARD_RATE_LIMITS': {},
+}
+
+
+@contextmanager
+def benchmark_database(verbosity=0):
+    """
+    Runs the benchmark against a throwaway test database.
+    """
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity)
+
+
+def redis_session_settings(host):
+    """
+    Settings running sessions on a local Redis, host being "host:port".
+    """
+    hostname, _, port = host.partition(':')
+    hosts = [(hostname, int(port or 6379))]
+    return {
+        'CHANNEL_LAYERS': {
+            "default": {
+                "BACKEND": "channels_redis.core.RedisChannelLayer",
+                "CONFIG": {"hosts": hosts, "capacity": 10000},
+            },
+        },
+        'POKERBOARD_PRESENCE': {
+            "BACKEND": "apps.pokerboard.presence.RedisPresenceStore",
+            "CONFIG": {"hosts": hosts, "prefix": "bench-presence"},
+        },
+        'POKERBOARD_EVENT_LOG': {
+            "BACKEND": "apps.pokerboard.event_log.RedisEventLog",
+            "CONFIG": {"hosts": hosts, "prefix": "bench-events"},
+        },
+        'POKERBOARD_TIMER_LOCK': {
+            "BACKEND": "apps.pokerboard.timers.RedisTimerLock",
+            "CONFIG": {"hosts": hosts, "prefix": "bench-timer"},
+        },
+        'POKERBOARD_RATE_LIMITS': {},
+    }
+
+
+class QueryCounter:
+    """
+    Counts queries of every database connection, including the ones
+    opened by the session thread pool while counting.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+        self.wrapped = []
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def wrap(self, connection, **kwargs):
+        connection.execute_wrappers.append(self)
+        self.wrapped.append(connection)
+
+    def __enter__(self):
+        connection_created.connect(self.wrap)
+        for existing in connections.all():
+            self.wrap(existing)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self.wrap)
+        for wrapped in self.wrapped:
+            if self in wrapped.execute_wrappers:
+                wrapped.execute_wrappers.remove(self)
+        self.wrapped = []
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@contextmanager
+def in_memory_session_layer(**extra_settings):
+    """
+    Swaps channel layer, presence store, event log and timer lock for
+    in-process ones.
+    """
+    with override_settings(**IN_MEMORY_SESSION_SETTINGS, **extra_settings):
+        yield
+
+
+def create_board(participants, tickets=1, **board_kwargs):
+    """
+    Creates a pokerboard with its manager, participants and tickets.
+    Returns (manager, users, tickets).
+    """
+    suffix = int(time.time() * 1000000)
+    manager = user_models.User.objects.create(
+        email=f'manager{suffix}@bench.local', password='bench', first_name='Manager'
+    )
+    board_kwargs.setdefault('estimation_cards', [1, 2, 3, 5, 8, 13])
+    board_kwargs.setdefault('timer', 60)
+    pokerboard = poker_models.Pokerboard.objects.create(
+        manager=manager, title=f'bench{suffix % 10 ** 12}', **board_kwargs
+    )
+    users = user_models.User.objects.bulk_create([
+        user_models.User(email=f'user{index}.{suffix}@bench.local', first_name=f'User{index}')
+        for index in range(participants)
+    ])
+    poker_models.PokerboardUser.objects.bulk_create(
+        [poker_models.PokerboardUser(user=manager, pokerboard=pokerboard)] + [
+            poker_models.PokerboardUser(user=user, pokerboard=pokerboard) for user in users
+        ]
+    )
+    board_tickets = poker_models.Ticket.objects.bulk_create([
+        poker_models.Ticket(
+            pokerboard=pokerboard, ticket_id=f'BENCH-{suffix}-{index}',
+            order=(index + 1) * ordering.ORDER_GAP,
+            status=poker_models.Ticket.UNTOUCHED
+        )
+        for index in range(tickets)
+    ])
+    return manager, users, board_tickets
+
+
+def session_application():
+    return URLRouter([
+        path("ws/session/<int:id>", SessionConsumer.as_asgi()),
+    ])
+
+
+async def connect(application, user, ticket):
+    """
+    Opens a session socket, returns the communicator and connect latency.
+    """
+    communicator = WebsocketCommunicator(
+        application, f"ws/session/{ticket.id}?pid={ticket.pokerboard_id}"
+    )
+    communicator.scope['user'] = user
+    started = time.perf_counter()
+    connected, _ = await communicator.connect(timeout=30)
+    if not connected:
+        raise RuntimeError(f'User {user.id} could not join ticket {ticket.id}')
+    return communicator, time.perf_counter() - started
+
+
+async def drain(communicators, timeout=0.1):
+    """
+    Discards messages already sent to the sockets, like joins of
+    participants connecting after them.
+    """
+    for communicator in communicators:
+        while not await communicator.receive_nothing(timeout=timeout):
+            await communicator.receive_output()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(seconds):
+    """
+    Latency summary in milliseconds.
+    """
+    if not seconds:
+        return {'count': 0}
+    return {
+        'count': len(seconds),
+        'mean_ms': round(statistics.mean(seconds) * 1000, 3),
+        'p50_ms': round(percentile(seconds, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(seconds, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(seconds, 0.99) * 1000, 3),
+        'max_ms': round(max(seconds) * 1000, 3),
+    }
+
+
+def write_report(command, report, output=None):
+    """
+    Prints the report as JSON, and writes it to output if given.
+    """
+    data = json.dumps(report, indent=2, sort_keys=True)
+    if output:
+        with open(output, 'w') as report_file:
+            report_file.write(data + '\n')
+    command.stdout.write(data)
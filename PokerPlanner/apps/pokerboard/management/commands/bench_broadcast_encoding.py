@@ -0,0 +1,73 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.pokerboard import encoding
+from apps.pokerboard.management.commands import _bench
+
+
+def sample_vote():
+    return {
+        "type": "vote",
+        "vote": {
+            "estimate": 8,
+            "ticket_id": 1234,
+            "user": {
+                "id": 42,
+                "email": "player42@pokerplanner.local",
+                "first_name": "Player",
+                "last_name": "FortyTwo",
+            },
+        },
+    }
+
+
+def legacy(message, receivers):
+    # Every receiving consumer encodes the message itself.
+    for _ in range(receivers):
+        json.dumps(message)
+
+
+def encode_once(dumps):
+    def run(message, receivers):
+        # Receivers forward the encoded frame, which costs nothing here.
+        dumps(message)
+    return run
+
+
+class Command(BaseCommand):
+    """
+    Compares CPU cost of encoding one broadcast message for all receivers
+    of a session, per receiver versus once per group_send.
+    """
+    help = 'Benchmark per-message CPU cost of broadcast encoding strategies.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--receivers', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--messages', type=int, default=2000)
+        parser.add_argument('--output', help='Write JSON report to this file.')
+
+    def handle(self, *args, **options):
+        strategies = {
+            'legacy_json_per_receiver': legacy,
+            'json_once': encode_once(json.dumps),
+        }
+        if encoding.orjson is not None:
+            strategies['orjson_once'] = encode_once(encoding.orjson.dumps)
+        if encoding.msgpack is not None:
+            strategies['msgpack_once'] = encode_once(encoding.pack)
+
+        message = sample_vote()
+        report = {'messages': options['messages'], 'results': {}}
+        for receivers in options['receivers']:
+            results = report['results'][str(receivers)] = {}
+            for name, strategy in strategies.items():
+                started = time.process_time()
+                for _ in range(options['messages']):
+                    strategy(message, receivers)
+                elapsed = time.process_time() - started
+                results[name] = {
+                    'cpu_us_per_message': round(elapsed / options['messages'] * 1000000, 3),
+                }
+        _bench.write_report(self, report, options['output'])
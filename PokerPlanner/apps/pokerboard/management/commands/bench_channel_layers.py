@@ -0,0 +1,136 @@
+import asyncio
+import time
+from collections import Counter
+
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer
+from channels_redis.core import RedisChannelLayer
+from channels_redis.utils import _consistent_hash
+from django.core.management.base import BaseCommand
+
+from apps.pokerboard import encoding
+from apps.pokerboard.management.commands import _bench
+from PokerPlanner.channel_layers import (
+    HashRing, ShardedRedisChannelLayer, ShardedRedisPubSubChannelLayer, node_name
+)
+
+# Layers compared on Redis, the first one is what CHANNEL_LAYERS used to be
+REDIS_LAYERS = {
+    'default': RedisChannelLayer,
+    'sharded': ShardedRedisChannelLayer,
+    'sharded_pubsub': ShardedRedisPubSubChannelLayer,
+}
+
+
+def modulo_placement(nodes):
+    # What RedisChannelLayer does with several hosts.
+    return lambda group: _consistent_hash(group, len(nodes))
+
+
+def ring_placement(nodes):
+    return HashRing(nodes).get
+
+
+class Command(BaseCommand):
+    """
+    Compares channel layers spreading session groups over several Redis
+    hosts: placement of groups on hosts and group fan-out latency.
+
+    Fan-out runs on the given Redis hosts, or on the in-memory layer as a
+    stand-in when there are none.
+    """
+    help = 'Benchmark group placement and fan-out of sharded channel layers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--redis', metavar='HOST:PORT', nargs='+', default=[],
+                            help='Redis hosts to shard over, e.g. several local processes.')
+        parser.add_argument('--shards', type=int, default=4,
+                            help='Hosts used for placement when --redis is not given.')
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--members', type=int, default=20,
+                            help='Channels in each group.')
+        parser.add_argument('--messages', type=int, default=50,
+                            help='Messages sent to every group.')
+        parser.add_argument('--placement-groups', type=int, default=10000)
+        parser.add_argument('--output', help='Write JSON report to this file.')
+
+    def handle(self, *args, **options):
+        hosts = [
+            f'redis://{host}' if '://' not in host else host for host in options['redis']
+        ]
+        nodes = [node_name(host) for host in hosts] or [
+            f'redis://shard-{index}' for index in range(options['shards'])
+        ]
+        report = {
+            'benchmark': 'channel_layers',
+            'commit': _bench.current_commit(),
+            'hosts': len(nodes),
+            'groups': options['groups'],
+            'members': options['members'],
+            'messages': options['messages'],
+            'placement': {
+                'modulo': self.placement(modulo_placement, nodes, options['placement_groups']),
+                'ring': self.placement(ring_placement, nodes, options['placement_groups']),
+            },
+            'fanout': {},
+        }
+        if hosts:
+            layers = {
+                name: lambda layer_class=layer_class: layer_class(hosts=hosts, capacity=10000)
+                for name, layer_class in REDIS_LAYERS.items()
+            }
+        else:
+            layers = {'in_memory': lambda: InMemoryChannelLayer(capacity=10000)}
+        for name, make_layer in layers.items():
+            report['fanout'][name] = async_to_sync(self.fanout)(make_layer(), options)
+        _bench.write_report(self, report, options['output'])
+
+    def placement(self, placement, nodes, groups):
+        """
+        Share of groups on the busiest and quietest host, and share of
+        groups changing host when one host is added.
+        """
+        names = [f'session_{index}' for index in range(groups)]
+        before = placement(nodes)
+        after = placement(nodes + ['redis://added-shard'])
+        load = Counter(before(name) for name in names)
+        return {
+            'max_share': round(max(load.values()) / groups, 4),
+            'min_share': round(min(load[index] for index in range(len(nodes))) / groups, 4),
+            'moved_on_add': round(sum(before(name) != after(name) for name in names) / groups, 4),
+        }
+
+    async def fanout(self, layer, options):
+        groups = [f'bench_session_{index}' for index in range(options['groups'])]
+        channels = {}
+        for group in groups:
+            channels[group] = [await layer.new_channel() for _ in range(options['members'])]
+            for channel in channels[group]:
+                await layer.group_add(group, channel)
+        receivers = [channel for members in channels.values() for channel in members]
+        message = encoding.broadcast_event({'type': 'vote', 'vote': {'estimate': 8}})
+
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(options['messages']):
+            sent = time.perf_counter()
+            await asyncio.gather(
+                *[layer.group_send(group, message) for group in groups],
+                *[layer.receive(channel) for channel in receivers],
+            )
+            latencies.append(time.perf_counter() - sent)
+        elapsed = time.perf_counter() - started
+
+        for group, members in channels.items():
+            for channel in members:
+                await layer.group_discard(group, channel)
+        await layer.flush()
+        if hasattr(layer, 'close_pools'):
+            await layer.close_pools()
+        delivered = len(receivers) * options['messages']
+        return {
+            'round': _bench.summarize(latencies),
+            'seconds': round(elapsed, 3),
+            'messages_delivered': delivered,
+            'messages_per_second': round(delivered / elapsed, 1),
+        }
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import random
+import time
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from apps.pokerboard.management.commands import _bench
+
+# Metrics compared with --compare, lower is better for all of them
+COMPARED_METRICS = [
+    ('connect', 'p95_ms'),
+    ('initialise_game', 'p95_ms'),
+    ('fanout', 'p50_ms'),
+    ('fanout', 'p95_ms'),
+    ('fanout', 'p99_ms'),
+    ('db_queries_per_message',),
+]
+
+
+class Command(BaseCommand):
+    """
+    Load test of SessionConsumer: simulated participants run scripted
+    session traffic on several tickets at once.
+    """
+    help = 'Benchmark session consumer latency, throughput and database queries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--participants', type=int, default=20,
+                            help='Simulated participants per ticket, manager included.')
+        parser.add_argument('--tickets', type=int, default=5)
+        parser.add_argument('--rounds', type=int, default=3,
+                            help='Votes placed by each participant on each ticket.')
+        parser.add_argument('--redis', metavar='HOST:PORT',
+                            help='Run channel layer and session stores on this Redis.')
+        parser.add_argument('--output', help='Write JSON report to this file.')
+        parser.add_argument('--compare', metavar='REPORT',
+                            help='JSON report of an earlier run to compare with.')
+
+    def handle(self, *args, **options):
+        if options['redis']:
+            session_settings = _bench.redis_session_settings(options['redis'])
+        else:
+            session_settings = _bench.IN_MEMORY_SESSION_SETTINGS
+        with _bench.benchmark_database(), override_settings(**session_settings):
+            boards = [
+                _bench.create_board(options['participants'] - 1, timer=3600)
+                for _ in range(options['tickets'])
+            ]
+            report = async_to_sync(self.run)(boards, options)
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                report['comparison'] = self.compare(json.load(baseline), report)
+        _bench.write_report(self, report, options['output'])
+
+    async def run(self, boards, options):
+        self.latencies = {'connect': [], 'initialise_game': []}
+        self.fanout = {}
+        self.delivered = 0
+        self.sent = 0
+        application = _bench.session_application()
+
+        sessions = []
+        for manager, users, tickets in boards:
+            communicators = []
+            for user in [manager] + users:
+                communicator, latency = await _bench.connect(application, user, tickets[0])
+                self.latencies['connect'].append(latency)
+                communicators.append(communicator)
+            sessions.append(communicators)
+        await _bench.drain([communicator for session in sessions for communicator in session])
+
+        with _bench.QueryCounter() as queries:
+            started = time.perf_counter()
+            await asyncio.gather(*[
+                self.play(session, skip=index % 2 == 1, rounds=options['rounds'])
+                for index, session in enumerate(sessions)
+            ])
+            elapsed = time.perf_counter() - started
+            for session in sessions:
+                for communicator in session:
+                    await communicator.disconnect()
+
+        fanout = [latency for latencies in self.fanout.values() for latency in latencies]
+        return {
+            'benchmark': 'session',
+            'commit': _bench.current_commit(),
+            'backend': 'redis' if options['redis'] else 'in_memory',
+            'participants': options['participants'],
+            'tickets': options['tickets'],
+            'rounds': options['rounds'],
+            'connect': _bench.summarize(self.latencies['connect']),
+            'initialise_game': _bench.summarize(self.latencies['initialise_game']),
+            'fanout': _bench.summarize(fanout),
+            'fanout_by_type': {
+                message_type: _bench.summarize(latencies)
+                for message_type, latencies in self.fanout.items()
+            },
+            'seconds': round(elapsed, 3),
+            'messages_sent': self.sent,
+            'messages_delivered': self.delivered,
+            'messages_per_second': round(self.delivered / elapsed, 1),
+            'db_queries': queries.count,
+            'db_queries_per_message': round(queries.count / self.sent, 3),
+        }
+
+    async def play(self, communicators, skip, rounds):
+        """
+        Scripted session of one ticket, communicators[0] is the manager.
+        """
+        manager = communicators[0]
+        for communicator in communicators:
+            started = time.perf_counter()
+            await self.send(communicator, 'initialise_game')
+            await self.receive(communicator)
+            self.delivered += 1
+            self.latencies['initialise_game'].append(time.perf_counter() - started)
+
+        await self.broadcast(communicators, manager, 'start_timer')
+        for _ in range(rounds):
+            for communicator in communicators:
+                await self.broadcast(
+                    communicators, communicator, 'vote',
+                    {'estimate': random.choice([1, 2, 3, 5, 8, 13])}
+                )
+        if skip:
+            await self.broadcast(communicators, manager, 'skip')
+        else:
+            await self.broadcast(communicators, manager, 'estimate', {'estimate': 8})
+
+    async def send(self, communicator, message_type, message=None):
+        self.sent += 1
+        await communicator.send_json_to({'message_type': message_type, 'message': message or {}})
+
+    async def receive(self, communicator):
+        """
+        Next message of a participant, answering the server's pings like
+        clients do.
+        """
+        while True:
+            response = await communicator.receive_json_from(timeout=30)
+            if response['type'] != 'ping':
+                return response
+            await communicator.send_json_to({'message_type': 'pong', 'message': {}})
+
+    async def broadcast(self, communicators, sender, message_type, message=None):
+        """
+        Sends a message, records the time until every participant got it.
+        """
+        started = time.perf_counter()
+        await self.send(sender, message_type, message)
+        for communicator in communicators:
+            response = await self.receive(communicator)
+            if response['type'] != message_type:
+                raise RuntimeError(f'Expected {message_type}, got {response}')
+        self.delivered += len(communicators)
+        self.fanout.setdefault(message_type, []).append(time.perf_counter() - started)
+
+    def compare(self, baseline, report):
+        """
+        Relative change of each compared metric, positive is a regression.
+        """
+        comparison = {'baseline_commit': baseline.get('commit')}
+        for path in COMPARED_METRICS:
+            before, after = baseline, report
+            for key in path:
+                before, after = (before or {}).get(key), (after or {}).get(key)
+            name = '.'.join(path)
+            if before and after is not None:
+                comparison[name] = {
+                    'before': before,
+                    'after': after,
+                    'change_percent': round((after - before) / before * 100, 1),
+                }
+        return comparison
@@ -0,0 +1,98 @@
+import time
+from unittest.mock import patch
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.pokerboard import models as poker_models
+from apps.pokerboard import ordering
+from apps.pokerboard import serializer as poker_serializers
+from apps.pokerboard.management.commands import _bench
+from apps.user import models as user_models
+
+
+def issues(prefix, count):
+    return [{'key': f'{prefix}-{index}', 'fields': {'customfield_10016': 3}} for index in range(count)]
+
+
+def legacy(manager, title, jira_issues):
+    # One existence query per issue, then one get_or_create per ticket.
+    responses = []
+    for issue in jira_issues:
+        taken = poker_models.Ticket.objects.filter(ticket_id=issue['key']).exists()
+        responses.append({'key': issue['key'], 'status_code': 400 if taken else 200})
+    pokerboard = poker_models.Pokerboard.objects.create(manager=manager, title=title)
+    count = 0
+    for response in responses:
+        if response['status_code'] != 200:
+            continue
+        count += 1
+        poker_models.Ticket.objects.get_or_create(
+            ticket_id=response['key'],
+            defaults={'pokerboard': pokerboard, 'order': count * ordering.ORDER_GAP},
+        )
+    poker_models.PokerboardUser.objects.create(user=manager, pokerboard=pokerboard, role=2)
+
+
+def set_based(manager, title, jira_issues):
+    serializer = poker_serializers.PokerBoardCreationSerializer(
+        data={'title': title, 'tickets': [issue['key'] for issue in jira_issues]},
+        context={'manager_id': manager.id},
+    )
+    with patch.object(poker_serializers, 'Jira') as jira:
+        jira.return_value.jql.return_value = {'issues': jira_issues}
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+
+class Command(BaseCommand):
+    """
+    Compares importing Jira issues into a new pokerboard one ticket at a
+    time with the set-based import, on a throwaway database. A tenth of
+    the issues are already on another board.
+    """
+    help = 'Benchmark round trips and latency of the pokerboard ticket import.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--issues', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', help='Write JSON report to this file.')
+
+    def handle(self, *args, **options):
+        with _bench.benchmark_database():
+            report = {
+                'benchmark': 'ticket_import',
+                'commit': _bench.current_commit(),
+                'repeat': options['repeat'],
+                'results': {},
+            }
+            manager = user_models.User.objects.create(
+                email='manager@bench.local', password='bench', first_name='Manager'
+            )
+            poker_models.ManagerCredentials.objects.create(
+                user=manager, url='http://jira.local', username='bench', password='bench'
+            )
+            strategies = {'legacy_per_issue': legacy, 'set_based': set_based}
+            for count in options['issues']:
+                results = report['results'][str(count)] = {}
+                for name, strategy in strategies.items():
+                    results[name] = self.run(manager, name, strategy, count, options['repeat'])
+        _bench.write_report(self, report, options['output'])
+
+    def run(self, manager, name, strategy, count, repeat):
+        latencies = []
+        queries = 0
+        for run in range(repeat):
+            prefix = f'{name[:3].upper()}{count}R{run}'
+            jira_issues = issues(prefix, count)
+            existing = poker_models.Pokerboard.objects.create(manager=manager, title=f'{prefix}-old')
+            poker_models.Ticket.objects.bulk_create([
+                poker_models.Ticket(pokerboard=existing, ticket_id=issue['key'], order=index)
+                for index, issue in enumerate(jira_issues[::10])
+            ])
+            with _bench.QueryCounter() as counter, transaction.atomic():
+                started = time.perf_counter()
+                strategy(manager, f'{prefix}-new', jira_issues)
+                latencies.append(time.perf_counter() - started)
+            queries = counter.count
+        return {'queries': queries, 'seconds': _bench.summarize(latencies)}
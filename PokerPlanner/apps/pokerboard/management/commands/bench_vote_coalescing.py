@@ -0,0 +1,103 @@
+import asyncio
+import random
+import time
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+
+from apps.pokerboard.management.commands import _bench
+from libs import metrics
+
+# Last vote of every participant, earlier ones use the other cards
+FINAL_ESTIMATE = 13
+
+
+class Command(BaseCommand):
+    """
+    Measures vote broadcast volume, throughput and latency of a session
+    for several coalesce windows.
+    """
+    help = 'Benchmark vote coalescing windows of a session.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--participants', type=int, default=50)
+        parser.add_argument('--votes', type=int, default=5,
+                            help='Votes placed by each participant.')
+        parser.add_argument('--windows', type=int, nargs='+', default=[0, 50, 100],
+                            help='Coalesce windows to compare, in milliseconds.')
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--output', help='Write JSON report to this file.')
+
+    def handle(self, *args, **options):
+        report = {
+            'benchmark': 'vote_coalescing',
+            'participants': options['participants'],
+            'votes_per_participant': options['votes'],
+            'batch_size': options['batch_size'],
+            'windows': {},
+        }
+        with _bench.benchmark_database(), _bench.in_memory_session_layer():
+            for window in options['windows']:
+                manager, users, tickets = _bench.create_board(
+                    options['participants'], vote_coalesce_window=window,
+                    vote_batch_size=options['batch_size']
+                )
+                metrics.reset()
+                report['windows'][str(window)] = async_to_sync(self.run)(users, tickets[0], options)
+        _bench.write_report(self, report, options['output'])
+
+    async def run(self, users, ticket, options):
+        application = _bench.session_application()
+        communicators = [
+            (await _bench.connect(application, user, ticket))[0] for user in users
+        ]
+        await _bench.drain(communicators)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            self.place_votes(communicator, options['votes']) for communicator in communicators
+        ])
+        received = await asyncio.gather(*[
+            self.wait_for_final_votes(communicator, len(users)) for communicator in communicators
+        ])
+        elapsed = time.perf_counter() - started
+
+        for communicator in communicators:
+            await communicator.disconnect()
+        total_votes = len(users) * options['votes']
+        stats = metrics.snapshot()
+        return {
+            'votes': total_votes,
+            'broadcasts': stats['counters'].get('session.vote_broadcasts', 0),
+            'messages_delivered': sum(received),
+            'seconds': round(elapsed, 3),
+            'votes_per_second': round(total_votes / elapsed, 1),
+            'batch_size': stats['observations'].get('session.vote_batch_size', {'count': 0}),
+            'broadcast_delay_ms': stats['observations'].get(
+                'session.vote_broadcast_delay_ms', {'count': 0}
+            ),
+        }
+
+    async def place_votes(self, communicator, votes):
+        for index in range(votes):
+            estimate = FINAL_ESTIMATE if index == votes - 1 else random.choice([1, 2, 3, 5, 8])
+            await communicator.send_json_to({
+                "message_type": "vote",
+                "message": {"estimate": estimate},
+            })
+
+    async def wait_for_final_votes(self, communicator, participants):
+        """
+        Receives until the final vote of every participant was seen,
+        returns the number of messages it took.
+        """
+        final = set()
+        messages = 0
+        while len(final) < participants:
+            message = await communicator.receive_json_from(timeout=30)
+            messages += 1
+            votes = message.get("votes") or [message.get("vote")]
+            for vote in votes:
+                if vote and vote["estimate"] == FINAL_ESTIMATE:
+                    final.add(vote["user"]["id"])
+        return messages
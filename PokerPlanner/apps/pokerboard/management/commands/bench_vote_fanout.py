@@ -0,0 +1,96 @@
+import asyncio
+import random
+import time
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from apps.pokerboard import session_queries
+from apps.pokerboard.management.commands import _bench
+
+
+@session_queries.session_database_sync_to_async
+def slow_query(seconds):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_sleep(%s)', [seconds])
+
+
+class Command(BaseCommand):
+    """
+    Measures vote fan-out latency of a session with and without slow
+    queries running in parallel on the same worker.
+    """
+    help = 'Benchmark vote fan-out latency while slow database queries run in parallel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--participants', type=int, default=20)
+        parser.add_argument('--votes', type=int, default=50)
+        parser.add_argument('--slow-queries', type=int, default=4,
+                            help='Number of concurrent slow queries in the loaded phase.')
+        parser.add_argument('--slow-query-seconds', type=float, default=0.5)
+        parser.add_argument('--threads', type=int, default=None,
+                            help='Overrides POKERBOARD_DB_THREADS.')
+        parser.add_argument('--output', help='Write JSON report to this file.')
+
+    def handle(self, *args, **options):
+        extra_settings = {}
+        if options['threads']:
+            extra_settings['POKERBOARD_DB_THREADS'] = options['threads']
+        with _bench.benchmark_database(), _bench.in_memory_session_layer(**extra_settings):
+            manager, users, tickets = _bench.create_board(options['participants'])
+            report = async_to_sync(self.run)(users, tickets[0], options)
+        _bench.write_report(self, report, options['output'])
+
+    async def run(self, users, ticket, options):
+        application = _bench.session_application()
+        communicators = [
+            (await _bench.connect(application, user, ticket))[0] for user in users
+        ]
+        await _bench.drain(communicators)
+        idle = await self.measure_votes(communicators, options['votes'])
+
+        stop = asyncio.Event()
+
+        async def keep_slow_query_running():
+            while not stop.is_set():
+                await slow_query(options['slow_query_seconds'])
+
+        background = [
+            asyncio.ensure_future(keep_slow_query_running())
+            for _ in range(options['slow_queries'])
+        ]
+        await asyncio.sleep(0.05)
+        loaded = await self.measure_votes(communicators, options['votes'])
+        stop.set()
+        await asyncio.gather(*background)
+
+        for communicator in communicators:
+            await communicator.disconnect()
+        return {
+            'benchmark': 'vote_fanout',
+            'participants': len(communicators),
+            'slow_queries': options['slow_queries'],
+            'slow_query_seconds': options['slow_query_seconds'],
+            'db_threads': session_queries.get_executor()._max_workers,
+            'idle': _bench.summarize(idle),
+            'loaded': _bench.summarize(loaded),
+        }
+
+    async def measure_votes(self, communicators, votes):
+        """
+        Sends votes one by one, returns time until every participant
+        received each of them.
+        """
+        latencies = []
+        for _ in range(votes):
+            sender = random.choice(communicators)
+            started = time.perf_counter()
+            await sender.send_json_to({
+                "message_type": "vote",
+                "message": {"estimate": random.choice([1, 2, 3, 5, 8, 13])},
+            })
+            for communicator in communicators:
+                await communicator.receive_json_from(timeout=30)
+            latencies.append(time.perf_counter() - started)
+        return latencies
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.pokerboard import query_plans
+
+
+class Command(BaseCommand):
+    """
+    Explains the hot lookups of the soft deletion models on the current
+    database and fails if one of them scans a whole table.
+    """
+    help = 'Check the query plans of hot lookups for sequential scans.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan.')
+
+    def handle(self, *args, **options):
+        sample = query_plans.sample_ids()
+        if sample is None:
+            raise CommandError('No pokerboard member with tickets to explain lookups for.')
+        failed = []
+        for name, result in query_plans.check(sample).items():
+            if result['sequential_scans']:
+                failed.append(name)
+                self.stdout.write(self.style.ERROR(f'{name}: {"; ".join(result["sequential_scans"])}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: ok'))
+            if options['verbose_plans']:
+                self.stdout.write(result['plan'])
+        if failed:
+            raise CommandError(f'Sequential scans in {", ".join(failed)}')
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokerboard', '0009_auto_20211108_1435'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ticket',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'Untouched'), (2, 'Ongoing'), (3, 'Estimated'), (4, 'Skipped')], default=2, help_text='Status of ticket'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:48
+
+from django.conf import settings
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('pokerboard', '0010_alter_ticket_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JiraOutbox',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('action', models.PositiveSmallIntegerField(choices=[(1, 'Estimate'), (2, 'Comment')], help_text='Jira operation')),
+                ('payload', django.contrib.postgres.fields.jsonb.JSONField(help_text='Data sent to Jira')),
+                ('host', models.CharField(help_text='Jira host, used to limit concurrent requests', max_length=255)),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'Pending'), (2, 'Sending'), (3, 'Synced'), (4, 'Failed'), (5, 'Superseded')], default=1)),
+                ('attempts', models.PositiveSmallIntegerField(default=0, help_text='Number of failed attempts')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Earliest time of next attempt')),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('manager', models.ForeignKey(help_text='User whose Jira credentials are used', on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('ticket', models.ForeignKey(help_text='Ticket to update on Jira', on_delete=django.db.models.deletion.CASCADE, related_name='jira_outbox', to='pokerboard.Ticket')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='jiraoutbox',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='pokerboard__status_2d8142_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokerboard', '0010_jiraoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pokerboard',
+            name='vote_batch_size',
+            field=models.PositiveIntegerField(default=50, help_text='Maximum number of votes merged into one broadcast'),
+        ),
+        migrations.AddField(
+            model_name='pokerboard',
+            name='vote_coalesce_window',
+            field=models.PositiveIntegerField(default=0, help_text='Milliseconds during which votes are merged into one broadcast, 0 sends every vote at once'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.28 on 2026-10-18 11:21
+
+from django.db import migrations, models
+
+# TICKET_ORDER_GAP when this migration was written
+ORDER_GAP = 1024
+
+
+def space_ticket_orders(apps, schema_editor):
+    """
+    Spaces order keys of existing tickets, keeping their order.
+    """
+    Ticket = apps.get_model('pokerboard', 'Ticket')
+    pokerboard_ids = Ticket.objects.values_list('pokerboard_id', flat=True).distinct()
+    for pokerboard_id in pokerboard_ids:
+        tickets = list(Ticket.objects.filter(pokerboard_id=pokerboard_id).order_by('order', 'id'))
+        for index, ticket in enumerate(tickets, start=1):
+            ticket.order = index * ORDER_GAP
+        Ticket.objects.bulk_update(tickets, ['order'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokerboard', '0011_pokerboard_vote_coalescing'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['pokerboard', 'order'], name='ticket_pokerboard_order_idx'),
+        ),
+        migrations.RunPython(space_ticket_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.28 on 2026-10-18 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokerboard', '0012_ticket_order_gaps'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invite',
+            index=models.Index(fields=['user', 'status', 'created_at', 'id'], name='invite_user_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invite',
+            index=models.Index(fields=['pokerboard', 'created_at', 'id'], name='invite_board_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pokerboard',
+            index=models.Index(fields=['created_at', 'id'], name='pokerboard_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pokerboarduser',
+            index=models.Index(fields=['pokerboard', 'created_at', 'id'], name='member_board_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userticketestimate',
+            index=models.Index(fields=['created_at', 'id'], name='estimate_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userticketestimate',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='estimate_user_created_idx'),
+        ),
+    ]
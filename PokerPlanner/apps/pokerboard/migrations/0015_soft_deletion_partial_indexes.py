@@ -0,0 +1,37 @@
+# Generated by Django 2.2.28 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokerboard', '0014_list_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ticket',
+            name='ticket_pokerboard_order_idx',
+        ),
+        migrations.AddIndex(
+            model_name='invite',
+            index=models.Index(fields=['pokerboard', 'user'], name='invite_board_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pokerboarduser',
+            index=models.Index(condition=models.Q(deleted_at=None), fields=['user', 'pokerboard'], name='member_alive_user_board_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(condition=models.Q(deleted_at=None), fields=['pokerboard', 'order'], name='ticket_pokerboard_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(condition=models.Q(deleted_at=None), fields=['ticket_id'], name='ticket_alive_ticket_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userticketestimate',
+            index=models.Index(condition=models.Q(deleted_at=None), fields=['ticket_id'], name='estimate_alive_ticket_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.28 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokerboard', '0015_soft_deletion_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ticket',
+            name='ticket_alive_ticket_id_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='ticket',
+            constraint=models.UniqueConstraint(condition=models.Q(deleted_at=None), fields=('ticket_id',), name='ticket_alive_ticket_id_uniq'),
+        ),
+    ]
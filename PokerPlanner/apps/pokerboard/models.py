@@ -1,9 +1,13 @@
 from django.conf import settings
-from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.fields import ArrayField, JSONField
 from django.db import models
 from django.db.models.deletion import CASCADE
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
 
 from apps.group import models as group_models
+from apps.pokerboard import response_cache
 from apps.user import models as user_models
 from libs import models as util_models
 
@@ -38,6 +42,17 @@ class Pokerboard(util_models.CommonInfo, util_models.SoftDeletionModel):
         models.PositiveIntegerField(), help_text="Array of estimation values choosed by user",
         null=True
     )
+    vote_coalesce_window = models.PositiveIntegerField(
+        default=0, help_text="Milliseconds during which votes are merged into one broadcast, 0 sends every vote at once"
+    )
+    vote_batch_size = models.PositiveIntegerField(
+        default=50, help_text="Maximum number of votes merged into one broadcast"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='pokerboard_created_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -70,6 +85,13 @@ class Invite(util_models.CommonInfo):
         help_text="Indicates if invitation accepted or not",choices=STATUS_CHOICES, default=PENDING
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status', 'created_at', 'id'], name='invite_user_status_created_idx'),
+            models.Index(fields=['pokerboard', 'created_at', 'id'], name='invite_board_created_idx'),
+            models.Index(fields=['pokerboard', 'user'], name='invite_board_user_idx'),
+        ]
+
     def __str__(self):
         return f'Pokerboard: {self.pokerboard} - Group: {self.group} - User: {self.user}'
 
@@ -99,6 +121,19 @@ class Ticket(util_models.CommonInfo, util_models.SoftDeletionModel):
     start_datetime = models.DateTimeField(null=True, blank=True)
     end_datetime = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['pokerboard', 'order'], name='ticket_pokerboard_order_idx', condition=util_models.ALIVE
+            ),
+        ]
+        constraints = [
+            # A Jira issue is on one pokerboard at a time
+            models.UniqueConstraint(
+                fields=['ticket_id'], name='ticket_alive_ticket_id_uniq', condition=util_models.ALIVE
+            ),
+        ]
+
     def __str__(self):
         return f'{self.ticket_id} - {self.pokerboard}'
 
@@ -118,6 +153,11 @@ class UserTicketEstimate(util_models.CommonInfo, util_models.SoftDeletionModel):
 
     class Meta:
         unique_together = ('user', 'ticket_id')
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='estimate_created_idx'),
+            models.Index(fields=['user', 'created_at', 'id'], name='estimate_user_created_idx'),
+            models.Index(fields=['ticket_id'], name='estimate_alive_ticket_idx', condition=util_models.ALIVE),
+        ]
 
     def __str__(self):
         return f'User {self.user} - Estimated {self.estimate}'
@@ -139,7 +179,15 @@ class PokerboardUser(util_models.CommonInfo, util_models.SoftDeletionModel):
     pokerboard = models.ForeignKey(Pokerboard, help_text="Pokerboards Associated", on_delete=models.CASCADE)
     role = models.PositiveSmallIntegerField(choices=ROLE, help_text="Role", default=CONTRIBUTOR)
     group = models.ForeignKey(group_models.Group, help_text="Groups Associated", null=True, on_delete=models.CASCADE, blank=True)
-    
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['pokerboard', 'created_at', 'id'], name='member_board_created_idx'),
+            models.Index(
+                fields=['user', 'pokerboard'], name='member_alive_user_board_idx', condition=util_models.ALIVE
+            ),
+        ]
+
     def __str__(self):
         return f'User: {self.user} Role: {self.role} Board: {self.pokerboard}'
 
@@ -155,3 +203,79 @@ class ManagerCredentials(util_models.CommonInfo, util_models.SoftDeletionModel):
 
     def __str__(self):
         return f'Manager: {self.user}'
+
+
+class JiraOutbox(util_models.CommonInfo):
+    """
+    Write to Jira waiting to be pushed by the outbox celery task.
+    """
+    ESTIMATE = 1
+    COMMENT = 2
+    ACTION_CHOICES = (
+        (ESTIMATE, "Estimate"),
+        (COMMENT, "Comment"),
+    )
+    PENDING = 1
+    SENDING = 2
+    SYNCED = 3
+    FAILED = 4
+    SUPERSEDED = 5
+    STATUS_CHOICES = (
+        (PENDING, "Pending"),
+        (SENDING, "Sending"),
+        (SYNCED, "Synced"),
+        (FAILED, "Failed"),
+        (SUPERSEDED, "Superseded"),
+    )
+
+    manager = models.ForeignKey(
+        settings.AUTH_USER_MODEL, help_text="User whose Jira credentials are used", on_delete=models.CASCADE
+    )
+    ticket = models.ForeignKey(
+        Ticket, help_text="Ticket to update on Jira", related_name="jira_outbox", on_delete=models.CASCADE
+    )
+    action = models.PositiveSmallIntegerField(choices=ACTION_CHOICES, help_text="Jira operation")
+    payload = JSONField(help_text="Data sent to Jira")
+    host = models.CharField(max_length=255, help_text="Jira host, used to limit concurrent requests")
+    status = models.PositiveSmallIntegerField(choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0, help_text="Number of failed attempts")
+    next_attempt_at = models.DateTimeField(default=timezone.now, help_text="Earliest time of next attempt")
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.get_action_display()} {self.ticket} - {self.get_status_display()}'
+
+
+@receiver([post_save, post_delete], sender=Pokerboard)
+def bump_pokerboard(sender, instance, **kwargs):
+    response_cache.bump_on_commit(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Ticket)
+@receiver([post_save, post_delete], sender=PokerboardUser)
+@receiver([post_save, post_delete], sender=Invite)
+def bump_board_of(sender, instance, **kwargs):
+    """
+    Cached responses of a pokerboard hold its tickets and members.
+    """
+    response_cache.bump_on_commit(instance.pokerboard_id)
+
+
+@receiver(post_save, sender=user_models.User)
+def bump_boards_of_user(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Cached responses of a pokerboard embed its manager, members and
+    invitees, saving one of them bumps every board they are part of.
+    """
+    if created or (update_fields is not None and set(update_fields) <= {'last_login', 'updated_at'}):
+        return
+    board_ids = Pokerboard.objects.filter(manager=instance).values_list('id', flat=True).union(
+        PokerboardUser.objects.filter(user=instance).values_list('pokerboard_id', flat=True),
+        Invite.objects.filter(user=instance).values_list('pokerboard_id', flat=True),
+    )
+    response_cache.bump_on_commit(*board_ids)
@@ -0,0 +1,122 @@
+"""
+Order keys of the tickets of a pokerboard.
+
+Tickets are spaced ORDER_GAP apart, so moving a ticket only updates its
+own row: to the end after the last ticket, or between two neighbours at
+the middle of their gap. Once a gap is used up the pokerboard is
+renormalized in the background, a move into a gap that is still used up
+renormalizes it first.
+
+Writers of a pokerboard's order keys lock its row first, so two of them
+can't read the same neighbours and pick the same key.
+"""
+from django.db import transaction
+from django.db.models import Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.pokerboard import constants as pokerboard_constants
+from apps.pokerboard import models as poker_models
+from apps.pokerboard import response_cache
+
+ORDER_GAP = pokerboard_constants.TICKET_ORDER_GAP
+
+
+def spaced_orders(count, start=0):
+    """
+    Order keys of count tickets placed after the start key.
+    """
+    return [start + ORDER_GAP * index for index in range(1, count + 1)]
+
+
+def board_tickets(pokerboard_id):
+    return poker_models.Ticket.objects.filter(pokerboard=pokerboard_id)
+
+
+def lock_board(pokerboard_id):
+    """
+    Locks the pokerboard's row until the current transaction ends.
+    """
+    list(poker_models.Pokerboard.all_objects.select_for_update().filter(
+        id=pokerboard_id).values_list('id', flat=True))
+
+
+def end_order(pokerboard_id):
+    """
+    Expression of the order key after the last ticket of the pokerboard,
+    its subquery is an index lookup. The pokerboard must be locked.
+    """
+    last = board_tickets(pokerboard_id).order_by('-order').values('order')[:1]
+    return Coalesce(Subquery(last), Value(0)) + ORDER_GAP
+
+
+def neighbours(ticket, before=None, after=None):
+    """
+    Order keys of the tickets the ticket goes between: after the after
+    ticket, before the before ticket, or at the end. None stands for the
+    start or the end of the pokerboard.
+    """
+    others = board_tickets(ticket.pokerboard_id).exclude(id=ticket.id)
+    if after is not None:
+        following = others.filter(order__gt=after.order).order_by('order')
+        return after.order, following.values_list('order', flat=True).first()
+    if before is not None:
+        preceding = others.filter(order__lt=before.order).order_by('-order')
+        return preceding.values_list('order', flat=True).first(), before.order
+    return others.order_by('-order').values_list('order', flat=True).first(), None
+
+
+def move(ticket, before=None, after=None):
+    """
+    Moves the ticket right before or after another ticket of its
+    pokerboard, or to its end, updating only the ticket's row unless the
+    gap there is used up.
+    """
+    with transaction.atomic():
+        lock_board(ticket.pokerboard_id)
+        previous, following = neighbours(ticket, before, after)
+        if following is not None and following - (previous or 0) < 2:
+            renormalize(ticket.pokerboard_id)
+            for other in (before, after):
+                if other is not None:
+                    other.refresh_from_db(fields=['order'])
+            previous, following = neighbours(ticket, before, after)
+        previous = previous or 0
+        if following is None:
+            ticket.order = previous + ORDER_GAP
+        else:
+            ticket.order = (previous + following) // 2
+        poker_models.Ticket.objects.filter(id=ticket.id).update(order=ticket.order, updated_at=timezone.now())
+        response_cache.bump_on_commit(ticket.pokerboard_id)
+        if following is not None and min(ticket.order - previous, following - ticket.order) < 2:
+            schedule_renormalize(ticket.pokerboard_id)
+    return ticket
+
+
+def schedule_renormalize(pokerboard_id):
+    from apps.pokerboard import tasks
+
+    transaction.on_commit(lambda: tasks.renormalize_ticket_order.delay(pokerboard_id))
+
+
+def renormalize(pokerboard_id):
+    """
+    Spaces the pokerboard's tickets ORDER_GAP apart again, keeping their
+    order.
+    """
+    with transaction.atomic():
+        lock_board(pokerboard_id)
+        tickets = list(
+            board_tickets(pokerboard_id).select_for_update().order_by('order', 'id').only('id', 'order')
+        )
+        changed = []
+        now = timezone.now()
+        for ticket, order in zip(tickets, spaced_orders(len(tickets))):
+            if ticket.order != order:
+                ticket.order = order
+                ticket.updated_at = now
+                changed.append(ticket)
+        poker_models.Ticket.objects.bulk_update(changed, ['order', 'updated_at'])
+        if changed:
+            response_cache.bump_on_commit(pokerboard_id)
+    return len(changed)
@@ -0,0 +1,191 @@
+"""
+Bounded queue of the frames sent to a websocket connection.
+
+Frames are written by a task of their own, so the consumer keeps reading
+its channel while a client is slow and a stalled client only holds up its
+own frames, at most size of them.
+
+Writing a frame only hands it to the server, which buffers it until the
+socket drains. With a window, frames written are also bounded: the
+writer pings the client every window / 2 frames and, once window frames
+are not covered by a pong, waits for one before writing more. Clients
+answer pings in order, each pong acknowledges the frames written before
+its ping.
+"""
+import asyncio
+import logging
+from collections import deque
+
+from libs import metrics
+
+logger = logging.getLogger(__name__)
+
+DROP_VOTES = 'drop_votes'
+SNAPSHOT = 'snapshot'
+CLOSE = 'close'
+POLICIES = (DROP_VOTES, SNAPSHOT, CLOSE)
+
+# Stands for the frames collapsed into a snapshot of the session
+RESYNC = object()
+# Stands for a ping, written when its turn comes
+PING = object()
+
+
+class OutboundQueue:
+    """
+    Frames waiting to be written to a client, in order.
+
+    write(frame) sends a frame, snapshot() returns a frame holding the
+    whole session state (None if there is none) and close() closes the
+    connection asking the client to resync. ping is the frame of a ping,
+    ack() is called for every pong of the client.
+
+    Once size frames are waiting, the policy decides what happens to the
+    next one:
+    - drop_votes: vote frames whose voters all voted again later are
+      dropped, falling back to snapshot when there are none,
+    - snapshot: waiting frames are replaced by a snapshot of the session,
+      frames queued with keep (the ones a snapshot doesn't hold) are still
+      sent after it,
+    - close: the connection is closed.
+
+    With a window, at most window frames are written and not acknowledged
+    by a pong.
+    """
+
+    def __init__(self, write, snapshot, close, ping=None, size=100, policy=SNAPSHOT, window=None):
+        if policy not in POLICIES:
+            raise ValueError(f'Unknown outbound queue policy {policy}')
+        if window is not None and (ping is None or window < 1):
+            raise ValueError('Outbound queue window needs a ping frame and window >= 1')
+        self.write = write
+        self.snapshot = snapshot
+        self.close = close
+        self.ping_frame = ping
+        self.size = size
+        self.policy = policy
+        self.window = window
+        self.frames = deque()
+        self.ready = asyncio.Event()
+        self.acked = asyncio.Event()
+        # Frames written so far, and their count at each ping not answered
+        # yet, at the latest ping and at the last answered one
+        self.written = 0
+        self.pings = deque()
+        self.pinged = 0
+        self.acknowledged = 0
+        self.closed = False
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        self.closed = True
+        self.frames.clear()
+        if self.task is not None and self.task is not asyncio.current_task():
+            self.task.cancel()
+
+    async def put(self, frame, voters=None, keep=False):
+        """
+        Queues a frame, voters are the users whose votes it carries and
+        keep tells it is never collapsed into a snapshot.
+        """
+        if self.closed:
+            return
+        if len(self.frames) >= self.size and not (
+            self.policy == DROP_VOTES and self.drop_superseded(voters)
+        ):
+            kept = [item for item in self.frames if item[2]]
+            if self.policy == CLOSE or len(kept) >= self.size:
+                await self.resync_close()
+                return
+            metrics.incr('session.outbound_collapsed', len(self.frames) - len(kept) + (not keep))
+            self.frames = deque([(RESYNC, None, False), *kept])
+            if not keep:
+                self.ready.set()
+                return
+        self.frames.append((frame, voters, keep))
+        self.ready.set()
+
+    def ping(self):
+        """
+        Queues a ping, its pong acknowledges the frames written before it.
+        """
+        if not self.closed:
+            self.frames.append((PING, None, False))
+            self.ready.set()
+
+    def ack(self):
+        """
+        Records a pong of the client, answering its oldest unanswered ping.
+        """
+        if self.pings:
+            self.acknowledged = self.pings.popleft()
+            self.acked.set()
+
+    def drop_superseded(self, voters):
+        """
+        Drops waiting vote frames whose votes are all replaced by a later
+        frame, returns the number of frames dropped.
+        """
+        seen = set(voters or ())
+        kept = deque()
+        for frame, frame_voters, keep in reversed(self.frames):
+            if frame_voters and frame_voters <= seen:
+                continue
+            seen.update(frame_voters or ())
+            kept.appendleft((frame, frame_voters, keep))
+        dropped = len(self.frames) - len(kept)
+        self.frames = kept
+        metrics.incr('session.outbound_dropped', dropped)
+        return dropped
+
+    async def resync_close(self):
+        metrics.incr('session.outbound_closed')
+        self.stop()
+        await self.close()
+
+    async def write_ping(self):
+        await self.write(self.ping_frame)
+        self.pings.append(self.written)
+        self.pinged = self.written
+
+    async def wait_for_window(self):
+        """
+        Waits until less than window frames are not acknowledged, frames
+        queued meanwhile are left to the policy.
+        """
+        while self.written - self.acknowledged >= self.window:
+            self.acked.clear()
+            await self.acked.wait()
+
+    async def run(self):
+        try:
+            while True:
+                while not self.frames:
+                    self.ready.clear()
+                    await self.ready.wait()
+                if self.frames[0][0] is PING:
+                    self.frames.popleft()
+                    await self.write_ping()
+                    continue
+                if self.window:
+                    await self.wait_for_window()
+                    if not self.frames:
+                        continue
+                frame, _, _ = self.frames.popleft()
+                if frame is RESYNC:
+                    frame = await self.snapshot()
+                    if frame is None:
+                        await self.resync_close()
+                        return
+                await self.write(frame)
+                self.written += 1
+                if self.window and self.written - self.pinged >= max(1, self.window // 2):
+                    await self.write_ping()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception('Writing to websocket failed')
+            self.stop()
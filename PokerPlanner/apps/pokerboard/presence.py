@@ -0,0 +1,350 @@
+import logging
+import time
+
+from django.conf import settings
+from django.test.signals import setting_changed
+from django.utils.module_loading import import_string
+
+from apps.pokerboard import constants as pokerboard_constants
+from apps.pokerboard import event_log
+from libs import metrics, redis_pool
+
+logger = logging.getLogger(__name__)
+
+
+class BasePresenceStore:
+    """
+    Keeps track of users connected to a session group.
+
+    A user can hold several sockets to the same group (multiple tabs,
+    overlapping reconnects), so presence is refcounted per connection and
+    a user only disappears once their last connection leaves.
+    """
+
+    async def join(self, group, user_id, channel_name):
+        """
+        Registers a connection, returns True if user was not present before.
+        """
+        raise NotImplementedError
+
+    async def leave(self, group, user_id, channel_name):
+        """
+        Unregisters a connection, returns True if user is no longer present.
+        """
+        raise NotImplementedError
+
+    async def members(self, group):
+        """
+        Returns ids of users present in the group.
+        """
+        raise NotImplementedError
+
+    async def touch(self, group, channel_name):
+        """
+        Records the connection is still alive.
+        """
+        raise NotImplementedError
+
+    async def attach(self, group, channel_name, other_group):
+        """
+        Records the other group a connection is in (None for none), like
+        the session of a board connection's ticket, which it is discarded
+        from too when reaped.
+        """
+        raise NotImplementedError
+
+    async def reap(self, group, before):
+        """
+        Unregisters connections not seen since the before timestamp, like
+        the ones of a crashed worker. Returns a dict of their channel names
+        to the other group they were attached to (or None), and the ids of
+        users no longer present.
+        """
+        raise NotImplementedError
+
+    async def groups(self):
+        """
+        Returns the groups having connections.
+        """
+        raise NotImplementedError
+
+
+class InMemoryPresenceStore(BasePresenceStore):
+    """
+    Presence store living in the current process, only correct with a
+    single worker. Used for local development and tests.
+    """
+
+    def __init__(self, **kwargs):
+        self.users = {}
+        self.channels = {}
+        self.seen = {}
+        self.attached = {}
+
+    async def join(self, group, user_id, channel_name):
+        channels = self.channels.setdefault(group, {})
+        users = self.users.setdefault(group, {})
+        if channel_name in channels:
+            return False
+        channels[channel_name] = user_id
+        self.seen.setdefault(group, {})[channel_name] = time.time()
+        users[user_id] = users.get(user_id, 0) + 1
+        return users[user_id] == 1
+
+    async def leave(self, group, user_id, channel_name):
+        channels = self.channels.get(group, {})
+        users = self.users.get(group, {})
+        user_id = channels.pop(channel_name, None)
+        if user_id is None:
+            return False
+        self.seen.get(group, {}).pop(channel_name, None)
+        self.attached.get(group, {}).pop(channel_name, None)
+        users[user_id] -= 1
+        if users[user_id] > 0:
+            return False
+        del users[user_id]
+        if not users:
+            self.users.pop(group, None)
+            self.channels.pop(group, None)
+            self.seen.pop(group, None)
+            self.attached.pop(group, None)
+        return True
+
+    async def members(self, group):
+        return list(self.users.get(group, {}))
+
+    async def touch(self, group, channel_name):
+        seen = self.seen.get(group, {})
+        if channel_name in seen:
+            seen[channel_name] = time.time()
+
+    async def attach(self, group, channel_name, other_group):
+        if channel_name not in self.channels.get(group, {}):
+            return
+        if other_group is None:
+            self.attached.get(group, {}).pop(channel_name, None)
+        else:
+            self.attached.setdefault(group, {})[channel_name] = other_group
+
+    async def reap(self, group, before):
+        attached = self.attached.get(group, {})
+        stale = {
+            channel_name: attached.get(channel_name)
+            for channel_name, seen in self.seen.get(group, {}).items() if seen <= before
+        }
+        user_ids = []
+        for channel_name in stale:
+            user_id = self.channels[group][channel_name]
+            if await self.leave(group, user_id, channel_name):
+                user_ids.append(user_id)
+        return stale, user_ids
+
+    async def groups(self):
+        return list(self.channels)
+
+
+class RedisPresenceStore(BasePresenceStore):
+    """
+    Presence store shared by all workers through Redis.
+
+    Each group uses two hashes, one mapping channel name to user id and
+    one holding the connection count of every user, a sorted set of
+    channel names by last seen time and a hash of the other group each
+    connection is attached to. Join, leave and reap are single Lua calls
+    so the refcount can't drift under concurrency. Groups having
+    connections are listed in a set for the reaper.
+    """
+    JOIN_SCRIPT = """
+        if redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2]) == 0 then
+            return -1
+        end
+        local count = redis.call('HINCRBY', KEYS[2], ARGV[2], 1)
+        redis.call('ZADD', KEYS[3], ARGV[4], ARGV[1])
+        redis.call('SADD', KEYS[4], ARGV[5])
+        for i = 1, 3 do
+            redis.call('EXPIRE', KEYS[i], ARGV[3])
+        end
+        return count
+    """
+    LEAVE_SCRIPT = """
+        local user = redis.call('HGET', KEYS[1], ARGV[1])
+        if not user then
+            return -1
+        end
+        redis.call('HDEL', KEYS[1], ARGV[1])
+        redis.call('ZREM', KEYS[3], ARGV[1])
+        redis.call('HDEL', KEYS[5], ARGV[1])
+        local count = redis.call('HINCRBY', KEYS[2], user, -1)
+        if count <= 0 then
+            redis.call('HDEL', KEYS[2], user)
+        end
+        return count
+    """
+    TOUCH_SCRIPT = """
+        if redis.call('ZADD', KEYS[3], 'XX', 'CH', ARGV[2], ARGV[1]) == 1 then
+            for i = 1, 3 do
+                redis.call('EXPIRE', KEYS[i], ARGV[3])
+            end
+        end
+    """
+    ATTACH_SCRIPT = """
+        if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+            if ARGV[2] == '' then
+                redis.call('HDEL', KEYS[5], ARGV[1])
+            else
+                redis.call('HSET', KEYS[5], ARGV[1], ARGV[2])
+                redis.call('EXPIRE', KEYS[5], ARGV[3])
+            end
+        end
+    """
+    REAP_SCRIPT = """
+        local stale = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', ARGV[1])
+        local left = {}
+        local attached = {}
+        for _, channel in ipairs(stale) do
+            table.insert(attached, redis.call('HGET', KEYS[5], channel) or '')
+            redis.call('HDEL', KEYS[5], channel)
+            redis.call('ZREM', KEYS[3], channel)
+            local user = redis.call('HGET', KEYS[1], channel)
+            if user then
+                redis.call('HDEL', KEYS[1], channel)
+                if redis.call('HINCRBY', KEYS[2], user, -1) <= 0 then
+                    redis.call('HDEL', KEYS[2], user)
+                    table.insert(left, user)
+                end
+            end
+        end
+        if redis.call('EXISTS', KEYS[1]) == 0 then
+            redis.call('SREM', KEYS[4], ARGV[2])
+        end
+        return {stale, left, attached}
+    """
+
+    def __init__(self, hosts=None, prefix='presence', expiry=86400, **kwargs):
+        self.host = (hosts or [('localhost', 6379)])[0]
+        self.prefix = prefix
+        self.expiry = expiry
+
+    def _keys(self, group):
+        return [
+            f'{self.prefix}:{group}:channels',
+            f'{self.prefix}:{group}:users',
+            f'{self.prefix}:{group}:seen',
+            f'{self.prefix}:groups',
+            f'{self.prefix}:{group}:attached',
+        ]
+
+    async def _connection(self):
+        return await redis_pool.get_redis_pool(self.host)
+
+    async def join(self, group, user_id, channel_name):
+        redis = await self._connection()
+        count = await redis.eval(
+            self.JOIN_SCRIPT, keys=self._keys(group),
+            args=[channel_name, user_id, self.expiry, time.time(), group]
+        )
+        return count == 1
+
+    async def leave(self, group, user_id, channel_name):
+        redis = await self._connection()
+        count = await redis.eval(self.LEAVE_SCRIPT, keys=self._keys(group), args=[channel_name])
+        return count == 0
+
+    async def members(self, group):
+        redis = await self._connection()
+        user_ids = await redis.hkeys(self._keys(group)[1])
+        return [int(user_id) for user_id in user_ids]
+
+    async def touch(self, group, channel_name):
+        redis = await self._connection()
+        await redis.eval(
+            self.TOUCH_SCRIPT, keys=self._keys(group), args=[channel_name, time.time(), self.expiry]
+        )
+
+    async def attach(self, group, channel_name, other_group):
+        redis = await self._connection()
+        await redis.eval(
+            self.ATTACH_SCRIPT, keys=self._keys(group), args=[channel_name, other_group or '', self.expiry]
+        )
+
+    async def reap(self, group, before):
+        redis = await self._connection()
+        stale, user_ids, attached = await redis.eval(
+            self.REAP_SCRIPT, keys=self._keys(group), args=[before, group]
+        )
+        stale = {
+            channel_name.decode(): other_group.decode() or None
+            for channel_name, other_group in zip(stale, attached)
+        }
+        return stale, [int(user_id) for user_id in user_ids]
+
+    async def groups(self):
+        redis = await self._connection()
+        return await redis.smembers(self._keys('')[3], encoding='utf-8')
+
+
+def heartbeat():
+    """
+    Returns settings.POKERBOARD_HEARTBEAT, completed with defaults.
+    """
+    return {
+        **pokerboard_constants.HEARTBEAT,
+        **getattr(settings, 'POKERBOARD_HEARTBEAT', {}),
+    }
+
+
+_presence_store = None
+
+
+def get_presence_store():
+    """
+    Returns the presence store configured in settings.POKERBOARD_PRESENCE.
+    """
+    global _presence_store
+    if _presence_store is None:
+        config = getattr(settings, 'POKERBOARD_PRESENCE', {})
+        backend = import_string(
+            config.get('BACKEND', 'apps.pokerboard.presence.InMemoryPresenceStore')
+        )
+        _presence_store = backend(**config.get('CONFIG', {}))
+    return _presence_store
+
+
+def _reset_presence_store(setting, **kwargs):
+    global _presence_store
+    if setting == 'POKERBOARD_PRESENCE':
+        _presence_store = None
+
+
+setting_changed.connect(_reset_presence_store)
+
+
+async def reap_stale(channel_layer):
+    """
+    Removes connections of every group not seen for the heartbeat timeout,
+    which disconnect never ran for, and tells each group which users left
+    in a single {'type': 'leave', 'users': [...]} event.
+    A group failing to be reaped is logged and retried on the next run.
+    """
+    store = get_presence_store()
+    before = time.time() - heartbeat()['timeout']
+    for group in await store.groups():
+        try:
+            await reap_group(channel_layer, store, group, before)
+        except Exception:
+            logger.exception('Reaping presence of %s failed', group)
+
+
+async def reap_group(channel_layer, store, group, before):
+    stale, user_ids = await store.reap(group, before)
+    if user_ids:
+        metrics.incr('session.presence_reaped', len(user_ids))
+        # One event for every user reaped, unlike the leave of a disconnect
+        message = {'type': 'leave', 'users': sorted(user_ids)}
+        if group.startswith(pokerboard_constants.BOARD_GROUP_PREFIX):
+            message['stream'] = pokerboard_constants.BOARD_STREAM
+        await event_log.publish(channel_layer, group, message)
+    for channel_name, other_group in stale.items():
+        await channel_layer.group_discard(group, channel_name)
+        if other_group is not None:
+            await channel_layer.group_discard(other_group, channel_name)
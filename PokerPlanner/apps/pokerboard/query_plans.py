@@ -0,0 +1,66 @@
+"""
+Hot lookups of the soft deletion models and checks of their query plans.
+
+Each lookup is built like the code serving it, so its plan shows whether
+the partial indexes on alive rows (deleted_at IS NULL) back it.
+"""
+from apps.group import models as group_models
+from apps.pokerboard import models as poker_models
+from apps.pokerboard import ordering
+
+
+def hot_queries(sample):
+    """
+    Querysets of the hot lookups for the ids of sample: pokerboard, user,
+    ticket and ticket_key (a Jira key).
+    """
+    return {
+        'board_tickets': ordering.board_tickets(sample['pokerboard']).order_by('order'),
+        'ticket_by_key': poker_models.Ticket.objects.filter(ticket_id=sample['ticket_key']),
+        'membership': poker_models.PokerboardUser.objects.filter(
+            user=sample['user'], pokerboard=sample['pokerboard']
+        ),
+        'ticket_votes': poker_models.UserTicketEstimate.objects.filter(
+            ticket_id=sample['ticket']
+        ).values_list('user_id', 'estimate'),
+        'board_invite': poker_models.Invite.objects.filter(
+            pokerboard=sample['pokerboard'], user=sample['user']
+        ),
+        'user_groups': group_models.Group.objects.filter(members=sample['user']),
+    }
+
+
+def sample_ids():
+    """
+    Ids of an alive ticket, its pokerboard and one of its members.
+    """
+    member = poker_models.PokerboardUser.objects.filter(
+        pokerboard__tickets__deleted_at=None
+    ).values('user_id', 'pokerboard_id').first()
+    if member is None:
+        return None
+    ticket = ordering.board_tickets(member['pokerboard_id']).values('id', 'ticket_id').first()
+    return {
+        'pokerboard': member['pokerboard_id'],
+        'user': member['user_id'],
+        'ticket': ticket['id'],
+        'ticket_key': ticket['ticket_id'],
+    }
+
+
+def sequential_scans(plan):
+    """
+    Lines of an EXPLAIN plan scanning a whole table.
+    """
+    return [line.strip() for line in plan.splitlines() if 'Seq Scan' in line]
+
+
+def check(sample):
+    """
+    Returns the plan of every hot lookup and the sequential scans in it.
+    """
+    report = {}
+    for name, queryset in hot_queries(sample).items():
+        plan = queryset.explain()
+        report[name] = {'plan': plan, 'sequential_scans': sequential_scans(plan)}
+    return report
@@ -0,0 +1,105 @@
+"""
+Cache of the responses reading a pokerboard: its detail, tickets and
+members.
+
+Responses are keyed by the board's version, writes to the board, its
+tickets, members and invites bump the version once committed, so
+invalidating a board is one increment and entries of older versions
+expire after POKERBOARD_RESPONSE_CACHE_TTL seconds. Hits and misses are
+counted in libs.metrics.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import Http404
+from rest_framework import status
+from rest_framework.response import Response
+
+from libs import metrics
+
+
+def ttl():
+    return getattr(settings, 'POKERBOARD_RESPONSE_CACHE_TTL', 300)
+
+
+def version_key(pokerboard_id):
+    return f'response_cache:version:{pokerboard_id}'
+
+
+def response_key(pokerboard_id, version, request):
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'response_cache:{pokerboard_id}:{version}:{url}'
+
+
+def initial_version():
+    # A version evicted from the cache starts again past any version it
+    # had, so responses cached before can't be served again.
+    return time.time_ns() // 1000
+
+
+def version(pokerboard_id):
+    key = version_key(pokerboard_id)
+    current = cache.get(key)
+    if current is None:
+        cache.add(key, initial_version(), None)
+        current = cache.get(key)
+    return current
+
+
+def bump(pokerboard_id):
+    """
+    Moves the pokerboard to a new version, its cached responses are not
+    served anymore.
+    """
+    try:
+        cache.incr(version_key(pokerboard_id))
+    except ValueError:
+        cache.set(version_key(pokerboard_id), initial_version(), None)
+
+
+def bump_on_commit(*pokerboard_ids):
+    """
+    Bumps the pokerboards once the current transaction commits, a response
+    read meanwhile would cache data that is about to change.
+    """
+    for pokerboard_id in set(pokerboard_ids):
+        transaction.on_commit(lambda pokerboard_id=pokerboard_id: bump(pokerboard_id))
+
+
+def respond(request, pokerboard_id, view, allowed=None):
+    """
+    Returns the cached response of request for the pokerboard's current
+    version, or calls view() and caches its response if it succeeded.
+
+    allowed() tells whether the user may get a cached response, view()
+    does its own checks.
+    """
+    key = response_key(pokerboard_id, version(pokerboard_id), request)
+    data = cache.get(key)
+    if data is not None:
+        if allowed is not None and not allowed():
+            raise Http404
+        metrics.incr('response_cache.hit')
+        return Response(data)
+    metrics.incr('response_cache.miss')
+    response = view()
+    if response.status_code == status.HTTP_200_OK:
+        cache.set(key, response.data, ttl())
+    return response
+
+
+def stats():
+    """
+    Hits and misses of the current process.
+    """
+    counters = metrics.snapshot()['counters']
+    hits = counters.get('response_cache.hit', 0)
+    misses = counters.get('response_cache.miss', 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None,
+    }
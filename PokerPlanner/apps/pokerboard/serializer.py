@@ -1,15 +1,20 @@
 import requests
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers, status
 
 from apps.group import models as group_models
 from apps.pokerboard import (
     constants as pokerboard_constants,
-    models as pokerboard_models
+    models as pokerboard_models,
+    ordering,
+    response_cache
 )
 from apps.user import (
     models as user_models,
     serializers as user_serializers
 )
+from libs import serializers as util_serializers
 
 from atlassian import Jira
 
@@ -19,7 +24,7 @@ class GetTicketsSerializer(serializers.ListSerializer):
     child = serializers.CharField()
 
 
-class TicketSerializer(serializers.ModelSerializer):
+class TicketSerializer(util_serializers.ExpandableFieldsMixin, serializers.ModelSerializer):
     poker_name = serializers.SerializerMethodField()
     class Meta:
         model = pokerboard_models.Ticket
@@ -29,13 +34,30 @@ class TicketSerializer(serializers.ModelSerializer):
         return obj.pokerboard.title
         
 
-class PokerBoardSerializer(serializers.ModelSerializer):
+class PokerBoardSummarySerializer(util_serializers.ExpandableFieldsMixin, serializers.ModelSerializer):
+    """
+    Pokerboard id and title, as embedded in its tickets and members.
+    """
+    class Meta:
+        model = pokerboard_models.Pokerboard
+        fields = ['id', 'title']
+
+
+class PokerBoardSerializer(util_serializers.ExpandableFieldsMixin, serializers.ModelSerializer):
+    """
+    Pokerboard settings, its tickets come with ?expand=ticket.
+    """
     manager = user_serializers.UserSerializer()
-    ticket = TicketSerializer(source='tickets', many=True)
 
     class Meta:
         model = pokerboard_models.Pokerboard
-        fields = ['id', 'manager', 'title', 'description', 'estimate_type', 'ticket', 'timer', 'estimation_cards']
+        fields = [
+            'id', 'manager', 'title', 'description', 'estimate_type', 'timer', 'estimation_cards',
+            'vote_coalesce_window', 'vote_batch_size'
+        ]
+        expandable = {
+            'ticket': (TicketSerializer, {'source': 'tickets', 'many': True, 'read_only': True}),
+        }
 
 
 class ManagerCredentialSerializer(serializers.ModelSerializer):
@@ -98,7 +120,7 @@ class ValidateMessageSerializer(serializers.Serializer):
     Message serializer for validating a message
     """
     message_type = serializers.ChoiceField(choices=pokerboard_constants.MESSAGE_TYPES)
-    message = serializers.OrderedDict()
+    message = serializers.DictField(required=False, default=dict)
 
 
 class PokerBoardCreationSerializer(serializers.ModelSerializer):
@@ -113,7 +135,8 @@ class PokerBoardCreationSerializer(serializers.ModelSerializer):
         model = pokerboard_models.Pokerboard
         fields = [
             'manager_id', 'title', 'description', 'tickets', 'sprint_id',
-            'ticket_responses', 'jql', 'timer', 'estimation_cards', 'estimate_type'
+            'ticket_responses', 'jql', 'timer', 'estimation_cards', 'estimate_type',
+            'vote_coalesce_window', 'vote_batch_size'
         ]
 
     def get_ticket_responses(self, instance):
@@ -154,11 +177,14 @@ class PokerBoardCreationSerializer(serializers.ModelSerializer):
         try:
             response = jira.jql(jql)
             issues = response['issues']
+            # One query for the keys already on a pokerboard, not one per issue.
+            taken = set(pokerboard_models.Ticket.objects.filter(
+                ticket_id__in=[issue['key'] for issue in issues]
+            ).values_list('ticket_id', flat=True))
             for issue in issues:
                 ticket_response = {}
                 key = issue['key']
-                obj = pokerboard_models.Ticket.objects.filter(ticket_id=key)
-                if obj.exists():
+                if key in taken:
                     ticket_response['message'] = 'Ticket part of another pokerboard.'
                     ticket_response['status_code'] = status.HTTP_400_BAD_REQUEST
                 else:
@@ -176,35 +202,41 @@ class PokerBoardCreationSerializer(serializers.ModelSerializer):
         return ticket_responses
 
     def create(self, validated_data):
-        count = 0
+        """
+        Creates the pokerboard with the imported tickets in one insert,
+        ordered like Jira returned them. Keys another import took since
+        they were checked are skipped by the unique constraint on alive
+        ticket ids and reported like the other taken keys.
+        """
         new_pokerboard = {key: val for key, val in self.data.items() if key not in [
             'sprint_id', 'tickets']}
         ticket_responses = new_pokerboard.pop('ticket_responses')
-        valid_tickets = 0
-        for ticket_response in ticket_responses:
-            valid_tickets += ticket_response['status_code'] == 200
+        # Jira may list an issue twice, it is imported once.
+        keys = list(dict.fromkeys(
+            ticket_response['key'] for ticket_response in ticket_responses
+            if ticket_response['status_code'] == 200
+        ))
 
-        if valid_tickets == 0:
+        if not keys:
             raise serializers.ValidationError('Ticket(s) part of another pokerboard!')
         manager = user_models.User.objects.get(id=self.context['manager_id'])
         new_pokerboard["manager"] = manager
-        pokerboard = pokerboard_models.Pokerboard.objects.create(
-            **new_pokerboard)
-        for ticket_response in ticket_responses:
-            if ticket_response['status_code'] != 200:
-                continue
-            ticket_data = {}
-            ticket_data['pokerboard'] = pokerboard
-            ticket_data['ticket_id'] = ticket_response['key']
-            count += 1
-            ticket_data['order'] = count
-            ticket_id = ticket_response['key']
-            ticket_response.pop('key')
-            pokerboard_models.Ticket.objects.get_or_create(
-                ticket_id=ticket_id, defaults={**ticket_data}
-            )
-            ticket_response['key'] = ticket_id
-        pokerboard_models.PokerboardUser.objects.create(user=manager, pokerboard=pokerboard, role=2)
+        with transaction.atomic():
+            pokerboard = pokerboard_models.Pokerboard.objects.create(
+                **new_pokerboard)
+            pokerboard_models.Ticket.objects.bulk_create([
+                pokerboard_models.Ticket(pokerboard=pokerboard, ticket_id=key, order=order)
+                for key, order in zip(keys, ordering.spaced_orders(len(keys)))
+            ], ignore_conflicts=True)
+            imported = set(pokerboard.tickets.values_list('ticket_id', flat=True))
+            if not imported:
+                raise serializers.ValidationError('Ticket(s) part of another pokerboard!')
+            for ticket_response in ticket_responses:
+                if ticket_response['status_code'] == 200 and ticket_response['key'] not in imported:
+                    del ticket_response['estimate']
+                    ticket_response['message'] = 'Ticket part of another pokerboard.'
+                    ticket_response['status_code'] = status.HTTP_400_BAD_REQUEST
+            pokerboard_models.PokerboardUser.objects.create(user=manager, pokerboard=pokerboard, role=2)
         return pokerboard
 
 
@@ -232,16 +264,21 @@ class PokerBoardVotingUserSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'role', 'pokerboard']
 
 
-class PokerboardTicketSerializer(serializers.ModelSerializer):
+class PokerboardTicketSerializer(util_serializers.ExpandableFieldsMixin, serializers.ModelSerializer):
     """
     PokerBoard tickets Serializer for updating and listing pokerboard tickets.
+    Tickets come with their board's id and title, the whole board with
+    ?expand=pokerboard.
     """
-    pokerboard = PokerBoardSerializer()
+    pokerboard = PokerBoardSummarySerializer(read_only=True)
 
     class Meta:
         model = pokerboard_models.Ticket
         fields = ['id', 'pokerboard', 'ticket_id',
                 'estimate', 'order', 'status']
+        expandable = {
+            'pokerboard': (PokerBoardSerializer, {'read_only': True}),
+        }
         # TODO: add a methodfield here so that while fetching an  entity from ticket table
         # ticket details come in that request too. and on updatinf final estimate it should be
         # updated on JIRA as well
@@ -255,9 +292,10 @@ class CommentSerializer(serializers.Serializer):
     ticket_id = serializers.SlugField()
 
 
-class VoteSerializer(serializers.ModelSerializer):
+class VoteSerializer(util_serializers.ExpandableFieldsMixin, serializers.ModelSerializer):
     """
-    Vote Serializer for creating and listing votes.
+    Vote Serializer for creating and listing votes, the voted ticket comes
+    with ?expand=ticket_id.
     """
     user = user_serializers.UserSerializer(read_only=True)
     class Meta:
@@ -268,6 +306,9 @@ class VoteSerializer(serializers.ModelSerializer):
                 "read_only": True
             }
         }
+        expandable = {
+            'ticket_id': (TicketSerializer, {'read_only': True}),
+        }
 
     def validate(self, data):
         print("::: ticket :::", self.context['ticket_id'])
@@ -289,9 +330,10 @@ class VoteSerializer(serializers.ModelSerializer):
         return vote
 
 
-class PokerboardMemberSerializer(serializers.ModelSerializer):
+class PokerboardMemberSerializer(util_serializers.ExpandableFieldsMixin, serializers.ModelSerializer):
     """
-    Serialier to list members belonging to a pokerboard
+    Serialier to list members belonging to a pokerboard, with the board's
+    id and title on ?expand=pokerboard.
     """
     user = user_serializers.UserSerializer()
     role = serializers.SerializerMethodField()
@@ -300,6 +342,9 @@ class PokerboardMemberSerializer(serializers.ModelSerializer):
     class Meta:
         model = pokerboard_models.PokerboardUser
         fields = ['id', 'user', 'role', 'pokerboard', 'group']
+        expandable = {
+            'pokerboard': (PokerBoardSummarySerializer, {'read_only': True}),
+        }
 
     def get_role(self, obj):
         return obj.get_role_display()
@@ -323,13 +368,43 @@ class TicketOrderSerializer(serializers.ListSerializer):
             ticket_id__in=ticket_list, pokerboard=pokerboard
         ).order_by('ticket_id')
 
+        changed = []
+        now = timezone.now()
         for ticket, updated_ticket in zip(tickets, validated_data):
-            ticket.order = updated_ticket.get('order')
-        
-        pokerboard_models.Ticket.objects.bulk_update(tickets, ['order'])
+            order = updated_ticket.get('order') * pokerboard_constants.TICKET_ORDER_GAP
+            if ticket.order != order:
+                ticket.order = order
+                ticket.updated_at = now
+                changed.append(ticket)
+
+        pokerboard_models.Ticket.objects.bulk_update(changed, ['order', 'updated_at'])
+        if changed:
+            response_cache.bump_on_commit(pokerboard)
         return validated_data
 
 
+class TicketMoveSerializer(serializers.Serializer):
+    """
+    Serializer placing a ticket right before or after another ticket of
+    its pokerboard, at its end when neither is given.
+    """
+    before = serializers.PrimaryKeyRelatedField(
+        queryset=pokerboard_models.Ticket.objects.all(), required=False
+    )
+    after = serializers.PrimaryKeyRelatedField(
+        queryset=pokerboard_models.Ticket.objects.all(), required=False
+    )
+
+    def validate(self, attrs):
+        if 'before' in attrs and 'after' in attrs:
+            raise serializers.ValidationError("Give either before or after")
+        other = attrs.get('before') or attrs.get('after')
+        ticket = self.context['ticket']
+        if other is not None and (other.pokerboard_id != ticket.pokerboard_id or other.id == ticket.id):
+            raise serializers.ValidationError("Ticket can't be placed next to this ticket")
+        return attrs
+
+
 class UserEstimateSerializer(serializers.ModelSerializer):
     
     ticket = serializers.SerializerMethodField()
@@ -0,0 +1,244 @@
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.db import DatabaseSyncToAsync
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.test.signals import setting_changed
+from django.utils import timezone
+
+from apps.pokerboard import (
+    access_cache,
+    jira_outbox,
+    models as poker_models,
+    ordering,
+    response_cache,
+    serializer as poker_serializers
+)
+from apps.user import (
+    models as user_models,
+    serializers as user_serializers
+)
+_executor = None
+
+
+def get_executor():
+    """
+    Thread pool running session database work, sized by
+    settings.POKERBOARD_DB_THREADS.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'POKERBOARD_DB_THREADS', 10),
+            thread_name_prefix='session-db',
+        )
+    return _executor
+
+
+def _reset_executor(setting, **kwargs):
+    global _executor
+    if setting == 'POKERBOARD_DB_THREADS' and _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+setting_changed.connect(_reset_executor)
+
+
+def session_database_sync_to_async(func):
+    """
+    database_sync_to_async running on the session thread pool instead of
+    the single shared sync thread, so a slow query only holds one thread.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await DatabaseSyncToAsync(
+            func, thread_sensitive=False, executor=get_executor()
+        )(*args, **kwargs)
+    return wrapper
+
+
+def get_membership(pokerboard_id, user_id):
+    """
+    Returns serialized membership of user in the pokerboard or
+    access_cache.NOT_MEMBER.
+    """
+    member = access_cache.get_member(pokerboard_id, user_id)
+    if member is None:
+        member = poker_models.PokerboardUser.objects.filter(
+            user=user_id, pokerboard=pokerboard_id
+        ).select_related('user').first()
+        if member is None:
+            member = access_cache.NOT_MEMBER
+        else:
+            member = poker_serializers.PokerBoardVotingUserSerializer(instance=member).data
+        access_cache.set_member(pokerboard_id, user_id, member)
+    return member
+
+
+@session_database_sync_to_async
+def get_session_access(ticket_id, user_id):
+    """
+    Returns pokerboard id and manager id of the ticket, whether user can
+    join its session and user's serialized membership of the pokerboard.
+    Lookups go through access_cache, so reconnects don't hit the database.
+    """
+    ticket = access_cache.get_ticket(ticket_id)
+    if ticket is None:
+        ticket = poker_models.Ticket.objects.filter(
+            id=ticket_id, pokerboard__deleted_at__isnull=True
+        ).values('pokerboard_id', manager_id=F('pokerboard__manager_id')).first()
+        if ticket is None:
+            return None, None, False, None
+        access_cache.set_ticket(ticket_id, ticket)
+    pokerboard_id = ticket['pokerboard_id']
+    manager_id = ticket['manager_id']
+    member = get_membership(pokerboard_id, user_id)
+    allowed = user_id == manager_id or member is not access_cache.NOT_MEMBER
+    return pokerboard_id, manager_id, allowed, member or None
+
+
+@session_database_sync_to_async
+def get_board_access(pokerboard_id, user_id):
+    """
+    Returns manager id of the pokerboard, whether user can join its
+    sessions and user's serialized membership, cached like
+    get_session_access.
+    """
+    board = access_cache.get_board(pokerboard_id)
+    if board is None:
+        board = poker_models.Pokerboard.objects.filter(id=pokerboard_id).values('manager_id').first()
+        if board is None:
+            return None, False, None
+        access_cache.set_board(pokerboard_id, board)
+    member = get_membership(pokerboard_id, user_id)
+    allowed = user_id == board['manager_id'] or member is not access_cache.NOT_MEMBER
+    return board['manager_id'], allowed, member or None
+
+
+@session_database_sync_to_async
+def get_session_snapshot(ticket_id, pokerboard_id, user_ids, voter_ids):
+    """
+    Fetches connected users, details of users who voted and timer start.
+    """
+    members = poker_models.PokerboardUser.objects.filter(
+        user__in=user_ids, pokerboard=pokerboard_id).select_related('user')
+    voters = user_models.User.objects.filter(id__in=voter_ids)
+    start_datetime = poker_models.Ticket.objects.filter(
+        id=ticket_id).values_list('start_datetime', flat=True).first()
+    return {
+        "users": poker_serializers.PokerBoardVotingUserSerializer(instance=members, many=True).data,
+        "voters": {
+            voter['id']: voter for voter in user_serializers.UserSerializer(voters, many=True).data
+        },
+        "start_datetime": start_datetime,
+    }
+
+
+@session_database_sync_to_async
+def get_vote_state(ticket_id):
+    """
+    Returns vote settings of the ticket's pokerboard, with the deadline of
+    its running timer, and votes given on it.
+    """
+    board = poker_models.Ticket.objects.filter(id=ticket_id).values(
+        'status',
+        'start_datetime',
+        cards=F('pokerboard__estimation_cards'),
+        coalesce_window=F('pokerboard__vote_coalesce_window'),
+        batch_size=F('pokerboard__vote_batch_size'),
+        timer=F('pokerboard__timer'),
+    ).first() or {}
+    status = board.pop('status', None)
+    start_datetime = board.pop('start_datetime', None)
+    if status == poker_models.Ticket.ONGOING and start_datetime and board['timer']:
+        board['deadline'] = start_datetime.timestamp() + board['timer']
+    votes = dict(poker_models.UserTicketEstimate.objects.filter(
+        ticket_id=ticket_id).values_list('user_id', 'estimate'))
+    return board, votes
+
+
+@session_database_sync_to_async
+def save_votes(ticket_id, votes):
+    """
+    Upserts votes ({user id: estimate}) of a ticket in a single statement.
+    """
+    opts = poker_models.UserTicketEstimate._meta
+
+    def column(name):
+        return connection.ops.quote_name(opts.get_field(name).column)
+
+    now = timezone.now()
+    params = []
+    for user_id, estimate in votes.items():
+        params.extend([now, now, user_id, ticket_id, estimate])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {connection.ops.quote_name(opts.db_table)}
+                ({column('created_at')}, {column('updated_at')}, {column('user')},
+                 {column('ticket_id')}, {column('estimate')}, {column('estimation_time')})
+            VALUES {', '.join(['(%s, %s, %s, %s, %s, 0)'] * len(votes))}
+            ON CONFLICT ({column('user')}, {column('ticket_id')}) DO UPDATE SET
+                {column('estimate')} = EXCLUDED.{column('estimate')},
+                {column('updated_at')} = EXCLUDED.{column('updated_at')},
+                {column('deleted_at')} = NULL
+            """,
+            params
+        )
+
+
+@session_database_sync_to_async
+def start_ticket_timer(ticket_id):
+    """
+    Marks ticket as ongoing, returns start time or None if ticket is
+    already estimated.
+    """
+    ticket = poker_models.Ticket.objects.get(id=ticket_id)
+    if ticket.status == poker_models.Ticket.ESTIMATED:
+        return None
+    ticket.start_datetime = timezone.now()
+    ticket.status = poker_models.Ticket.ONGOING
+    ticket.save()
+    return ticket.start_datetime
+
+
+@session_database_sync_to_async
+def estimate_ticket(ticket_id, manager_id, estimate):
+    """
+    Sets final estimate of the ticket, Jira is updated later through the
+    outbox so a slow or failing Jira can't lose the estimate.
+    """
+    with transaction.atomic():
+        ticket = poker_models.Ticket.objects.get(id=ticket_id)
+        ticket.status = poker_models.Ticket.ESTIMATED
+        ticket.estimate = estimate
+        ticket.end_datetime = timezone.now()
+        ticket.save()
+        try:
+            jira_outbox.enqueue(
+                manager_id, ticket, poker_models.JiraOutbox.ESTIMATE, {'estimate': estimate}
+            )
+        except poker_models.ManagerCredentials.DoesNotExist:
+            # Nothing to sync, the estimate is kept locally.
+            pass
+
+
+@session_database_sync_to_async
+def skip_ticket(ticket_id, pokerboard_id):
+    """
+    Skips the ticket and moves it to the end of the pokerboard, returns
+    False if ticket is already estimated.
+    """
+    with transaction.atomic():
+        ordering.lock_board(pokerboard_id)
+        skipped = poker_models.Ticket.objects.filter(id=ticket_id).exclude(
+            status=poker_models.Ticket.ESTIMATED
+        ).update(
+            status=poker_models.Ticket.SKIPPED, order=ordering.end_order(pokerboard_id), updated_at=timezone.now()
+        )
+    if skipped:
+        response_cache.bump_on_commit(pokerboard_id)
+    return skipped == 1
@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from rest_framework import serializers
+
+from apps.pokerboard import session_queries, timers
+from libs import metrics
+
+logger = logging.getLogger(__name__)
+
+# Identifies this worker in broadcasts, so votes applied locally are not
+# applied a second time when their broadcast comes back.
+PROCESS_ID = uuid.uuid4().hex
+
+
+class TicketVoteState:
+    """
+    Votes of a ticket session kept in memory.
+
+    Votes are applied and tallied in memory, the ones placed through this
+    worker are persisted in batches by flush(). When the pokerboard has a
+    coalesce window, their broadcasts are batched as well by
+    queue_broadcast(). Once the deadline of the ticket's timer is reached
+    votes are closed and the expiry is broadcasted by timers.expire().
+    """
+    estimate_field = serializers.IntegerField(min_value=0)
+
+    def __init__(self, ticket_id, cards=None, votes=None, coalesce_window=0, batch_size=50,
+                 timer=None, deadline=None):
+        self.ticket_id = ticket_id
+        self.cards = frozenset(cards) if cards else None
+        self.coalesce_window = coalesce_window
+        self.batch_size = max(batch_size, 1)
+        self.pending_broadcast = {}
+        self.broadcast_handle = None
+        self.broadcast_queued_at = None
+        self.publish_votes = None
+        self.timer = timer
+        self.deadline = None
+        self.timer_handle = None
+        if deadline is not None:
+            self.set_deadline(deadline)
+        self.votes = {}
+        self.counts = Counter()
+        self.total = 0
+        self.dirty = {}
+        self.subscribers = 0
+        self.flush_handle = None
+        self.flush_lock = asyncio.Lock()
+        for user_id, estimate in (votes or {}).items():
+            self.apply(user_id, estimate, persist=False)
+
+    def set_deadline(self, deadline):
+        """
+        Closes votes at deadline (epoch seconds), None stops the timer.
+        """
+        if self.timer_handle is not None:
+            self.timer_handle.cancel()
+            self.timer_handle = None
+        self.deadline = deadline
+        if deadline is None:
+            return
+        delay = deadline - time.time()
+        if delay < -timers.EXPIRY_LOCK_SECONDS:
+            # Expired long ago, e.g. while no worker was running.
+            return
+        self.timer_handle = asyncio.get_event_loop().call_later(
+            max(delay, 0), lambda: asyncio.ensure_future(timers.expire(self.ticket_id, deadline))
+        )
+
+    def start_timer(self, start_datetime):
+        """
+        Sets the deadline of a timer started at start_datetime, returns it.
+        """
+        self.set_deadline(start_datetime.timestamp() + self.timer if self.timer else None)
+        return self.deadline
+
+    def is_expired(self):
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def validate(self, estimate):
+        """
+        Validates an estimate against estimation cards, without touching the database.
+        """
+        estimate = self.estimate_field.run_validation(estimate)
+        if self.cards is not None and estimate not in self.cards:
+            raise serializers.ValidationError("Estimate is not one of the estimation cards")
+        return estimate
+
+    def apply(self, user_id, estimate, persist=True):
+        """
+        Places/updates a vote. Votes coming from other workers are not
+        persisted here, their worker does it.
+        """
+        previous = self.votes.get(user_id)
+        if previous is not None:
+            self.counts[previous] -= 1
+            if not self.counts[previous]:
+                del self.counts[previous]
+            self.total -= previous
+        self.votes[user_id] = estimate
+        self.counts[estimate] += 1
+        self.total += estimate
+        if persist:
+            self.dirty[user_id] = estimate
+            self.schedule_flush()
+        elif self.dirty.get(user_id) not in (None, estimate):
+            del self.dirty[user_id]
+
+    def tally(self):
+        """
+        Count, distribution, mean, median and mode of current votes.
+        """
+        count = len(self.votes)
+        if not count:
+            return {'count': 0, 'distribution': {}, 'mean': None, 'median': None, 'mode': None}
+        values = sorted(self.counts)
+        median_positions = ((count - 1) // 2, count // 2)
+        medians = []
+        seen = 0
+        for value in values:
+            seen += self.counts[value]
+            while len(medians) < 2 and median_positions[len(medians)] < seen:
+                medians.append(value)
+        most_votes = max(self.counts.values())
+        return {
+            'count': count,
+            'distribution': {str(value): self.counts[value] for value in values},
+            'mean': self.total / count,
+            'median': sum(medians) / 2,
+            'mode': next(value for value in values if self.counts[value] == most_votes),
+        }
+
+    def schedule_flush(self):
+        if self.flush_handle is None:
+            interval = getattr(settings, 'POKERBOARD_VOTE_FLUSH_INTERVAL_MS', 200) / 1000
+            self.flush_handle = asyncio.get_event_loop().call_later(
+                interval, lambda: asyncio.ensure_future(self.flush())
+            )
+
+    async def flush(self):
+        """
+        Persists votes placed since last flush as one bulk upsert.
+        """
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        async with self.flush_lock:
+            votes, self.dirty = self.dirty, {}
+            if not votes:
+                return
+            try:
+                await session_queries.save_votes(self.ticket_id, votes)
+            except Exception:
+                # Keep votes which were not replaced meanwhile for next flush.
+                for user_id, estimate in votes.items():
+                    self.dirty.setdefault(user_id, estimate)
+                self.schedule_flush()
+                raise
+
+    async def queue_broadcast(self, user_id, vote, publish):
+        """
+        Queues the broadcast of a vote. Queued votes are sent together by
+        publish(votes) when the coalesce window ends or the batch is full,
+        only the latest vote of each user is kept.
+        """
+        self.pending_broadcast.pop(user_id, None)
+        self.pending_broadcast[user_id] = vote
+        if self.broadcast_queued_at is None:
+            self.broadcast_queued_at = time.perf_counter()
+            self.publish_votes = publish
+        if len(self.pending_broadcast) >= self.batch_size:
+            await self.flush_broadcast()
+        elif self.broadcast_handle is None:
+            self.broadcast_handle = asyncio.get_event_loop().call_later(
+                self.coalesce_window / 1000, lambda: asyncio.ensure_future(self.flush_broadcast())
+            )
+
+    async def flush_broadcast(self):
+        """
+        Sends queued vote broadcasts right away.
+        """
+        if self.broadcast_handle is not None:
+            self.broadcast_handle.cancel()
+            self.broadcast_handle = None
+        votes, self.pending_broadcast = self.pending_broadcast, {}
+        if not votes:
+            return
+        delay = time.perf_counter() - self.broadcast_queued_at
+        self.broadcast_queued_at = None
+        metrics.observe('session.vote_batch_size', len(votes))
+        metrics.observe('session.vote_broadcast_delay_ms', round(delay * 1000, 3))
+        await self.publish_votes(list(votes.values()))
+
+
+class TallyRegistry:
+    """
+    Vote states of the tickets having sessions on this worker.
+    """
+
+    def __init__(self):
+        self.states = {}
+
+    async def acquire(self, ticket_id):
+        """
+        Returns vote state of the ticket, loading it on first use.
+        """
+        state = self.states.get(ticket_id)
+        if state is None:
+            state = self.states[ticket_id] = asyncio.ensure_future(self._load(ticket_id))
+        if isinstance(state, asyncio.Future):
+            # Concurrent connects share a single load.
+            try:
+                state = await state
+            except Exception:
+                self.states.pop(ticket_id, None)
+                raise
+            self.states[ticket_id] = state
+        state.subscribers += 1
+        return state
+
+    async def release(self, state):
+        """
+        Flushes pending votes and forgets the state once its last
+        session on this worker is gone. Votes failing to be saved stay
+        queued for the next flush, the session is left anyway.
+        """
+        state.subscribers -= 1
+        try:
+            await state.flush_broadcast()
+            await state.flush()
+        except Exception:
+            logger.exception('Flushing votes of ticket %s failed', state.ticket_id)
+        if state.subscribers <= 0 and not state.dirty:
+            state.set_deadline(None)
+            self.states.pop(state.ticket_id, None)
+
+    async def _load(self, ticket_id):
+        board, votes = await session_queries.get_vote_state(ticket_id)
+        return TicketVoteState(ticket_id, votes=votes, **board)
+
+
+registry = TallyRegistry()
@@ -0,0 +1,41 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from PokerPlanner.celery import app
+
+from apps.pokerboard import jira_outbox, ordering, presence
+
+
+@app.task
+def drain_jira_outbox():
+    """
+    Celery task handing due Jira outbox entries to push tasks
+    """
+    for entry_id in jira_outbox.claim_due_entries():
+        push_jira_outbox_entry.delay(entry_id)
+
+
+@app.task
+def push_jira_outbox_entry(entry_id):
+    """
+    Celery task pushing one outbox entry to Jira
+    """
+    jira_outbox.push_entry(entry_id)
+    # A slot for this host is free again.
+    drain_jira_outbox.delay()
+
+
+@app.task
+def reap_presence():
+    """
+    Celery task removing presence of connections that died without a clean close
+    """
+    async_to_sync(presence.reap_stale)(get_channel_layer())
+
+
+@app.task
+def renormalize_ticket_order(pokerboard_id):
+    """
+    Celery task spacing out order keys of a pokerboard whose gaps ran out
+    """
+    ordering.renormalize(pokerboard_id)
@@ -1 +1,2441 @@
-from django.test import TestCase
+import asyncio
+import threading
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from unittest.mock import AsyncMock, Mock, patch
+
+from asgiref.sync import async_to_sync
+from channels import DEFAULT_CHANNEL_LAYER
+from channels.layers import channel_layers, get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from ddf import G
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, reverse
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase, APITransactionTestCase
+
+from apps.pokerboard import constants as pokerboard_constants
+from apps.pokerboard import encoding, event_log, jira_outbox, ordering
+from apps.pokerboard import models as pokerboard_models
+from apps.pokerboard import presence, query_plans, response_cache, session_queries, tally
+from apps.pokerboard.consumers import BoardConsumer, SessionConsumer
+from apps.pokerboard.event_log import InMemoryEventLog
+from apps.pokerboard.presence import InMemoryPresenceStore, get_presence_store
+from apps.pokerboard.tally import TicketVoteState
+from apps.pokerboard.views import PokerBoardViewSet
+from apps.user.models import User
+from libs import metrics
+from libs.rate_limit import RateLimiter
+from PokerPlanner.channel_layers import HashRing, ShardedRedisChannelLayer, ShardedRedisPubSubLoopLayer
+
+
+class FakeRedisConnection:
+    """
+    Records the commands a channel layer sends to Redis, every group holds
+    members and sorted sets are queues
+    """
+    def __init__(self, members=()):
+        self.commands = []
+        self.members = list(members)
+        self.queues = defaultdict(asyncio.Queue)
+
+    async def zrem(self, key, member):
+        self.commands.append(('zrem', key, member))
+
+    async def zremrangebyscore(self, key, min, max):
+        self.commands.append(('zremrangebyscore', key))
+
+    async def zrange(self, key, start, stop):
+        return [member.encode() for member in self.members]
+
+    def pipeline(self):
+        return Mock(execute=AsyncMock())
+
+    async def eval(self, script, keys, args):
+        self.commands.append(('eval', keys))
+        return 0
+
+    async def zadd(self, key, score, member):
+        self.queues[key].put_nowait(member)
+
+    async def zpopmin(self, key):
+        self.queues[key].get_nowait()
+
+    async def bzpopmin(self, key, timeout):
+        try:
+            return key, await asyncio.wait_for(self.queues[key].get(), timeout), 0
+        except asyncio.TimeoutError:
+            return None
+
+
+TEST_CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": "channels.layers.InMemoryChannelLayer",
+    },
+}
+TEST_PRESENCE = {
+    "BACKEND": "apps.pokerboard.presence.InMemoryPresenceStore",
+}
+TEST_EVENT_LOG = {
+    "BACKEND": "apps.pokerboard.event_log.InMemoryEventLog",
+}
+TEST_TIMER_LOCK = {
+    "BACKEND": "apps.pokerboard.timers.InMemoryTimerLock",
+}
+
+
+class PresenceStoreTestCases(TestCase):
+    """
+    Test cases for the in-memory presence store
+    """
+    def setUp(self):
+        self.store = InMemoryPresenceStore()
+
+    def test_user_present_until_last_connection_leaves(self):
+        """
+        A user with two sockets stays present when only one of them closes
+        """
+        self.assertTrue(async_to_sync(self.store.join)('session_1', 1, 'channel.a'))
+        self.assertFalse(async_to_sync(self.store.join)('session_1', 1, 'channel.b'))
+        self.assertFalse(async_to_sync(self.store.leave)('session_1', 1, 'channel.a'))
+        self.assertListEqual(async_to_sync(self.store.members)('session_1'), [1])
+        self.assertTrue(async_to_sync(self.store.leave)('session_1', 1, 'channel.b'))
+        self.assertListEqual(async_to_sync(self.store.members)('session_1'), [])
+
+    def test_duplicate_join_does_not_duplicate_user(self):
+        """
+        Joining twice with the same channel counts as a single connection
+        """
+        async_to_sync(self.store.join)('session_1', 1, 'channel.a')
+        async_to_sync(self.store.join)('session_1', 1, 'channel.a')
+        async_to_sync(self.store.join)('session_1', 2, 'channel.b')
+        self.assertCountEqual(async_to_sync(self.store.members)('session_1'), [1, 2])
+        self.assertTrue(async_to_sync(self.store.leave)('session_1', 1, 'channel.a'))
+
+    def test_leave_unknown_channel(self):
+        """
+        Leaving with a channel that never joined is a no-op
+        """
+        self.assertFalse(async_to_sync(self.store.leave)('session_1', 1, 'channel.a'))
+
+    def test_reap_removes_connections_not_seen(self):
+        """
+        Reaping removes stale connections, users only leave with their last connection
+        """
+        with patch('apps.pokerboard.presence.time.time', return_value=100):
+            async_to_sync(self.store.join)('session_1', 1, 'channel.a')
+            async_to_sync(self.store.join)('session_1', 1, 'channel.b')
+            async_to_sync(self.store.join)('session_1', 2, 'channel.c')
+        with patch('apps.pokerboard.presence.time.time', return_value=200):
+            async_to_sync(self.store.touch)('session_1', 'channel.b')
+        stale, user_ids = async_to_sync(self.store.reap)('session_1', 150)
+        self.assertCountEqual(stale, ['channel.a', 'channel.c'])
+        self.assertListEqual(user_ids, [2])
+        self.assertListEqual(async_to_sync(self.store.members)('session_1'), [1])
+        self.assertEqual(async_to_sync(self.store.reap)('session_1', 200), ({'channel.b': None}, [1]))
+        self.assertListEqual(async_to_sync(self.store.groups)(), [])
+
+    def test_reap_returns_attached_group(self):
+        """
+        Reaped connections come with the other group they were attached to, until detached
+        """
+        with patch('apps.pokerboard.presence.time.time', return_value=100):
+            async_to_sync(self.store.join)('board_1', 1, 'channel.a')
+            async_to_sync(self.store.join)('board_1', 2, 'channel.b')
+        async_to_sync(self.store.attach)('board_1', 'channel.a', 'session_1')
+        async_to_sync(self.store.attach)('board_1', 'channel.b', 'session_2')
+        async_to_sync(self.store.attach)('board_1', 'channel.b', None)
+        async_to_sync(self.store.attach)('board_1', 'channel.c', 'session_3')
+        stale, _ = async_to_sync(self.store.reap)('board_1', 150)
+        self.assertDictEqual(stale, {'channel.a': 'session_1', 'channel.b': None})
+
+
+class EventLogTestCases(TestCase):
+    """
+    Test cases for the in-memory session event log
+    """
+    def setUp(self):
+        self.log = InMemoryEventLog(size=3)
+
+    def test_events_are_numbered_per_group(self):
+        """
+        Every group has its own sequence
+        """
+        self.assertEqual(async_to_sync(self.log.append)('session_1', {'type': 'skip'}), 1)
+        self.assertEqual(async_to_sync(self.log.append)('session_1', {'type': 'skip'}), 2)
+        self.assertEqual(async_to_sync(self.log.append)('session_2', {'type': 'skip'}), 1)
+        self.assertEqual(async_to_sync(self.log.current)('session_1'), 2)
+        self.assertEqual(async_to_sync(self.log.current)('session_3'), 0)
+
+    def test_since_returns_missed_events(self):
+        """
+        Events after given sequence number are returned in order
+        """
+        for estimate in (1, 2, 3):
+            async_to_sync(self.log.append)('session_1', {'type': 'vote', 'estimate': estimate})
+        self.assertListEqual(async_to_sync(self.log.since)('session_1', 1), [
+            {'type': 'vote', 'estimate': 2, 'seq': 2},
+            {'type': 'vote', 'estimate': 3, 'seq': 3},
+        ])
+        self.assertListEqual(async_to_sync(self.log.since)('session_1', 3), [])
+
+    def test_since_without_buffered_events(self):
+        """
+        A gap larger than the buffer or an unknown sequence number gives None
+        """
+        for _ in range(5):
+            async_to_sync(self.log.append)('session_1', {'type': 'skip'})
+        self.assertIsNone(async_to_sync(self.log.since)('session_1', 1))
+        self.assertEqual(len(async_to_sync(self.log.since)('session_1', 2)), 3)
+        self.assertIsNone(async_to_sync(self.log.since)('session_1', 6))
+
+
+@override_settings(
+    CHANNEL_LAYERS=TEST_CHANNEL_LAYERS, POKERBOARD_PRESENCE=TEST_PRESENCE,
+    POKERBOARD_EVENT_LOG=TEST_EVENT_LOG, POKERBOARD_TIMER_LOCK=TEST_TIMER_LOCK
+)
+class SessionConsumerTestCase(TransactionTestCase):
+    """
+    Base class for websocket session tests
+    """
+    def setUp(self):
+        cache.clear()
+        self.manager = G(User, email="manager@gmail.com")
+        self.player = G(User, email="player@gmail.com")
+        self.pokerboard = G(
+            pokerboard_models.Pokerboard, manager=self.manager, timer=30,
+            estimation_cards=[1, 2, 3, 5, 8]
+        )
+        G(pokerboard_models.PokerboardUser, user=self.manager, pokerboard=self.pokerboard)
+        G(pokerboard_models.PokerboardUser, user=self.player, pokerboard=self.pokerboard)
+        self.ticket = G(
+            pokerboard_models.Ticket, pokerboard=self.pokerboard, ticket_id="PP-1", order=1,
+            status=pokerboard_models.Ticket.UNTOUCHED, start_datetime=None
+        )
+        self.application = URLRouter([
+            path("ws/session/<int:id>", SessionConsumer.as_asgi()),
+        ])
+        self.communicators = []
+
+    async def connect(self, user, ticket=None, subprotocols=None, drain=True):
+        """
+        Opens a session socket for user on ticket
+        """
+        ticket = ticket or self.ticket
+        communicator = WebsocketCommunicator(
+            self.application, f"ws/session/{ticket.id}?pid={ticket.pokerboard_id}",
+            subprotocols=subprotocols
+        )
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.communicators.append(communicator)
+        if drain:
+            await self.drain()
+        return communicator
+
+    async def drain(self):
+        """
+        Discards messages pending on open sockets, like join events
+        """
+        for communicator in self.communicators:
+            while not await communicator.receive_nothing(timeout=0.1):
+                await communicator.receive_output()
+
+    async def send(self, communicator, message_type, message=None):
+        await communicator.send_json_to({"message_type": message_type, "message": message or {}})
+
+
+class SessionPresenceTestCases(SessionConsumerTestCase):
+    """
+    Test cases for presence tracking in session consumer
+    """
+    def test_initialise_game_lists_connected_users(self):
+        """
+        initialise_game returns every connected user once
+        """
+        async def scenario():
+            manager = await self.connect(self.manager)
+            player = await self.connect(self.player)
+            second_tab = await self.connect(self.player)
+            await self.send(manager, "initialise_game")
+            response = await manager.receive_json_from()
+            self.assertEqual(response["type"], "initialise_game")
+            self.assertCountEqual(
+                [member["user"]["id"] for member in response["users"]],
+                [self.manager.id, self.player.id]
+            )
+            for communicator in (manager, player, second_tab):
+                await communicator.disconnect()
+        async_to_sync(scenario)()
+
+    def test_join_and_leave_are_broadcasted_as_deltas(self):
+        """
+        Only the user joining or leaving is broadcasted, once for all their tabs
+        """
+        async def scenario():
+            manager = await self.connect(self.manager)
+            player = await self.connect(self.player, drain=False)
+            response = await manager.receive_json_from()
+            self.assertEqual(response["type"], "join")
+            self.assertEqual(response["seq"], 2)
+            self.assertEqual(response["user"]["user"]["id"], self.player.id)
+            await self.drain()
+            second_tab = await self.connect(self.player)
+            await second_tab.disconnect()
+            self.assertTrue(await manager.receive_nothing())
+            await player.disconnect()
+            response = await manager.receive_json_from()
+            self.assertDictEqual(response, {"type": "leave", "user": self.player.id, "seq": 3})
+            await manager.disconnect()
+        async_to_sync(scenario)()
+
+
+class SessionHandlerTestCases(SessionConsumerTestCase):
+    """
+    Test cases for session handlers running their queries off the event loop
+    """
+    def test_vote_is_saved_and_broadcasted(self):
+        """
+        A vote is stored and every participant receives it
+        """
+        async def scenario():
+            manager = await self.connect(self.manager)
+            player = await self.connect(self.player)
+            await self.send(player, "vote", {"estimate": 5})
+            for communicator in (manager, player):
+                response = await communicator.receive_json_from()
+                self.assertEqual(response["type"], "vote")
+                self.assertEqual(response["vote"]["estimate"], 5)
+                self.assertEqual(response["vote"]["user"]["id"], self.player.id)
+            await manager.disconnect()
+            await player.disconnect()
+        async_to_sync(scenario)()
+        vote = pokerboard_models.UserTicketEstimate.objects.get(ticket_id=self.ticket)
+        self.assertEqual(vote.user, self.player)
+        self.assertEqual(vote.estimate, 5)
+
+    def test_start_timer_only_by_manager(self):
+        """
+        Players can't start the timer, manager can
+        """
+        async def scenario():
+            manager = await self.connect(self.manager)
+            player = await self.connect(self.player)
+            await self.send(player, "start_timer")
+            response = await player.receive_json_from()
+            self.assertDictEqual(response, {"type": "error", "error": "Can't start timer"})
+            await self.send(manager, "start_timer")
+            response = await player.receive_json_from()
+            self.assertEqual(response["type"], "start_timer")
+            await manager.disconnect()
+            await player.disconnect()
+        async_to_sync(scenario)()
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.status, pokerboard_models.Ticket.ONGOING)
+        self.assertIsNotNone(self.ticket.start_datetime)
+
+    def test_skip_moves_ticket_to_end(self):
+        """
+        Skipped ticket is placed after every other ticket of the pokerboard
+        """
+        G(pokerboard_models.Ticket, pokerboard=self.pokerboard, ticket_id="PP-2", order=2)
+
+        async def scenario():
+            manager = await self.connect(self.manager)
+            await self.send(manager, "skip")
+            response = await manager.receive_json_from()
+            self.assertDictEqual(response, {"type": "skip", "seq": 2})
+            await manager.disconnect()
+        async_to_sync(scenario)()
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.status, pokerboard_models.Ticket.SKIPPED)
+        self.assertEqual(self.ticket.order, 2 + pokerboard_constants.TICKET_ORDER_GAP)
+
+    def test_non_member_is_rejected(self):
+        """
+        Users not part of the pokerboard can't join its sessions
+        """
+        outsider = G(User, email="outsider@gmail.com")
+
+        async def scenario():
+            communicator = WebsocketCommunicator(
+                self.application, f"ws/session/{self.ticket.id}?pid={self.pokerboard.id}"
+            )
+            communicator.scope['user'] = outsider
+            connected, _ = await communicator.connect()
+            self.assertFalse(connected)
+        async_to_sync(scenario)()
+
+    @override_settings(POKERBOARD_DB_THREADS=2)
+    def test_queries_run_on_session_thread_pool(self):
+        """
+        Session queries run on the configured pool, not on the event loop thread
+        """
+        @session_queries.session_database_sync_to_async
+        def current_thread_name():
+            return threading.current_thread().name
+
+        self.assertTrue(async_to_sync(current_thread_name)().startswith('session-db'))
+        self.assertEqual(session_queries.get_executor()._max_workers, 2)
+
+
+@override_settings(JIRA_OUTBOX={'MAX_ATTEMPTS': 2, 'BACKOFF_SECONDS': 10, 'HOST_CONCURRENCY': 1})
+class JiraOutboxTestCases(APITestCase):
+    """
+    Test cases for pushing estimates and comments to Jira through the outbox
+    """
+    def setUp(self):
+        self.manager = G(User, email="manager@gmail.com")
+        self.token = G(Token, user=self.manager)
+        self.credentials = G(
+            pokerboard_models.ManagerCredentials, user=self.manager, url="https://team.atlassian.net"
+        )
+        self.pokerboard = G(pokerboard_models.Pokerboard, manager=self.manager, estimation_cards=[1, 2, 3])
+        self.ticket = G(pokerboard_models.Ticket, pokerboard=self.pokerboard, ticket_id="PP-1", order=1)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def enqueue_estimate(self, estimate=5, ticket=None):
+        return jira_outbox.enqueue(
+            self.manager.id, ticket or self.ticket, pokerboard_models.JiraOutbox.ESTIMATE,
+            {'estimate': estimate}
+        )
+
+    def test_enqueue_supersedes_pending_estimate(self):
+        """
+        A new estimate replaces the one still waiting to be sent
+        """
+        first = self.enqueue_estimate(3)
+        second = self.enqueue_estimate(5)
+        first.refresh_from_db()
+        self.assertEqual(first.status, pokerboard_models.JiraOutbox.SUPERSEDED)
+        self.assertEqual(second.status, pokerboard_models.JiraOutbox.PENDING)
+        self.assertEqual(second.host, "team.atlassian.net")
+
+    @patch('apps.pokerboard.jira_outbox.notify_session')
+    @patch('apps.pokerboard.jira_outbox.Jira')
+    def test_push_marks_entry_synced(self, jira, notify_session):
+        """
+        A successful push marks entry synced and notifies the session
+        """
+        entry = self.enqueue_estimate(5)
+        self.assertListEqual(jira_outbox.claim_due_entries(), [entry.id])
+        jira_outbox.push_entry(entry.id)
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, pokerboard_models.JiraOutbox.SYNCED)
+        jira.return_value.update_issue_field.assert_called_once_with("PP-1", {'customfield_10016': 5})
+        notify_session.assert_called_once_with(
+            self.ticket.id, {'ticket': self.ticket.id, 'action': 'estimate', 'type': 'jira_synced'}
+        )
+
+    @patch('apps.pokerboard.jira_outbox.notify_session')
+    @patch('apps.pokerboard.jira_outbox.Jira')
+    def test_failed_push_is_retried_then_failed(self, jira, notify_session):
+        """
+        A failing push backs off and is given up after MAX_ATTEMPTS
+        """
+        jira.return_value.update_issue_field.side_effect = ConnectionError("Jira is down")
+        entry = self.enqueue_estimate(5)
+        jira_outbox.claim_due_entries()
+        jira_outbox.push_entry(entry.id)
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, pokerboard_models.JiraOutbox.PENDING)
+        self.assertEqual(entry.attempts, 1)
+        self.assertGreater(entry.next_attempt_at, timezone.now() + timedelta(seconds=5))
+        self.assertListEqual(jira_outbox.claim_due_entries(), [])
+        notify_session.assert_not_called()
+
+        pokerboard_models.JiraOutbox.objects.filter(id=entry.id).update(next_attempt_at=timezone.now())
+        jira_outbox.claim_due_entries()
+        jira_outbox.push_entry(entry.id)
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, pokerboard_models.JiraOutbox.FAILED)
+        self.assertEqual(notify_session.call_args[0][1]['type'], 'jira_failed')
+
+    def test_claim_respects_host_concurrency(self):
+        """
+        No more than HOST_CONCURRENCY entries of a host are in flight
+        """
+        other_ticket = G(pokerboard_models.Ticket, pokerboard=self.pokerboard, ticket_id="PP-2", order=2)
+        first = self.enqueue_estimate(3)
+        second = self.enqueue_estimate(5, ticket=other_ticket)
+        self.assertListEqual(jira_outbox.claim_due_entries(), [first.id])
+        self.assertListEqual(jira_outbox.claim_due_entries(), [])
+        pokerboard_models.JiraOutbox.objects.filter(id=first.id).update(
+            status=pokerboard_models.JiraOutbox.SYNCED
+        )
+        self.assertListEqual(jira_outbox.claim_due_entries(), [second.id])
+
+    @patch('apps.pokerboard.jira_outbox.Jira')
+    def test_comment_is_queued_without_calling_jira(self, jira):
+        """
+        Posting a comment stores it in the outbox and returns immediately
+        """
+        data = {"ticket_id": self.ticket.id, "comment": "Needs design review"}
+        response = self.client.post(reverse('comment'), data=data)
+        self.assertEqual(response.status_code, 201)
+        jira.assert_not_called()
+        entry = pokerboard_models.JiraOutbox.objects.get(ticket=self.ticket)
+        self.assertEqual(entry.action, pokerboard_models.JiraOutbox.COMMENT)
+        self.assertDictEqual(entry.payload, {'comment': "Needs design review"})
+
+
+class SessionEstimateTestCases(SessionConsumerTestCase):
+    """
+    Test cases for finalising an estimate in the session consumer
+    """
+    @patch('apps.pokerboard.tasks.drain_jira_outbox.delay')
+    @patch('apps.pokerboard.jira_outbox.Jira')
+    def test_estimate_saved_and_broadcasted_before_jira_sync(self, jira, drain):
+        """
+        Estimate is committed and broadcasted without waiting for Jira
+        """
+        G(pokerboard_models.ManagerCredentials, user=self.manager, url="https://team.atlassian.net")
+
+        async def scenario():
+            manager = await self.connect(self.manager)
+            await self.send(manager, "estimate", {"estimate": 8})
+            response = await manager.receive_json_from()
+            self.assertEqual(response["type"], "estimate")
+            self.assertEqual(response["estimate"], 8)
+            await manager.disconnect()
+        async_to_sync(scenario)()
+        jira.assert_not_called()
+        drain.assert_called_once_with()
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.status, pokerboard_models.Ticket.ESTIMATED)
+        self.assertEqual(self.ticket.estimate, 8)
+        entry = pokerboard_models.JiraOutbox.objects.get(ticket=self.ticket)
+        self.assertEqual(entry.status, pokerboard_models.JiraOutbox.PENDING)
+
+
+class TicketVoteStateTestCases(TestCase):
+    """
+    Test cases for the in-memory vote tally of a ticket
+    """
+    def setUp(self):
+        self.state = TicketVoteState(1, cards=[1, 2, 3, 5, 8], votes={10: 3})
+
+    def test_tally_is_updated_on_every_vote(self):
+        """
+        Changing a vote moves it to the new card in the tally
+        """
+        self.state.apply(11, 5, persist=False)
+        self.state.apply(12, 5, persist=False)
+        self.state.apply(13, 8, persist=False)
+        self.assertDictEqual(self.state.tally(), {
+            'count': 4,
+            'distribution': {'3': 1, '5': 2, '8': 1},
+            'mean': 5.25,
+            'median': 5,
+            'mode': 5,
+        })
+        self.state.apply(13, 3, persist=False)
+        self.state.apply(12, 1, persist=False)
+        self.assertDictEqual(self.state.tally(), {
+            'count': 4,
+            'distribution': {'1': 1, '3': 2, '5': 1},
+            'mean': 3,
+            'median': 3,
+            'mode': 3,
+        })
+
+    def test_empty_tally(self):
+        """
+        A ticket without votes has no statistics
+        """
+        self.assertEqual(TicketVoteState(1).tally()['mean'], None)
+
+    def test_estimate_must_be_a_card(self):
+        """
+        Estimates outside estimation cards are rejected
+        """
+        self.assertEqual(self.state.validate("5"), 5)
+        for estimate in (4, -1, "five", None):
+            with self.assertRaises(serializers.ValidationError):
+                self.state.validate(estimate)
+
+    def test_remote_vote_replaces_pending_local_vote(self):
+        """
+        A newer vote of the same user from another worker is not overwritten by our flush
+        """
+        self.state.dirty[11] = 5
+        self.state.apply(11, 8, persist=False)
+        self.assertDictEqual(self.state.dirty, {})
+
+
+@override_settings(POKERBOARD_VOTE_FLUSH_INTERVAL_MS=50)
+class SessionVoteBatchingTestCases(SessionConsumerTestCase):
+    """
+    Test cases for write-behind persistence of votes
+    """
+    def test_votes_are_persisted_in_batches(self):
+        """
+        Votes are broadcasted at once and stored in one batch after the flush interval
+        """
+        async def scenario():
+            manager = await self.connect(self.manager)
+            player = await self.connect(self.player)
+            with patch.object(
+                session_queries, 'save_votes', wraps=session_queries.save_votes
+            ) as save_votes:
+                await self.send(player, "vote", {"estimate": 2})
+                await self.send(player, "vote", {"estimate": 3})
+                await self.send(manager, "vote", {"estimate": 8})
+                for _ in range(3):
+                    await manager.receive_json_from()
+                await asyncio.sleep(0.2)
+                save_votes.assert_called_once_with(
+                    self.ticket.id, {self.player.id: 3, self.manager.id: 8}
+                )
+            await manager.disconnect()
+            await player.disconnect()
+        async_to_sync(scenario)()
+        self.assertDictEqual(
+            dict(pokerboard_models.UserTicketEstimate.objects.values_list('user_id', 'estimate')),
+            {self.player.id: 3, self.manager.id: 8}
+        )
+
+    @override_settings(POKERBOARD_VOTE_FLUSH_INTERVAL_MS=60000)
+    def test_votes_are_persisted_on_disconnect(self):
+        """
+        Pending votes are written when the session is left
+        """
+        G(pokerboard_models.UserTicketEstimate, ticket_id=self.ticket, user=self.player, estimate=1)
+
+        async def scenario():
+            player = await self.connect(self.player)
+            await self.send(player, "vote", {"estimate": 5})
+            await player.receive_json_from()
+            await player.disconnect()
+        async_to_sync(scenario)()
+        vote = pokerboard_models.UserTicketEstimate.objects.get(ticket_id=self.ticket)
+        self.assertEqual(vote.estimate, 5)
+
+    @override_settings(POKERBOARD_VOTE_FLUSH_INTERVAL_MS=60000)
+    def test_failing_flush_still_leaves_the_session(self):
+        """
+        A vote batch failing to be saved on disconnect is kept for later, the user still leaves
+        """
+        async def scenario():
+            manager = await self.connect(self.manager)
+            player = await self.connect(self.player)
+            await self.send(player, "vote", {"estimate": 5})
+            await self.drain()
+            with patch.object(session_queries, 'save_votes', side_effect=RuntimeError), \
+                    self.assertLogs('apps.pokerboard.tally'):
+                await player.disconnect()
+            response = await manager.receive_json_from()
+            self.assertDictEqual(response, {"type": "leave", "user": self.player.id, "seq": 4})
+            self.assertListEqual(await get_presence_store().members('session_%s' % self.ticket.id), [self.manager.id])
+            self.assertDictEqual(tally.registry.states[self.ticket.id].dirty, {self.player.id: 5})
+            await manager.disconnect()
+        async_to_sync(scenario)()
+        self.assertEqual(pokerboard_models.UserTicketEstimate.objects.get().estimate, 5)
+
+    def test_invalid_vote_is_rejected(self):
+        """
+        A vote which is not an estimation card gets an error
+        """
+        async def scenario():
+            player = await self.connect(self.player)
+            await self.send(player, "vote", {"estimate": 4})
+            response = await player.receive_json_from()
+            self.assertDictEqual(response, {"type": "error", "error": "Invalid estimate"})
+            await player.disconnect()
+        async_to_sync(scenario)()
+        self.assertFalse(pokerboard_models.UserTicketEstimate.objects.exists())
+
+
+class SessionEncodingTestCases(SessionConsumerTestCase):
+    """
+    Test cases for broadcasts being encoded once per group_send
+    """
+    def test_broadcast_is_encoded_once(self):
+        """
+        A vote sent to several sockets is serialised a single time
+        """
+        async def scenario():
+            manager = await self.connect(self.manager)
+            player = await self.connect(self.player)
+            second_tab = await self.connect(self.player)
+            with patch.object(encoding, 'dumps', wraps=encoding.dumps) as dumps:
+                await self.send(player, "vote", {"estimate": 3})
+                for communicator in (manager, player, second_tab):
+                    response = await communicator.receive_json_from()
+                    self.assertEqual(response["vote"]["estimate"], 3)
+                self.assertEqual(dumps.call_count, 1)
+            for communicator in (manager, player, second_tab):
+                await communicator.disconnect()
+        async_to_sync(scenario)()
+
+    @override_settings(POKERBOARD_BINARY_FRAMES=True)
+    def test_msgpack_subprotocol_receives_binary_frames(self):
+        """
+        Clients negotiating the msgpack subprotocol get binary frames, others get text
+        """
+        async def scenario():
+            manager = await self.connect(self.manager)
+            player = await self.connect(self.player, subprotocols=[encoding.MSGPACK_SUBPROTOCOL])
+            await player.send_to(bytes_data=encoding.pack({"message_type": "vote", "message": {"estimate": 8}}))
+            response = await player.receive_output()
+            self.assertEqual(response["type"], "websocket.send")
+            vote = encoding.unpack(response["bytes"])
+            self.assertEqual(vote["vote"]["estimate"], 8)
+            self.assertEqual((await manager.receive_json_from())["vote"], vote["vote"])
+            await manager.disconnect()
+            await player.disconnect()
+        async_to_sync(scenario)()
+
+    def test_binary_frames_disabled_by_default(self):
+        """
+        The msgpack subprotocol is not accepted unless binary frames are enabled
+        """
+        async def scenario():
+            communicator = WebsocketCommunicator(
+                self.application, f"ws/session/{self.ticket.id}",
+                subprotocols=[encoding.MSGPACK_SUBPROTOCOL]
+            )
+            communicator.scope['user'] = self.player
+            connected, subprotocol = await communicator.connect()
+            self.assertTrue(connected)
+            self.assertIsNone(subprotocol)
+            await communicator.disconnect()
+        async_to_sync(scenario)()
+
+
+class SessionResumeTestCases(SessionConsumerTestCase):
+    """
+    Test cases for versioned snapshots and resuming a session
+    """
+    def test_snapshot_is_sent_to_requester_only(self):
+        """
+        initialise_game is answered with a snapshot tagged with current sequence number
+        """
+        async def scenario():
+            manager = await self.connect(self.manager)
+            player = await self.connect(self.player)
+            await self.send(player, "vote", {"estimate": 3})
+            await self.drain()
+            await self.send(player, "initialise_game")
+            response = await player.receive_json_from()
+            self.assertEqual(response["type"], "initialise_game")
+            self.assertEqual(response["seq"], 3)
+            self.assertListEqual(
+                [(vote["user"]["id"], vote["estimate"]) for vote in response["votes"]],
+                [(self.player.id, 3)]
+            )
+            self.assertTrue(await manager.receive_nothing())
+            await manager.disconnect()
+            await player.disconnect()
+        async_to_sync(scenario)()
+
+    def test_reconnecting_client_gets_missed_events(self):
+        """
+        A client sending last_seq only gets the events it missed
+        """
+        async def scenario():
+            manager = await self.connect(self.manager)
+            player = await self.connect(self.player)
+            await player.disconnect()
+            await self.send(manager, "vote", {"estimate": 5})
+            await self.send(manager, "start_timer")
+            await self.drain()
+            player = await self.connect(self.player)
+            await self.send(player, "initialise_game", {"last_seq": 2})
+            response = await player.receive_json_from()
+            self.assertEqual(response["type"], "resume")
+            self.assertEqual(response["seq"], 6)
+            self.assertListEqual(
+                [event["type"] for event in response["events"]],
+                ["leave", "vote", "start_timer", "join"]
+            )
+            self.assertListEqual([event["seq"] for event in response["events"]], [3, 4, 5, 6])
+            await manager.disconnect()
+            await player.disconnect()
+        async_to_sync(scenario)()
+
+    @override_settings(POKERBOARD_EVENT_LOG={**TEST_EVENT_LOG, "CONFIG": {"size": 2}})
+    def test_large_gap_falls_back_to_snapshot(self):
+        """
+        A snapshot is sent when missed events are not buffered anymore
+        """
+        async def scenario():
+            manager = await self.connect(self.manager)
+            for estimate in (1, 2, 3):
+                await self.send(manager, "vote", {"estimate": estimate})
+            await self.drain()
+            await self.send(manager, "initialise_game", {"last_seq": 1})
+            response = await manager.receive_json_from()
+            self.assertEqual(response["type"], "initialise_game")
+            self.assertEqual(response["seq"], 4)
+            await manager.disconnect()
+        async_to_sync(scenario)()
+
+
+class SessionVoteCoalescingTestCases(SessionConsumerTestCase):
+    """
+    Test cases for merging vote broadcasts of a pokerboard with a coalesce window
+    """
+    def setUp(self):
+        super().setUp()
+        self.third = G(User, email="third@gmail.com")
+        G(pokerboard_models.PokerboardUser, user=self.third, pokerboard=self.pokerboard)
+        metrics.reset()
+
+    def coalesce(self, window, batch_size=50):
+        pokerboard_models.Pokerboard.objects.filter(id=self.pokerboard.id).update(
+            vote_coalesce_window=window, vote_batch_size=batch_size
+        )
+
+    def test_votes_in_window_are_broadcasted_together(self):
+        """
+        Votes placed within the window reach participants as one votes event
+        """
+        self.coalesce(window=100)
+
+        async def scenario():
+            manager = await self.connect(self.manager)
+            player = await self.connect(self.player)
+            await self.send(player, "vote", {"estimate": 2})
+            await self.send(manager, "vote", {"estimate": 5})
+            await self.send(player, "vote", {"estimate": 3})
+            response = await manager.receive_json_from()
+            self.assertEqual(response["type"], "votes")
+            self.assertListEqual(
+                [(vote["user"]["id"], vote["estimate"]) for vote in response["votes"]],
+                [(self.manager.id, 5), (self.player.id, 3)]
+            )
+            self.assertTrue(await manager.receive_nothing(timeout=0.2))
+            await manager.disconnect()
+            await player.disconnect()
+        async_to_sync(scenario)()
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(counters['session.votes'], 3)
+        self.assertEqual(counters['session.vote_broadcasts'], 1)
+
+    def test_full_batch_is_broadcasted_without_waiting(self):
+        """
+        A batch reaching vote_batch_size is sent before the window ends, the
+        rest is sent when a participant leaves
+        """
+        self.coalesce(window=60000, batch_size=2)
+
+        async def scenario():
+            manager = await self.connect(self.manager)
+            player = await self.connect(self.player)
+            third = await self.connect(self.third)
+            await self.send(player, "vote", {"estimate": 2})
+            await self.send(third, "vote", {"estimate": 8})
+            await self.send(manager, "vote", {"estimate": 1})
+            response = await manager.receive_json_from()
+            self.assertEqual(len(response["votes"]), 2)
+            self.assertTrue(await manager.receive_nothing(timeout=0.2))
+            self.assertEqual(len((await player.receive_json_from())["votes"]), 2)
+            await manager.disconnect()
+            response = await player.receive_json_from()
+            self.assertEqual(response["type"], "votes")
+            self.assertListEqual([vote["estimate"] for vote in response["votes"]], [1])
+            self.assertEqual((await player.receive_json_from())["type"], "leave")
+            await player.disconnect()
+            await third.disconnect()
+        async_to_sync(scenario)()
+
+
+class SessionTimerTestCases(SessionConsumerTestCase):
+    """
+    Test cases for the server side voting timer
+    """
+    def setUp(self):
+        super().setUp()
+        pokerboard_models.Pokerboard.objects.filter(id=self.pokerboard.id).update(timer=1)
+
+    def test_timer_expiry_is_broadcasted_and_closes_votes(self):
+        """
+        timer_expired is sent once when the timer is over, later votes are rejected
+        """
+        async def scenario():
+            manager = await self.connect(self.manager)
+            player = await self.connect(self.player)
+            await self.send(manager, "start_timer")
+            response = await player.receive_json_from()
+            self.assertEqual(response["type"], "start_timer")
+            self.assertEqual(response["timer"], 1)
+            response = await player.receive_json_from(timeout=3)
+            self.assertDictEqual(
+                response, {"type": "timer_expired", "ticket": self.ticket.id, "seq": 4}
+            )
+            await manager.receive_json_from()
+            self.assertEqual((await manager.receive_json_from())["type"], "timer_expired")
+            self.assertTrue(await manager.receive_nothing(timeout=0.2))
+            with patch.object(session_queries, 'save_votes') as save_votes:
+                await self.send(player, "vote", {"estimate": 3})
+                response = await player.receive_json_from()
+                self.assertDictEqual(response, {"type": "error", "error": "Voting time is over"})
+                await manager.disconnect()
+                await player.disconnect()
+                save_votes.assert_not_called()
+        async_to_sync(scenario)()
+
+    def test_timer_is_rescheduled_from_start_datetime(self):
+        """
+        A worker loading a running ticket schedules its expiry from start_datetime
+        """
+        pokerboard_models.Ticket.objects.filter(id=self.ticket.id).update(
+            status=pokerboard_models.Ticket.ONGOING,
+            start_datetime=timezone.now() - timedelta(seconds=0.5)
+        )
+
+        async def scenario():
+            player = await self.connect(self.player)
+            response = await player.receive_json_from(timeout=3)
+            self.assertEqual(response["type"], "timer_expired")
+            await player.disconnect()
+        async_to_sync(scenario)()
+
+    def test_expired_timer_in_snapshot(self):
+        """
+        Clients joining after the timer expired are told in the snapshot
+        """
+        pokerboard_models.Ticket.objects.filter(id=self.ticket.id).update(
+            status=pokerboard_models.Ticket.ONGOING,
+            start_datetime=timezone.now() - timedelta(hours=1)
+        )
+
+        async def scenario():
+            player = await self.connect(self.player)
+            await self.send(player, "initialise_game")
+            response = await player.receive_json_from()
+            self.assertTrue(response["expired"])
+            await player.disconnect()
+        async_to_sync(scenario)()
+
+
+class SessionAccessCacheTestCases(APITestCase):
+    """
+    Test cases for the cache of session authorization lookups
+    """
+    def setUp(self):
+        cache.clear()
+        self.manager = G(User, email="manager@gmail.com")
+        self.player = G(User, email="player@gmail.com")
+        self.outsider = G(User, email="outsider@gmail.com")
+        self.pokerboard = G(pokerboard_models.Pokerboard, manager=self.manager)
+        self.membership = G(pokerboard_models.PokerboardUser, user=self.player, pokerboard=self.pokerboard)
+        self.ticket = G(pokerboard_models.Ticket, pokerboard=self.pokerboard, ticket_id="PP-1", order=1)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + G(Token, user=self.manager).key)
+
+    def access(self, user):
+        """
+        Runs the lookup of SessionConsumer.connect on the test's connection
+        """
+        return session_queries.get_session_access.__wrapped__(self.ticket.id, user.id)
+
+    def test_cached_access_needs_no_queries(self):
+        """
+        Once cached, authorizing members and non members needs no query
+        """
+        self.access(self.player)
+        self.access(self.outsider)
+        with self.assertNumQueries(0):
+            pokerboard_id, manager_id, allowed, member = self.access(self.player)
+            self.assertEqual((pokerboard_id, manager_id, allowed), (self.pokerboard.id, self.manager.id, True))
+            self.assertEqual(member["user"]["id"], self.player.id)
+            self.assertFalse(self.access(self.outsider)[2])
+
+    def test_removed_member_is_invalidated(self):
+        """
+        A member removed from the pokerboard can't join anymore
+        """
+        self.assertTrue(self.access(self.player)[2])
+        response = self.client.delete(reverse('pokerboarduser-detail', args=[self.membership.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(self.access(self.player)[2])
+
+    def test_accepted_invite_is_invalidated(self):
+        """
+        A user accepting an invite can join right away
+        """
+        self.assertFalse(self.access(self.outsider)[2])
+        invite = G(
+            pokerboard_models.Invite, user=self.outsider, pokerboard=self.pokerboard, group=None,
+            status=pokerboard_models.Invite.PENDING
+        )
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + G(Token, user=self.outsider).key)
+        response = self.client.patch(reverse('invite-detail', args=[invite.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(self.access(self.outsider)[2])
+
+    def test_deleted_pokerboard_is_invalidated(self):
+        """
+        Sessions of a deleted pokerboard can't be joined
+        """
+        self.assertTrue(self.access(self.manager)[2])
+        response = self.client.delete(reverse('pokerboard-detail', args=[self.pokerboard.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(self.access(self.manager)[2])
+
+
+class BoardConsumerTestCases(SessionConsumerTestCase):
+    """
+    Test cases for the pokerboard level websocket switching tickets
+    """
+    def setUp(self):
+        super().setUp()
+        self.next_ticket = G(
+            pokerboard_models.Ticket, pokerboard=self.pokerboard, ticket_id="PP-2", order=2,
+            status=pokerboard_models.Ticket.UNTOUCHED, start_datetime=None
+        )
+        self.application = URLRouter([
+            path("ws/session/<int:id>", SessionConsumer.as_asgi()),
+            path("ws/board/<int:id>", BoardConsumer.as_asgi()),
+        ])
+
+    async def connect_board(self, user, drain=True):
+        communicator = WebsocketCommunicator(self.application, f"ws/board/{self.pokerboard.id}")
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.communicators.append(communicator)
+        if drain:
+            await self.drain()
+        return communicator
+
+    def test_switching_tickets_without_reconnecting(self):
+        """
+        A board connection votes on the selected ticket and moves to the next one
+        """
+        async def scenario():
+            manager = await self.connect_board(self.manager)
+            player = await self.connect_board(self.player)
+            await self.send(player, "select_ticket", {"ticket": self.ticket.id})
+            response = await player.receive_json_from()
+            self.assertEqual(response["type"], "initialise_game")
+            self.assertCountEqual(
+                [member["user"]["id"] for member in response["users"]], [self.manager.id, self.player.id]
+            )
+            await self.send(player, "vote", {"estimate": 5})
+            self.assertEqual((await player.receive_json_from())["vote"]["ticket_id"], self.ticket.id)
+            self.assertTrue(await manager.receive_nothing())
+
+            await self.send(manager, "select_ticket", {"ticket": self.next_ticket.id})
+            self.assertListEqual((await manager.receive_json_from())["votes"], [])
+            self.assertEqual((await manager.receive_json_from())["type"], "ticket_selected")
+            response = await player.receive_json_from()
+            self.assertDictEqual(response, {
+                "type": "ticket_selected", "ticket": self.next_ticket.id, "stream": "board", "seq": 3
+            })
+            await self.send(player, "select_ticket", {"ticket": self.next_ticket.id})
+            await player.receive_json_from()
+            session = await self.connect(self.player, ticket=self.next_ticket)
+            await self.send(player, "vote", {"estimate": 8})
+            for communicator in (manager, player, session):
+                response = await communicator.receive_json_from()
+                self.assertEqual(response["vote"]["ticket_id"], self.next_ticket.id)
+            for communicator in (manager, player, session):
+                await communicator.disconnect()
+        async_to_sync(scenario)()
+        self.assertDictEqual(
+            dict(pokerboard_models.UserTicketEstimate.objects.values_list('ticket_id', 'estimate')),
+            {self.ticket.id: 5, self.next_ticket.id: 8}
+        )
+
+    def test_presence_is_kept_per_board(self):
+        """
+        Joining the board is broadcasted to board connections, whichever ticket they are on
+        """
+        async def scenario():
+            manager = await self.connect_board(self.manager)
+            await self.send(manager, "select_ticket", {"ticket": self.ticket.id})
+            await self.drain()
+            player = await self.connect_board(self.player, drain=False)
+            response = await manager.receive_json_from()
+            self.assertEqual(response["type"], "join")
+            self.assertEqual(response["user"]["user"]["id"], self.player.id)
+            await player.disconnect()
+            self.assertDictEqual(
+                await manager.receive_json_from(),
+                {"type": "leave", "user": self.player.id, "stream": "board", "seq": 4}
+            )
+            await manager.disconnect()
+        async_to_sync(scenario)()
+
+    def test_reconnecting_board_client_resumes_both_streams(self):
+        """
+        A board client sending last_seq and last_board_seq gets the missed events of the ticket and the board
+        """
+        async def scenario():
+            manager = await self.connect_board(self.manager)
+            await self.send(manager, "select_ticket", {"ticket": self.ticket.id})
+            player = await self.connect_board(self.player)
+            await self.send(player, "select_ticket", {"ticket": self.ticket.id})
+            state = await player.receive_json_from()
+            self.assertEqual((state["seq"], state["board_seq"]), (0, 3))
+            await player.disconnect()
+            await self.send(manager, "vote", {"estimate": 5})
+            await self.drain()
+
+            player = await self.connect_board(self.player)
+            await self.send(player, "select_ticket", {
+                "ticket": self.ticket.id, "last_seq": state["seq"], "last_board_seq": state["board_seq"]
+            })
+            response = await player.receive_json_from()
+            self.assertEqual(response["type"], "resume")
+            self.assertEqual((response["seq"], response["board_seq"]), (1, 5))
+            self.assertListEqual(
+                [(event.get("stream"), event["type"], event["seq"]) for event in response["events"]],
+                [(None, "vote", 1), ("board", "leave", 4), ("board", "join", 5)]
+            )
+            await self.send(player, "select_ticket", {"ticket": self.ticket.id, "last_seq": 0})
+            self.assertEqual((await player.receive_json_from())["type"], "initialise_game")
+            await manager.disconnect()
+            await player.disconnect()
+        async_to_sync(scenario)()
+
+    def test_ticket_must_be_selected_and_on_the_board(self):
+        """
+        Ticket messages need a selected ticket of the connection's pokerboard
+        """
+        other_ticket = G(pokerboard_models.Ticket, ticket_id="XX-1", order=1)
+
+        async def scenario():
+            player = await self.connect_board(self.player)
+            await self.send(player, "vote", {"estimate": 5})
+            self.assertDictEqual(
+                await player.receive_json_from(), {"type": "error", "error": "Select a ticket first"}
+            )
+            await self.send(player, "select_ticket", {"ticket": other_ticket.id})
+            self.assertDictEqual(
+                await player.receive_json_from(),
+                {"type": "error", "error": "Ticket is not part of this pokerboard"}
+            )
+            await player.disconnect()
+        async_to_sync(scenario)()
+
+    def test_non_member_is_rejected(self):
+        """
+        Users not part of the pokerboard can't open its board connection
+        """
+        outsider = G(User, email="outsider@gmail.com")
+
+        async def scenario():
+            communicator = WebsocketCommunicator(self.application, f"ws/board/{self.pokerboard.id}")
+            communicator.scope['user'] = outsider
+            connected, _ = await communicator.connect()
+            self.assertFalse(connected)
+        async_to_sync(scenario)()
+
+
+class SessionMessageValidationTestCases(SessionConsumerTestCase):
+    """
+    Test cases for validating and rate limiting messages received from clients
+    """
+    def test_only_declared_message_types_are_dispatched(self):
+        """
+        Message types outside the dispatch table, like consumer internals, are rejected
+        """
+        async def scenario():
+            player = await self.connect(self.player)
+            for message_type in ("disconnect", "broadcast", "select_ticket"):
+                await self.send(player, message_type)
+                self.assertDictEqual(
+                    await player.receive_json_from(), {"type": "error", "error": "Invalid message"}
+                )
+            await player.send_to(text_data="not json")
+            self.assertDictEqual(await player.receive_json_from(), {"type": "error", "error": "Invalid message"})
+            await player.send_json_to({"message_type": "vote", "message": [5]})
+            self.assertDictEqual(await player.receive_json_from(), {"type": "error", "error": "Invalid message"})
+            await player.disconnect()
+        async_to_sync(scenario)()
+
+    @override_settings(POKERBOARD_MAX_FRAME_BYTES=64)
+    def test_large_frame_is_rejected(self):
+        """
+        Frames above the size limit are rejected without being parsed
+        """
+        async def scenario():
+            player = await self.connect(self.player)
+            with patch.object(encoding, 'loads') as loads:
+                await self.send(player, "vote", {"estimate": 5, "padding": "x" * 64})
+                self.assertDictEqual(
+                    await player.receive_json_from(), {"type": "error", "error": "Message too large"}
+                )
+                loads.assert_not_called()
+            await player.disconnect()
+        async_to_sync(scenario)()
+
+    @override_settings(POKERBOARD_RATE_LIMITS={
+        "default": {"rate": 100, "burst": 100}, "vote": {"rate": 0.1, "burst": 2}
+    })
+    def test_flood_is_throttled(self):
+        """
+        Messages above the rate of their type get an error frame and are not handled
+        """
+        async def scenario():
+            player = await self.connect(self.player)
+            for estimate in (1, 2):
+                await self.send(player, "vote", {"estimate": estimate})
+                self.assertEqual((await player.receive_json_from())["type"], "vote")
+            with patch.object(TicketVoteState, 'validate') as validate:
+                await self.send(player, "vote", {"estimate": 3})
+                response = await player.receive_json_from()
+                self.assertEqual(response["error"], "Too many messages")
+                self.assertGreater(response["retry_after"], 0)
+                validate.assert_not_called()
+            await self.send(player, "initialise_game")
+            self.assertEqual((await player.receive_json_from())["type"], "initialise_game")
+            await player.disconnect()
+        async_to_sync(scenario)()
+        vote = pokerboard_models.UserTicketEstimate.objects.get(ticket_id=self.ticket)
+        self.assertEqual(vote.estimate, 2)
+
+
+class RateLimiterTestCases(TestCase):
+    """
+    Test cases for token bucket rate limiting
+    """
+    def test_burst_then_refill(self):
+        """
+        A bucket allows its burst at once, then refills at its rate
+        """
+        with patch('libs.rate_limit.time.monotonic', return_value=100.0):
+            limiter = RateLimiter({"default": {"rate": 10, "burst": 2}})
+            self.assertEqual(limiter.throttle("vote"), 0)
+            self.assertEqual(limiter.throttle("skip"), 0)
+            self.assertAlmostEqual(limiter.throttle("vote"), 0.1)
+        with patch('libs.rate_limit.time.monotonic', return_value=100.5):
+            self.assertEqual(limiter.throttle("vote"), 0)
+
+    def test_limits_must_refill(self):
+        """
+        Limits with a rate of 0 or a burst below 1 are rejected when loaded
+        """
+        for limit in ({"rate": 0, "burst": 5}, {"rate": -1, "burst": 5}, {"rate": 1, "burst": 0}):
+            with self.assertRaisesMessage(ValueError, 'Invalid rate limit "vote"'):
+                RateLimiter({"default": {"rate": 10, "burst": 20}, "vote": limit})
+
+
+class SessionOutboundQueueTestCases(SessionConsumerTestCase):
+    """
+    Test cases for the frames queued for slow clients
+    """
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        test = self
+
+        async def write(consumer, frame):
+            # The player's client stops reading until released
+            if consumer.user.id == test.player.id:
+                await test.released.wait()
+            await consumer.send(**frame)
+        self.write = write
+
+    async def stall_player(self):
+        """
+        Connects manager and a stalled player, the player's join is stuck being written
+        """
+        self.released = asyncio.Event()
+        manager = await self.connect(self.manager)
+        player = await self.connect(self.player, drain=False)
+        await self.drain()
+        return manager, player
+
+    async def vote(self, manager, player, estimates):
+        for estimate in estimates:
+            await self.send(manager, "vote", {"estimate": estimate})
+            self.assertEqual((await manager.receive_json_from())["vote"]["estimate"], estimate)
+        self.assertTrue(await player.receive_nothing(timeout=0.1))
+
+    @override_settings(POKERBOARD_OUTBOUND_QUEUE={"size": 3, "policy": "close"})
+    def test_stalled_client_is_closed(self):
+        """
+        A client falling behind is disconnected with the resync code, others still get every frame
+        """
+        async def scenario():
+            with patch.object(SessionConsumer, 'write', self.write):
+                manager, player = await self.stall_player()
+                await self.vote(manager, player, [1, 2, 3])
+                await self.send(manager, "vote", {"estimate": 5})
+                self.assertEqual((await manager.receive_json_from())["vote"]["estimate"], 5)
+                self.assertDictEqual(
+                    await player.receive_output(), {"type": "websocket.close", "code": 4000}
+                )
+                await manager.disconnect()
+        async_to_sync(scenario)()
+        self.assertEqual(metrics.snapshot()["counters"]["session.outbound_closed"], 1)
+
+    @override_settings(POKERBOARD_OUTBOUND_QUEUE={"size": 3, "policy": "snapshot"})
+    def test_stalled_client_frames_collapse_into_snapshot(self):
+        """
+        Frames a client falls behind on are replaced by the session state
+        """
+        async def scenario():
+            with patch.object(SessionConsumer, 'write', self.write):
+                manager, player = await self.stall_player()
+                await self.vote(manager, player, [1, 2, 3, 5, 8])
+                self.released.set()
+                self.assertEqual((await player.receive_json_from())["type"], "join")
+                snapshot = await player.receive_json_from()
+                self.assertEqual(snapshot["type"], "initialise_game")
+                self.assertEqual([vote["estimate"] for vote in snapshot["votes"]], [8])
+                self.assertEqual((await player.receive_json_from())["vote"]["estimate"], 8)
+                self.assertTrue(await player.receive_nothing())
+                for communicator in (manager, player):
+                    await communicator.disconnect()
+        async_to_sync(scenario)()
+        self.assertEqual(metrics.snapshot()["counters"]["session.outbound_collapsed"], 4)
+
+    @override_settings(POKERBOARD_OUTBOUND_QUEUE={"size": 3, "policy": "drop_votes"})
+    def test_stalled_client_skips_superseded_votes(self):
+        """
+        Votes replaced by a later vote of the same user are dropped for a client falling behind
+        """
+        async def scenario():
+            with patch.object(SessionConsumer, 'write', self.write):
+                manager, player = await self.stall_player()
+                await self.vote(manager, player, [1, 2, 3, 5, 8])
+                self.released.set()
+                self.assertEqual((await player.receive_json_from())["type"], "join")
+                for estimate in (5, 8):
+                    self.assertEqual((await player.receive_json_from())["vote"]["estimate"], estimate)
+                self.assertTrue(await player.receive_nothing())
+                for communicator in (manager, player):
+                    await communicator.disconnect()
+        async_to_sync(scenario)()
+        self.assertEqual(metrics.snapshot()["counters"]["session.outbound_dropped"], 3)
+
+    @override_settings(POKERBOARD_OUTBOUND_QUEUE={"size": 3, "policy": "snapshot"})
+    def test_collapse_keeps_estimate(self):
+        """
+        Events a snapshot doesn't hold, like the final estimate, are still sent after it
+        """
+        async def scenario():
+            with patch.object(SessionConsumer, 'write', self.write):
+                manager, player = await self.stall_player()
+                await self.vote(manager, player, [1, 2, 3])
+                await self.send(manager, "estimate", {"estimate": 3})
+                self.assertEqual((await manager.receive_json_from())["type"], "estimate")
+                await self.vote(manager, player, [5, 8])
+                self.released.set()
+                self.assertListEqual(
+                    [(await player.receive_json_from())["type"] for _ in range(3)],
+                    ["join", "initialise_game", "estimate"]
+                )
+                self.assertTrue(await player.receive_nothing())
+                for communicator in (manager, player):
+                    await communicator.disconnect()
+        async_to_sync(scenario)()
+        self.assertEqual(metrics.snapshot()["counters"]["session.outbound_collapsed"], 6)
+
+    async def receive(self, communicator, pong=True):
+        """
+        Next message of a client, answering pings when pong
+        """
+        while True:
+            response = await communicator.receive_json_from()
+            if response["type"] != "ping" or not pong:
+                return response
+            await self.send(communicator, "pong")
+
+    @override_settings(POKERBOARD_OUTBOUND_QUEUE={"size": 3, "policy": "close", "window": 2})
+    def test_frames_not_acknowledged_are_bounded(self):
+        """
+        Frames handed to the server count until a pong acknowledges them, a client not answering is closed
+        """
+        async def scenario():
+            manager = await self.connect(self.manager, drain=False)
+            self.assertEqual((await self.receive(manager))["type"], "join")
+            player = await self.connect(self.player, drain=False)
+            self.assertEqual((await self.receive(manager))["type"], "join")
+            for estimate in (1, 2, 3, 5, 8):
+                await self.send(manager, "vote", {"estimate": estimate})
+                self.assertEqual((await self.receive(manager))["vote"]["estimate"], estimate)
+            self.assertListEqual(
+                [(await self.receive(player, pong=False))["type"] for _ in range(4)],
+                ["join", "ping", "vote", "ping"]
+            )
+            self.assertDictEqual(await player.receive_output(), {"type": "websocket.close", "code": 4000})
+            await manager.disconnect()
+        async_to_sync(scenario)()
+
+    @override_settings(POKERBOARD_OUTBOUND_QUEUE={"size": 3, "policy": "close", "window": 2})
+    def test_pongs_acknowledge_frames(self):
+        """
+        A client answering pings gets every frame
+        """
+        async def scenario():
+            manager = await self.connect(self.manager, drain=False)
+            player = await self.connect(self.player, drain=False)
+            for communicator in (manager, player):
+                self.assertEqual((await self.receive(communicator))["type"], "join")
+            self.assertEqual((await self.receive(manager))["type"], "join")
+            for estimate in (1, 2, 3, 5, 8):
+                await self.send(manager, "vote", {"estimate": estimate})
+                for communicator in (manager, player):
+                    self.assertEqual((await self.receive(communicator))["vote"]["estimate"], estimate)
+            for communicator in (manager, player):
+                await communicator.disconnect()
+        async_to_sync(scenario)()
+
+
+class SessionHeartbeatTestCases(SessionConsumerTestCase):
+    """
+    Test cases for heartbeats and reaping presence of dead connections
+    """
+    def test_client_ping_gets_pong(self):
+        """
+        Clients can check the connection is alive
+        """
+        async def scenario():
+            player = await self.connect(self.player)
+            await self.send(player, "ping")
+            self.assertDictEqual(await player.receive_json_from(), {"type": "pong"})
+            await self.send(player, "pong")
+            self.assertTrue(await player.receive_nothing())
+            await player.disconnect()
+        async_to_sync(scenario)()
+
+    @override_settings(POKERBOARD_HEARTBEAT={"interval": 0.1, "timeout": 0.25})
+    def test_silent_client_is_closed(self):
+        """
+        The server pings clients and closes connections not answering
+        """
+        async def scenario():
+            player = await self.connect(self.player, drain=False)
+            self.assertEqual((await player.receive_json_from())["type"], "join")
+            self.assertDictEqual(await player.receive_json_from(), {"type": "ping"})
+            await self.send(player, "pong")
+            for _ in range(2):
+                self.assertDictEqual(await player.receive_json_from(), {"type": "ping"})
+            self.assertDictEqual(await player.receive_output(), {"type": "websocket.close", "code": 4001})
+        async_to_sync(scenario)()
+
+    def test_reaper_removes_ghosts(self):
+        """
+        Users whose connections died without closing are removed and announced like a disconnect
+        """
+        async def scenario():
+            player = await self.connect(self.player)
+            group = 'session_%s' % self.ticket.id
+            with patch('apps.pokerboard.presence.time.time', return_value=0):
+                await get_presence_store().join(group, self.manager.id, 'ghost.a')
+                await get_presence_store().join(group, 1000, 'ghost.b')
+            await presence.reap_stale(get_channel_layer())
+            self.assertDictEqual(
+                await player.receive_json_from(),
+                {"type": "leave", "users": sorted([self.manager.id, 1000]), "seq": 2}
+            )
+            self.assertListEqual(await get_presence_store().members(group), [self.player.id])
+            await presence.reap_stale(get_channel_layer())
+            self.assertTrue(await player.receive_nothing())
+            await player.disconnect()
+        async_to_sync(scenario)()
+
+    def test_reaper_discards_board_ghost_from_its_ticket(self):
+        """
+        A dead board connection leaves the board and the session of its selected ticket
+        """
+        application = URLRouter([path("ws/board/<int:id>", BoardConsumer.as_asgi())])
+
+        async def scenario():
+            with patch('apps.pokerboard.presence.time.time', return_value=0):
+                ghost = WebsocketCommunicator(application, f"ws/board/{self.pokerboard.id}")
+                ghost.scope['user'] = self.player
+                self.assertTrue((await ghost.connect())[0])
+                await ghost.send_json_to({"message_type": "select_ticket", "message": {"ticket": self.ticket.id}})
+                await ghost.receive_json_from()
+            layer = get_channel_layer()
+            board_group = 'board_%s' % self.pokerboard.id
+            session_group = 'session_%s' % self.ticket.id
+            self.assertTrue(layer.groups[board_group] and layer.groups[session_group])
+            await presence.reap_stale(layer)
+            self.assertNotIn(board_group, layer.groups)
+            self.assertNotIn(session_group, layer.groups)
+            events = await event_log.get_event_log().since(board_group, 1)
+            self.assertListEqual(events, [{"type": "leave", "users": [self.player.id], "stream": "board", "seq": 2}])
+            await ghost.disconnect()
+        async_to_sync(scenario)()
+
+    def test_failing_group_does_not_stop_the_reaper(self):
+        """
+        An error reaping one group is logged and the other groups are still reaped
+        """
+        store = get_presence_store()
+
+        async def scenario():
+            with patch('apps.pokerboard.presence.time.time', return_value=0):
+                await store.join('session_901', self.manager.id, 'ghost.a')
+                await store.join('session_902', self.player.id, 'ghost.b')
+            layer = get_channel_layer()
+            discard = layer.group_discard
+
+            async def group_discard(group, channel_name):
+                if group == 'session_901':
+                    raise AssertionError('Channel is not in the group')
+                await discard(group, channel_name)
+            with patch.object(layer, 'group_discard', group_discard), self.assertLogs('apps.pokerboard.presence'):
+                await presence.reap_stale(layer)
+            self.assertListEqual(await store.groups(), [])
+            for group in ('session_901', 'session_902'):
+                events = await event_log.get_event_log().since(group, 0)
+                self.assertListEqual([event["type"] for event in events], ["leave"])
+        async_to_sync(scenario)()
+
+
+@override_settings(POKERBOARD_PRESENCE=TEST_PRESENCE, POKERBOARD_EVENT_LOG=TEST_EVENT_LOG)
+class ReaperDefaultChannelLayerTestCases(SimpleTestCase):
+    """
+    Test cases for reaping presence with the configured channel layer
+    """
+    def test_reaper_discards_channels_of_other_workers(self):
+        """
+        The default layer discards channels this process never added, leaves are published
+        """
+        layer = channel_layers.make_backend(DEFAULT_CHANNEL_LAYER)
+        self.assertIsInstance(layer, ShardedRedisChannelLayer)
+        redis = FakeRedisConnection()
+
+        @asynccontextmanager
+        async def connection(index):
+            yield redis
+
+        async def scenario():
+            with patch('apps.pokerboard.presence.time.time', return_value=0):
+                await get_presence_store().join('session_903', 1, 'specific.other-worker!ghost')
+            with patch.object(layer, 'connection', connection):
+                await presence.reap_stale(layer)
+            self.assertIn(('zrem', layer._group_key('session_903'), 'specific.other-worker!ghost'), redis.commands)
+            events = await event_log.get_event_log().since('session_903', 0)
+            self.assertListEqual(events, [{"type": "leave", "users": [1], "seq": 1}])
+        async_to_sync(scenario)()
+
+
+class ShardedChannelLayerTestCases(SimpleTestCase):
+    """
+    Test cases for placing session groups on Redis hosts
+    """
+    hosts = [f"redis://shard-{index}:6379" for index in range(4)]
+
+    def test_ring_spreads_groups(self):
+        """
+        Groups are spread over every host
+        """
+        ring = HashRing(self.hosts)
+        load = Counter(ring.get(f"session_{index}") for index in range(4000))
+        self.assertEqual(set(load), {0, 1, 2, 3})
+        self.assertLess(max(load.values()), 1400)
+
+    def test_added_host_only_takes_groups(self):
+        """
+        Adding a host only moves groups to it
+        """
+        before = HashRing(self.hosts)
+        after = HashRing(self.hosts + ["redis://shard-4:6379"])
+        moved = [
+            after.get(name) for name in (f"session_{index}" for index in range(4000))
+            if before.get(name) != after.get(name)
+        ]
+        self.assertEqual(set(moved), {4})
+        self.assertLess(len(moved), 1400)
+
+    def test_layers_place_group_on_one_host(self):
+        """
+        Both layers put a group on the host picked by the ring
+        """
+        ring = HashRing(self.hosts)
+        layer = ShardedRedisChannelLayer(hosts=self.hosts)
+        pubsub_layer = ShardedRedisPubSubLoopLayer(hosts=self.hosts)
+        for group in ("session_1", "session_2", "board_7"):
+            self.assertEqual(layer.consistent_hash(group), ring.get(group))
+            self.assertIs(pubsub_layer._get_shard(group), pubsub_layer._shards[ring.get(group)])
+        self.assertEqual(ShardedRedisChannelLayer(hosts=self.hosts[:1]).consistent_hash("session_1"), 0)
+
+    def sharded_layer(self, **members):
+        layer = ShardedRedisChannelLayer(hosts=self.hosts)
+        redis = [FakeRedisConnection(members.get(f"host_{index}", ())) for index in range(len(self.hosts))]
+
+        @asynccontextmanager
+        async def connection(index):
+            yield redis[index]
+        return layer, redis, patch.object(layer, 'connection', connection)
+
+    def test_group_messages_stay_on_the_group_host(self):
+        """
+        Messages to a group are queued on the group's host, whichever host its workers live on
+        """
+        workers = [f"specific.worker{index}!" for index in range(40)]
+        channels = [worker + "abc" for worker in workers]
+        host = HashRing(self.hosts).get("board_7")
+        layer, redis, connection = self.sharded_layer(**{f"host_{host}": channels})
+        self.assertEqual({layer.consistent_hash(channel) for channel in channels}, {0, 1, 2, 3})
+        with connection:
+            async_to_sync(layer.group_send)("board_7", {"type": "ping"})
+        sent = [command for command in redis[host].commands if command[0] == "eval"]
+        self.assertCountEqual(sent[0][1], [layer.prefix + worker for worker in workers])
+        for index, other in enumerate(redis):
+            if index != host:
+                self.assertNotIn("eval", [command[0] for command in other.commands])
+
+    def test_worker_receives_from_every_host(self):
+        """
+        A worker's channels get messages queued on any host
+        """
+        layer, redis, connection = self.sharded_layer()
+
+        async def scenario():
+            channel = await layer.new_channel()
+            other = (layer.consistent_hash(channel) + 1) % len(self.hosts)
+            await redis[other].zadd(
+                layer.prefix + layer.non_local_name(channel), 0,
+                layer.serialize({"type": "ping", "__asgi_channel__": [channel]})
+            )
+            message = await asyncio.wait_for(layer.receive(channel), 1)
+            await layer.close_pools()
+            return message
+        with connection:
+            self.assertDictEqual(async_to_sync(scenario)(), {"type": "ping"})
+        self.assertDictEqual(layer.readers, {})
+
+
+class TicketOrderingTestCases(APITestCase):
+    """
+    Test cases for moving tickets of a pokerboard
+    """
+    def setUp(self):
+        self.manager = G(User, email="manager@gmail.com")
+        self.pokerboard = G(pokerboard_models.Pokerboard, manager=self.manager)
+        self.tickets = [
+            G(pokerboard_models.Ticket, pokerboard=self.pokerboard, ticket_id=f"PP-{order}", order=order)
+            for order in ordering.spaced_orders(4)
+        ]
+        self.client.force_authenticate(self.manager)
+
+    def ordered(self):
+        return list(
+            pokerboard_models.Ticket.objects.filter(pokerboard=self.pokerboard)
+            .order_by('order', 'id').values_list('ticket_id', flat=True)
+        )
+
+    def move(self, ticket, **data):
+        return self.client.post(reverse('ticket-move', args=[ticket.id]), data, format='json')
+
+    def test_move_updates_one_row(self):
+        """
+        Moving a ticket between two others only updates the moved ticket
+        """
+        first, second, third, fourth = self.tickets
+        with CaptureQueriesContext(connection) as queries:
+            ordering.move(fourth, after=first)
+        statements = [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 3)
+        self.assertTrue(statements[0].endswith('FOR UPDATE'))
+        self.assertTrue(statements[2].startswith('UPDATE') and '"id" = %s' % fourth.id in statements[2])
+        self.assertListEqual(self.ordered(), ["PP-1024", "PP-4096", "PP-2048", "PP-3072"])
+        self.assertEqual(self.move(first, before=third.id).status_code, status.HTTP_200_OK)
+        self.assertListEqual(self.ordered(), ["PP-4096", "PP-2048", "PP-1024", "PP-3072"])
+        self.assertEqual(self.move(second).status_code, status.HTTP_200_OK)
+        self.assertListEqual(self.ordered(), ["PP-4096", "PP-1024", "PP-3072", "PP-2048"])
+
+    def test_move_into_used_up_gap_renormalizes(self):
+        """
+        Once a gap is used up the pokerboard is spaced out again, keeping the order
+        """
+        first, second, third, fourth = self.tickets
+        with patch.object(ordering, 'schedule_renormalize') as schedule_renormalize:
+            for _ in range(10):
+                ordering.move(third, after=first)
+                ordering.move(fourth, after=first)
+            schedule_renormalize.assert_called_with(self.pokerboard.id)
+        self.assertListEqual(self.ordered(), ["PP-1024", "PP-4096", "PP-3072", "PP-2048"])
+        ordering.renormalize(self.pokerboard.id)
+        orders = pokerboard_models.Ticket.objects.filter(
+            pokerboard=self.pokerboard).order_by('order').values_list('order', flat=True)
+        self.assertListEqual(list(orders), ordering.spaced_orders(4))
+        self.assertListEqual(self.ordered(), ["PP-1024", "PP-4096", "PP-3072", "PP-2048"])
+
+    def test_move_next_to_other_pokerboard_ticket(self):
+        """
+        Tickets are only placed next to tickets of the same pokerboard
+        """
+        other = G(pokerboard_models.Ticket, ticket_id="OTHER-1", order=1)
+        response = self.move(self.tickets[0], after=other.id)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_next_ticket_uses_index(self):
+        """
+        The next ticket of a pokerboard is found through the (pokerboard, order) index
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("SET enable_seqscan = off")
+        plan = pokerboard_models.Ticket.objects.filter(
+            pokerboard=self.pokerboard, order__gt=1024
+        ).order_by('order').values('id')[:1].explain()
+        self.assertIn("ticket_pokerboard_order_idx", plan)
+
+
+class TicketOrderingConcurrencyTestCases(TransactionTestCase):
+    """
+    Test cases for concurrent writes of a pokerboard's order keys
+    """
+    def test_concurrent_moves_to_the_end_get_distinct_keys(self):
+        """
+        A skip waits for a move holding the pokerboard and lands after the moved ticket
+        """
+        manager = G(User, email="manager@gmail.com")
+        pokerboard = G(pokerboard_models.Pokerboard, manager=manager)
+        first, second, _ = [
+            G(pokerboard_models.Ticket, pokerboard=pokerboard, ticket_id=f"PP-{order}", order=order)
+            for order in ordering.spaced_orders(3)
+        ]
+        moved, release = threading.Event(), threading.Event()
+
+        def move_first():
+            try:
+                with transaction.atomic():
+                    ordering.move(first)
+                    moved.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        def skip_second():
+            async_to_sync(session_queries.skip_ticket)(second.id, pokerboard.id)
+
+        mover = threading.Thread(target=move_first)
+        mover.start()
+        self.assertTrue(moved.wait(5))
+        skipper = threading.Thread(target=skip_second)
+        skipper.start()
+        skipper.join(0.5)
+        self.assertTrue(skipper.is_alive())
+        release.set()
+        mover.join(5)
+        skipper.join(5)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.order, ordering.spaced_orders(4)[-1])
+        self.assertEqual(second.order, ordering.spaced_orders(5)[-1])
+
+
+class PokerboardListQueryTestCases(APITestCase):
+    """
+    Test cases for the queries of listing pokerboards
+    """
+    def setUp(self):
+        self.manager = G(User, email="manager@gmail.com")
+        self.player = G(User, email="player@gmail.com")
+
+    def create_boards(self, count, tickets):
+        for _ in range(count):
+            pokerboard = G(pokerboard_models.Pokerboard, manager=self.manager)
+            G(pokerboard_models.Invite, user=self.player, pokerboard=pokerboard,
+              status=pokerboard_models.Invite.ACCEPTED, group=None)
+            for order in ordering.spaced_orders(tickets):
+                G(pokerboard_models.Ticket, pokerboard=pokerboard, ticket_id=f"PP-{pokerboard.id}-{order}",
+                  order=order)
+
+    def list_boards(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get(reverse('pokerboard-list'), {"expand": "ticket"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data["results"]
+
+    def test_list_queries_do_not_grow_with_boards_and_tickets(self):
+        """
+        Listing pokerboards takes the same queries for any number of boards and tickets,
+        their ETag's fingerprint, the boards and their tickets
+        """
+        self.create_boards(1, tickets=1)
+        for user in (self.manager, self.player):
+            with self.assertNumQueries(3):
+                self.list_boards(user)
+        self.create_boards(5, tickets=10)
+        for user in (self.manager, self.player):
+            with self.assertNumQueries(3):
+                boards = self.list_boards(user)
+            self.assertEqual(len(boards), 6)
+
+    def test_list_hides_deleted_tickets(self):
+        """
+        Soft deleted tickets are not listed, the others come in their order with their board title
+        """
+        self.create_boards(1, tickets=3)
+        pokerboard = pokerboard_models.Pokerboard.objects.get()
+        first, second, third = pokerboard_models.Ticket.objects.order_by('order')
+        ordering.move(first)
+        second.delete()
+        self.client.force_authenticate(self.manager)
+        with self.assertNumQueries(2):
+            board = self.client.get(reverse('pokerboard-detail', args=[pokerboard.id]), {"expand": "ticket"}).data
+        self.assertListEqual([ticket["id"] for ticket in board["ticket"]], [third.id, first.id])
+        self.assertEqual(board["ticket"][0]["poker_name"], pokerboard.title)
+        self.assertEqual(board["manager"]["id"], self.manager.id)
+
+
+class PokerboardVisibilityTestCases(TestCase):
+    """
+    Test cases for the query of pokerboards visible to a user
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = G(User, email="manager@gmail.com")
+        users = User.objects.bulk_create([
+            User(email=f"user{index}@gmail.com", first_name="User") for index in range(2000)
+        ])
+        pokerboards = pokerboard_models.Pokerboard.objects.bulk_create([
+            pokerboard_models.Pokerboard(manager=cls.manager, title=f"board{index}") for index in range(50)
+        ])
+        cls.user = users[0]
+        # 100k invites, a third of them accepted
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO pokerboard_invite (user_id, pokerboard_id, status, created_at, updated_at)
+                SELECT users.id, boards.id, (users.id + boards.id) %% 3, now(), now()
+                FROM user_user users CROSS JOIN pokerboard_pokerboard boards
+                WHERE users.id >= %s AND boards.id >= %s
+                """,
+                [users[0].id, pokerboards[0].id]
+            )
+            cursor.execute("ANALYZE")
+
+    def visible(self, user):
+        request = Request(APIRequestFactory().get('/'))
+        request.user = user
+        return PokerBoardViewSet(request=request, action='list').get_queryset()
+
+    def test_visible_pokerboards(self):
+        """
+        Users see the boards they manage and the ones they accepted an invite of, once each
+        """
+        self.assertEqual(pokerboard_models.Invite.objects.count(), 100000)
+        accepted = pokerboard_models.Invite.objects.filter(
+            user=self.user, status=pokerboard_models.Invite.ACCEPTED
+        ).values_list('pokerboard_id', flat=True)
+        self.assertCountEqual([board.id for board in self.visible(self.user)], accepted)
+        self.assertEqual(self.visible(self.manager).count(), 50)
+
+    def test_invites_index_is_used(self):
+        """
+        The user's invites are looked up through an index instead of being scanned
+        """
+        plan = self.visible(self.user).explain()
+        # A bitmap heap scan only reads the rows its bitmap index scan found
+        self.assertRegex(plan, r"(Index (Only )?Scan using \w+|Bitmap Heap Scan) on pokerboard_invite")
+        self.assertNotIn("Seq Scan on pokerboard_invite", plan)
+
+
+class KeysetPaginationTestCases(APITestCase):
+    """
+    Test cases for the cursor pagination of list endpoints
+    """
+    def setUp(self):
+        self.manager = G(User, email="manager@gmail.com")
+        self.client.force_authenticate(self.manager)
+        self.pokerboards = [
+            G(pokerboard_models.Pokerboard, manager=self.manager, title=f"board{index}") for index in range(7)
+        ]
+
+    def walk(self, url, **params):
+        """
+        Follows next links from url, returns the pages' ids.
+        """
+        pages = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([row["id"] for row in response.data["results"]])
+            if response.data["next"] is None:
+                return pages
+            response = self.client.get(response.data["next"])
+
+    def test_pages_follow_creation_order(self):
+        """
+        Pages come in creation order and next links reach every board once
+        """
+        pages = self.walk(reverse('pokerboard-list'), page_size=3)
+        self.assertListEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertListEqual(sum(pages, []), [board.id for board in self.pokerboards])
+
+    def test_equal_creation_times_are_ordered_by_id(self):
+        """
+        Boards created at the same time are paged by id without repeating or skipping any
+        """
+        pokerboard_models.Pokerboard.objects.update(created_at=self.pokerboards[0].created_at)
+        pages = self.walk(reverse('pokerboard-list'), page_size=2)
+        self.assertListEqual(sum(pages, []), [board.id for board in self.pokerboards])
+
+    def test_cursor_is_stable_under_inserts(self):
+        """
+        Boards created while paging do not shift the following pages
+        """
+        response = self.client.get(reverse('pokerboard-list'), {"page_size": 3})
+        G(pokerboard_models.Pokerboard, manager=self.manager, title="late")
+        response = self.client.get(response.data["next"])
+        self.assertListEqual(
+            [row["id"] for row in response.data["results"]], [board.id for board in self.pokerboards[3:6]]
+        )
+        previous = self.client.get(response.data["previous"])
+        self.assertListEqual(
+            [row["id"] for row in previous.data["results"]], [board.id for board in self.pokerboards[:3]]
+        )
+        self.assertIsNone(previous.data["previous"])
+
+    def test_page_size_is_bounded(self):
+        """
+        Page size falls back to the default when invalid and is capped by MAX_PAGE_SIZE
+        """
+        with self.settings(MAX_PAGE_SIZE=4):
+            response = self.client.get(reverse('pokerboard-list'), {"page_size": 100})
+            self.assertEqual(len(response.data["results"]), 4)
+        response = self.client.get(reverse('pokerboard-list'), {"page_size": "all"})
+        self.assertEqual(len(response.data["results"]), 7)
+        self.assertIsNone(response.data["next"])
+
+    def test_invalid_cursor(self):
+        """
+        A malformed cursor is not found
+        """
+        response = self.client.get(reverse('pokerboard-list'), {"cursor": "garbage"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_page_queries_do_not_grow_with_depth(self):
+        """
+        A page deep in the list takes as many queries as the first one
+        """
+        with CaptureQueriesContext(connection) as queries:
+            first = self.client.get(reverse('pokerboard-list'), {"page_size": 2})
+        with self.assertNumQueries(len(queries)):
+            second = self.client.get(first.data["next"])
+        self.assertEqual(len(second.data["results"]), 2)
+
+    def test_tickets_are_paged_in_board_order(self):
+        """
+        Tickets are paged by pokerboard, then by their order
+        """
+        pokerboard = self.pokerboards[0]
+        for ticket_order in (3, 1, 2):
+            G(pokerboard_models.Ticket, pokerboard=pokerboard, ticket_id=f"PP-{ticket_order}", order=ticket_order)
+        pages = self.walk(reverse('ticket-list'), page_size=2)
+        tickets = pokerboard_models.Ticket.objects.order_by('order')
+        self.assertListEqual(sum(pages, []), [ticket.id for ticket in tickets])
+
+    def test_members_are_paged(self):
+        """
+        Members of a pokerboard are paged
+        """
+        pokerboard = self.pokerboards[0]
+        members = [
+            G(pokerboard_models.PokerboardUser, pokerboard=pokerboard, group=None) for _ in range(3)
+        ]
+        pages = self.walk(reverse('pokerboarduser-detail', args=[pokerboard.id]), page_size=2)
+        self.assertListEqual(sum(pages, []), [member.id for member in members])
+
+
+class SparseFieldsetTestCases(APITestCase):
+    """
+    Test cases for ?fields= and ?expand= of the pokerboard, ticket and vote endpoints
+    """
+    def setUp(self):
+        self.manager = G(User, email="manager@gmail.com")
+        self.client.force_authenticate(self.manager)
+
+    def create_board(self, tickets):
+        pokerboard = G(pokerboard_models.Pokerboard, manager=self.manager)
+        for order in ordering.spaced_orders(tickets):
+            G(pokerboard_models.Ticket, pokerboard=pokerboard, ticket_id=f"PP-{pokerboard.id}-{order}", order=order)
+        return pokerboard
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data, [query["sql"] for query in queries.captured_queries]
+
+    def test_tickets_embed_board_id_and_title(self):
+        """
+        Tickets carry their board's id and title only, in one query (and the ETag's) for any board size
+        """
+        pokerboard = self.create_board(3)
+        data, queries = self.get(reverse('ticket-list'))
+        self.assertEqual(len(queries), 2)
+        self.create_board(10)
+        data, queries = self.get(reverse('ticket-list'))
+        self.assertEqual(len(queries), 2)
+        self.assertDictEqual(dict(data["results"][0]["pokerboard"]), {"id": pokerboard.id, "title": pokerboard.title})
+
+    def test_expanded_ticket_board(self):
+        """
+        Expanding the board of tickets embeds its settings, and its tickets when expanded too
+        """
+        pokerboard = self.create_board(3)
+        data, queries = self.get(reverse('ticket-list'), expand="pokerboard")
+        board = data["results"][0]["pokerboard"]
+        self.assertEqual(board["manager"]["id"], self.manager.id)
+        self.assertNotIn("ticket", board)
+        self.assertEqual(len(queries), 2)
+
+        self.create_board(5)
+        data, queries = self.get(reverse('ticket-list'), expand="pokerboard.ticket")
+        self.assertEqual(len(queries), 3)
+        board = data["results"][0]["pokerboard"]
+        self.assertListEqual(
+            [ticket["id"] for ticket in board["ticket"]],
+            list(pokerboard.tickets.order_by('order').values_list('id', flat=True))
+        )
+
+    def test_fields_select_the_response_and_the_query(self):
+        """
+        Only the requested fields are returned, unrequested relations are not joined
+        """
+        self.create_board(2)
+        data, queries = self.get(reverse('ticket-list'), fields="id,order")
+        self.assertSetEqual(set(data["results"][0]), {"id", "order"})
+        self.assertFalse([query for query in queries if "pokerboard_pokerboard" in query])
+
+        data, queries = self.get(reverse('pokerboard-list'), fields="id,title")
+        self.assertSetEqual(set(data["results"][0]), {"id", "title"})
+        self.assertFalse([query for query in queries if "user_user" in query])
+
+        data, queries = self.get(reverse('ticket-list'), fields="id,pokerboard.title", expand="pokerboard")
+        pokerboard = data["results"][0]["pokerboard"]
+        self.assertDictEqual(dict(pokerboard), {"title": pokerboard["title"]})
+
+    def test_board_tickets_come_on_expansion(self):
+        """
+        Pokerboards leave out their tickets unless expanded
+        """
+        pokerboard = self.create_board(2)
+        data, queries = self.get(reverse('pokerboard-detail', args=[pokerboard.id]))
+        self.assertNotIn("ticket", data)
+        self.assertEqual(len(queries), 1)
+        data, queries = self.get(reverse('pokerboard-detail', args=[pokerboard.id]), expand="ticket")
+        self.assertEqual(len(data["ticket"]), 2)
+
+    def test_expanded_vote_ticket(self):
+        """
+        Votes carry their ticket id, the ticket when expanded
+        """
+        pokerboard = self.create_board(1)
+        ticket = pokerboard.tickets.get()
+        G(pokerboard_models.UserTicketEstimate, user=self.manager, ticket_id=ticket, estimate=3)
+        data, queries = self.get(reverse('userticketestimate-list'))
+        self.assertEqual(data["results"][0]["ticket_id"], ticket.id)
+        data, queries = self.get(reverse('userticketestimate-list'), expand="ticket_id")
+        self.assertEqual(data["results"][0]["ticket_id"]["poker_name"], pokerboard.title)
+        self.assertEqual(len(queries), 1)
+
+
+class ResponseCacheTestCases(APITransactionTestCase):
+    """
+    Test cases for the cached responses of pokerboard detail, tickets and members
+    """
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.manager = G(User, email="manager@gmail.com")
+        self.pokerboard = G(pokerboard_models.Pokerboard, manager=self.manager, title="board")
+        self.tickets = [
+            G(pokerboard_models.Ticket, pokerboard=self.pokerboard, ticket_id=f"PP-{order}", order=order)
+            for order in ordering.spaced_orders(3)
+        ]
+        self.client.force_authenticate(self.manager)
+        self.detail_url = reverse('pokerboard-detail', args=[self.pokerboard.id])
+        self.tickets_url = reverse('ticket-list')
+        self.members_url = reverse('pokerboarduser-detail', args=[self.pokerboard.id])
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def ticket_ids(self):
+        return [ticket["id"] for ticket in self.get(self.tickets_url, pokerboard=self.pokerboard.id)["results"]]
+
+    def test_detail_is_served_from_cache(self):
+        """
+        A cached board detail only costs its visibility check
+        """
+        first = self.get(self.detail_url, expand="ticket")
+        with self.assertNumQueries(1):
+            second = self.get(self.detail_url, expand="ticket")
+        self.assertEqual(first, second)
+        self.assertDictEqual(response_cache.stats(), {"hits": 1, "misses": 1, "hit_ratio": 0.5})
+
+    def test_cached_detail_is_not_served_to_other_users(self):
+        """
+        Users who can't see the board don't get its cached detail
+        """
+        self.get(self.detail_url)
+        self.client.force_authenticate(G(User, email="stranger@gmail.com"))
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_writes_bump_the_board(self):
+        """
+        Saving the board, a ticket, a member or an invite serves fresh responses
+        """
+        self.assertEqual(self.get(self.detail_url)["title"], "board")
+        self.pokerboard.title = "renamed"
+        self.pokerboard.save()
+        self.assertEqual(self.get(self.detail_url)["title"], "renamed")
+
+        self.assertEqual(len(self.ticket_ids()), 3)
+        self.tickets[0].delete()
+        self.assertEqual(len(self.ticket_ids()), 2)
+
+        self.assertEqual(len(self.get(self.members_url)["results"]), 0)
+        G(pokerboard_models.PokerboardUser, pokerboard=self.pokerboard, group=None)
+        self.assertEqual(len(self.get(self.members_url)["results"]), 1)
+
+        player = G(User, email="player@gmail.com")
+        invite = G(pokerboard_models.Invite, user=player, pokerboard=self.pokerboard, group=None)
+        version = response_cache.version(self.pokerboard.id)
+        invite.status = pokerboard_models.Invite.ACCEPTED
+        invite.save()
+        self.assertNotEqual(response_cache.version(self.pokerboard.id), version)
+
+    def test_ticket_updates_bump_the_board(self):
+        """
+        Moving and skipping tickets, which update rows directly, serve fresh ticket lists
+        """
+        first, second, third = self.tickets
+        self.assertListEqual(self.ticket_ids(), [first.id, second.id, third.id])
+        ordering.move(first)
+        self.assertListEqual(self.ticket_ids(), [second.id, third.id, first.id])
+        async_to_sync(session_queries.skip_ticket)(second.id, self.pokerboard.id)
+        self.assertListEqual(self.ticket_ids(), [third.id, first.id, second.id])
+
+    def test_other_boards_stay_cached(self):
+        """
+        Writes to a board keep the responses of other boards
+        """
+        other = G(pokerboard_models.Pokerboard, manager=self.manager, title="other")
+        other_url = reverse('pokerboard-detail', args=[other.id])
+        self.get(other_url)
+        self.tickets[0].save()
+        self.get(other_url)
+        self.assertEqual(response_cache.stats()["hits"], 1)
+
+    def test_evicted_version_does_not_serve_old_responses(self):
+        """
+        A board whose version is evicted starts a new one
+        """
+        version = response_cache.version(self.pokerboard.id)
+        self.get(self.detail_url)
+        cache.delete(response_cache.version_key(self.pokerboard.id))
+        self.get(self.detail_url)
+        self.assertGreater(response_cache.version(self.pokerboard.id), version)
+        self.assertEqual(response_cache.stats()["misses"], 2)
+
+    def test_stats_are_for_admins(self):
+        """
+        Hit and miss counters are only shown to admins
+        """
+        self.get(self.detail_url)
+        response = self.client.get(reverse('response-cache-stats'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(G(User, email="admin@gmail.com", is_staff=True))
+        self.assertEqual(self.get(reverse('response-cache-stats'))["misses"], 1)
+
+    def test_invalid_board_ids(self):
+        """
+        Boards are only cached under their integer id
+        """
+        response = self.client.get(reverse('pokerboarduser-detail', args=["abc"]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(self.tickets_url, {"pokerboard": "abc"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ConditionalGetTestCases(APITransactionTestCase):
+    """
+    Test cases for ETags and 304 answers of board, ticket, member, invite and estimate endpoints
+    """
+    def setUp(self):
+        cache.clear()
+        self.manager = G(User, email="manager@gmail.com")
+        self.player = G(User, email="player@gmail.com")
+        self.pokerboard = G(pokerboard_models.Pokerboard, manager=self.manager, title="board")
+        self.tickets = [
+            G(pokerboard_models.Ticket, pokerboard=self.pokerboard, ticket_id=f"PP-{order}", order=order)
+            for order in ordering.spaced_orders(3)
+        ]
+        G(pokerboard_models.Invite, user=self.player, pokerboard=self.pokerboard, group=None)
+        G(pokerboard_models.PokerboardUser, user=self.manager, pokerboard=self.pokerboard, group=None)
+        G(pokerboard_models.UserTicketEstimate, user=self.manager, ticket_id=self.tickets[0], estimate=3)
+        self.client.force_authenticate(self.manager)
+
+    def revalidate(self, url, queries, **params):
+        """
+        Gets url, then asserts asking again with its ETag is answered 304 in at most queries queries.
+        Returns the ETag.
+        """
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        tag = response["ETag"]
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, params, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], tag)
+        self.assertFalse(response.content)
+        return tag
+
+    def test_not_modified_with_at_most_one_query(self):
+        """
+        Every endpoint answers its own ETag with 304 after one lightweight query or none
+        """
+        endpoints = [
+            (reverse('pokerboard-list'), 1, {"expand": "ticket"}),
+            (reverse('pokerboard-detail', args=[self.pokerboard.id]), 1, {}),
+            (reverse('ticket-list'), 1, {}),
+            (reverse('ticket-list'), 0, {"pokerboard": self.pokerboard.id}),
+            (reverse('ticket-detail', args=[self.tickets[0].id]), 1, {}),
+            (reverse('pokerboarduser-detail', args=[self.pokerboard.id]), 0, {}),
+            ("/invite/managerinvites/", 0, {"pokerboard": self.pokerboard.id}),
+            (reverse('estimate-list'), 1, {}),
+        ]
+        for url, queries, params in endpoints:
+            with self.subTest(url=url, params=params):
+                self.revalidate(url, queries, **params)
+
+    def test_etags_change_with_the_data(self):
+        """
+        Writes, including direct updates of tickets, give new ETags
+        """
+        board_url = reverse('pokerboard-detail', args=[self.pokerboard.id])
+        tickets_url = reverse('ticket-list')
+        board_tag = self.revalidate(board_url, 1)
+        tickets_tag = self.revalidate(tickets_url, 1)
+        ordering.move(self.tickets[0])
+        self.assertNotEqual(self.revalidate(board_url, 1), board_tag)
+        self.assertNotEqual(self.revalidate(tickets_url, 1), tickets_tag)
+
+        tickets_tag = self.revalidate(tickets_url, 1)
+        async_to_sync(session_queries.skip_ticket)(self.tickets[1].id, self.pokerboard.id)
+        self.assertNotEqual(self.revalidate(tickets_url, 1), tickets_tag)
+
+        list_tag = self.revalidate(reverse('pokerboard-list'), 1)
+        self.pokerboard.delete()
+        response = self.client.get(reverse('pokerboard-list'), HTTP_IF_NONE_MATCH=list_tag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual(response.data["results"], [])
+
+    def test_etags_change_with_embedded_users(self):
+        """
+        Renaming a member, the manager or an invitee gives new ETags to the board's responses
+        embedding users, logging in doesn't
+        """
+        urls = [
+            (reverse('pokerboarduser-detail', args=[self.pokerboard.id]), {}),
+            (reverse('ticket-list'), {"pokerboard": self.pokerboard.id, "expand": "pokerboard"}),
+            ("/invite/managerinvites/", {"pokerboard": self.pokerboard.id}),
+        ]
+        tags = [self.revalidate(url, 0, **params) for url, params in urls]
+        self.manager.last_login = timezone.now()
+        self.manager.save(update_fields=['last_login'])
+        self.assertListEqual([self.revalidate(url, 0, **params) for url, params in urls], tags)
+
+        for user in (self.manager, self.player):
+            user.first_name = f"renamed {user.id}"
+            user.save()
+            new_tags = [self.revalidate(url, 0, **params) for url, params in urls]
+            self.assertTrue(all(new != old for new, old in zip(new_tags, tags)))
+            tags = new_tags
+        members = self.client.get(urls[0][0]).data["results"]
+        self.assertEqual(members[0]["user"]["first_name"], f"renamed {self.manager.id}")
+
+    def test_etags_are_per_user_and_shape(self):
+        """
+        The same data gets other ETags for other users or other fields
+        """
+        url = reverse('ticket-list')
+        tag = self.client.get(url)["ETag"]
+        self.assertNotEqual(self.client.get(url, {"fields": "id"})["ETag"], tag)
+        self.client.force_authenticate(self.player)
+        self.assertNotEqual(self.client.get(url)["ETag"], tag)
+
+    def test_revoked_viewer_gets_not_found(self):
+        """
+        A user who can't see the board anymore is not told it is unchanged
+        """
+        invite = pokerboard_models.Invite.objects.get(user=self.player)
+        invite.status = pokerboard_models.Invite.ACCEPTED
+        invite.save()
+        self.client.force_authenticate(self.player)
+        url = reverse('pokerboard-detail', args=[self.pokerboard.id])
+        tag = self.client.get(url)["ETag"]
+        pokerboard_models.Invite.objects.filter(id=invite.id).update(status=pokerboard_models.Invite.DECLINED)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class QueryPlanTestCases(TestCase):
+    """
+    Test cases for the query plans of hot lookups of soft deletion models on a seeded dataset
+    """
+    @classmethod
+    def setUpTestData(cls):
+        manager = G(User, email="manager@gmail.com")
+        User.objects.bulk_create([User(email=f"user{index}@gmail.com", first_name="User") for index in range(2000)])
+        pokerboard_models.Pokerboard.objects.bulk_create([
+            pokerboard_models.Pokerboard(manager=manager, title=f"board{index}") for index in range(200)
+        ])
+        # A fifth of the tickets and a seventh of the memberships and votes are soft deleted.
+        statements = [
+            """
+            INSERT INTO pokerboard_ticket
+                (created_at, updated_at, deleted_at, pokerboard_id, ticket_id, "order", status)
+            SELECT now(), now(), CASE WHEN n %% 5 = 0 THEN now() END, board.id,
+                   'PP-' || board.id || '-' || n, n * 1024, 1
+            FROM pokerboard_pokerboard board CROSS JOIN generate_series(1, 50) n
+            """,
+            """
+            INSERT INTO pokerboard_pokerboarduser (created_at, updated_at, deleted_at, user_id, pokerboard_id, role)
+            SELECT now(), now(), CASE WHEN (board.id + member.id) %% 7 = 0 THEN now() END, member.id, board.id, 2
+            FROM pokerboard_pokerboard board JOIN user_user member ON member.id %% 100 = board.id %% 100
+            """,
+            """
+            INSERT INTO pokerboard_userticketestimate
+                (created_at, updated_at, deleted_at, user_id, ticket_id_id, estimate, estimation_time)
+            SELECT now(), now(), CASE WHEN (ticket.id + voter.id) %% 7 = 0 THEN now() END, voter.id, ticket.id, 3, 0
+            FROM pokerboard_ticket ticket JOIN user_user voter ON voter.id %% 500 = ticket.id %% 500
+            """,
+            """
+            INSERT INTO pokerboard_invite (created_at, updated_at, user_id, pokerboard_id, status)
+            SELECT now(), now(), member.id, board.id, member.id %% 3
+            FROM pokerboard_pokerboard board JOIN user_user member ON member.id %% 100 = board.id %% 100
+            """,
+            """
+            INSERT INTO group_group (created_at, updated_at, deleted_at, name, owner_id)
+            SELECT now(), now(), CASE WHEN n %% 5 = 0 THEN now() END, 'group' || n, %s
+            FROM generate_series(1, 5000) n
+            """,
+            """
+            INSERT INTO group_group_members (group_id, user_id)
+            SELECT team.id, member.id FROM group_group team JOIN user_user member ON member.id %% 2000 = team.id %% 2000
+            """,
+        ]
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement, [manager.id] * statement.count("%s"))
+            cursor.execute("ANALYZE")
+
+    def test_hot_lookups_use_indexes(self):
+        """
+        No hot lookup of the soft deletion models scans a whole table
+        """
+        sample = query_plans.sample_ids()
+        for name, result in query_plans.check(sample).items():
+            with self.subTest(lookup=name):
+                self.assertListEqual(result["sequential_scans"], [], result["plan"])
+
+    def test_partial_indexes_back_alive_lookups(self):
+        """
+        Lookups of alive rows go through the partial indexes
+        """
+        sample = query_plans.sample_ids()
+        report = query_plans.check(sample)
+        for name, index in (
+            ("board_tickets", "ticket_pokerboard_order_idx"),
+            ("ticket_by_key", "ticket_alive_ticket_id_uniq"),
+            ("membership", "member_alive_user_board_idx"),
+            ("ticket_votes", "estimate_alive_ticket_idx"),
+            ("user_groups", "group_alive_id_idx"),
+        ):
+            with self.subTest(lookup=name):
+                self.assertIn(index, report[name]["plan"])
+
+    def test_sequential_scans(self):
+        """
+        Sequential scans are picked out of plans
+        """
+        plan = "Nested Loop\n  ->  Seq Scan on group_group\n  ->  Index Scan using x on y"
+        self.assertListEqual(query_plans.sequential_scans(plan), ["->  Seq Scan on group_group"])
+
+
+class TicketImportTestCases(APITestCase):
+    """
+    Test cases for importing Jira issues as the tickets of a new pokerboard
+    """
+    def setUp(self):
+        self.manager = G(User, email="manager@gmail.com")
+        G(pokerboard_models.ManagerCredentials, user=self.manager)
+        self.client.force_authenticate(self.manager)
+        self.taken = G(pokerboard_models.Ticket, ticket_id="PP-2", order=ordering.ORDER_GAP)
+
+    def create_board(self, keys, title="import"):
+        issues = [{"key": key, "fields": {"customfield_10016": 3}} for key in keys]
+        with patch('apps.pokerboard.serializer.Jira') as jira:
+            jira.return_value.jql.return_value = {"issues": issues}
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(
+                    reverse('pokerboard-list'), {"title": title, "tickets": keys}, format='json'
+                )
+        return response, len(queries)
+
+    def test_import_reports_each_key(self):
+        """
+        Free keys are imported in Jira's order, keys on another board are reported and skipped
+        """
+        response, _ = self.create_board(["PP-1", "PP-2", "PP-3", "PP-1"])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertListEqual(response.data["ticket_responses"], [
+            {"estimate": 3, "status_code": 200, "key": "PP-1"},
+            {"message": "Ticket part of another pokerboard.", "status_code": 400, "key": "PP-2"},
+            {"estimate": 3, "status_code": 200, "key": "PP-3"},
+            {"estimate": 3, "status_code": 200, "key": "PP-1"},
+        ])
+        pokerboard = pokerboard_models.Pokerboard.objects.get(title="import")
+        self.assertListEqual(
+            list(pokerboard.tickets.order_by('order').values_list('ticket_id', 'order')),
+            [("PP-1", ordering.ORDER_GAP), ("PP-3", 2 * ordering.ORDER_GAP)]
+        )
+        self.assertTrue(pokerboard_models.PokerboardUser.objects.filter(
+            pokerboard=pokerboard, user=self.manager
+        ).exists())
+
+    def test_import_queries_do_not_grow_with_issues(self):
+        """
+        Importing takes the same queries for any number of issues
+        """
+        _, few = self.create_board([f"FEW-{index}" for index in range(3)], title="few")
+        _, many = self.create_board([f"MANY-{index}" for index in range(300)], title="many")
+        self.assertEqual(few, many)
+        self.assertEqual(pokerboard_models.Ticket.objects.filter(pokerboard__title="many").count(), 300)
+
+    def test_key_taken_during_import_is_reported(self):
+        """
+        A key another board took after it was checked is skipped and reported as taken
+        """
+        spaced_orders = ordering.spaced_orders
+
+        def rival_import(count):
+            G(pokerboard_models.Ticket, ticket_id="PP-3", order=ordering.ORDER_GAP)
+            return spaced_orders(count)
+        with patch.object(ordering, 'spaced_orders', rival_import):
+            response, _ = self.create_board(["PP-1", "PP-3"])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertListEqual(response.data["ticket_responses"], [
+            {"estimate": 3, "status_code": 200, "key": "PP-1"},
+            {"message": "Ticket part of another pokerboard.", "status_code": 400, "key": "PP-3"},
+        ])
+        pokerboard = pokerboard_models.Pokerboard.objects.get(title="import")
+        self.assertListEqual(list(pokerboard.tickets.values_list('ticket_id', flat=True)), ["PP-1"])
+
+    def test_nothing_to_import(self):
+        """
+        A board whose keys are all taken is not created
+        """
+        response, _ = self.create_board(["PP-2"])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(pokerboard_models.Pokerboard.objects.filter(title="import").exists())
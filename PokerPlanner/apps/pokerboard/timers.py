@@ -0,0 +1,100 @@
+import time
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.test.signals import setting_changed
+from django.utils.module_loading import import_string
+
+from apps.pokerboard import event_log
+from libs import redis_pool
+
+# Time a fired timer stays locked, so workers firing late don't repeat it
+EXPIRY_LOCK_SECONDS = 300
+
+
+class BaseTimerLock:
+    """
+    Lets a single worker act on a ticket timer.
+
+    Every worker having sessions of a ticket schedules its timer, the one
+    acquiring the lock when it fires broadcasts the expiry.
+    """
+
+    async def acquire(self, key, ttl):
+        """
+        Takes the lock for ttl seconds, returns False if it is already taken.
+        """
+        raise NotImplementedError
+
+
+class InMemoryTimerLock(BaseTimerLock):
+    """
+    Timer lock living in the current process, only correct with a single
+    worker. Used for local development and tests.
+    """
+
+    def __init__(self, **kwargs):
+        self.locks = {}
+
+    async def acquire(self, key, ttl):
+        now = time.monotonic()
+        if self.locks.get(key, 0) > now:
+            return False
+        self.locks = {
+            lock_key: expiry for lock_key, expiry in self.locks.items() if expiry > now
+        }
+        self.locks[key] = now + ttl
+        return True
+
+
+class RedisTimerLock(BaseTimerLock):
+    """
+    Timer lock shared by all workers through Redis (SET NX).
+    """
+
+    def __init__(self, hosts=None, prefix='timer', **kwargs):
+        self.host = (hosts or [('localhost', 6379)])[0]
+        self.prefix = prefix
+
+    async def acquire(self, key, ttl):
+        redis = await redis_pool.get_redis_pool(self.host)
+        return bool(await redis.set(
+            f'{self.prefix}:{key}', '1', expire=int(ttl), exist=redis.SET_IF_NOT_EXIST
+        ))
+
+
+_timer_lock = None
+
+
+def get_timer_lock():
+    """
+    Returns the timer lock configured in settings.POKERBOARD_TIMER_LOCK.
+    """
+    global _timer_lock
+    if _timer_lock is None:
+        config = getattr(settings, 'POKERBOARD_TIMER_LOCK', {})
+        backend = import_string(
+            config.get('BACKEND', 'apps.pokerboard.timers.InMemoryTimerLock')
+        )
+        _timer_lock = backend(**config.get('CONFIG', {}))
+    return _timer_lock
+
+
+def _reset_timer_lock(setting, **kwargs):
+    global _timer_lock
+    if setting == 'POKERBOARD_TIMER_LOCK':
+        _timer_lock = None
+
+
+setting_changed.connect(_reset_timer_lock)
+
+
+async def expire(ticket_id, deadline):
+    """
+    Broadcasts timer_expired to the ticket's session, once for all workers.
+    """
+    if await get_timer_lock().acquire(f'{ticket_id}:{deadline}', EXPIRY_LOCK_SECONDS):
+        await event_log.publish(get_channel_layer(), 'session_%s' % ticket_id, {
+            'type': 'timer_expired',
+            'ticket': ticket_id,
+        }, ticket=ticket_id)
@@ -21,4 +21,5 @@ urlpatterns = [
     path('comment', pokerboard_views.CommentView.as_view(), name="comment"),
     path('manager', pokerboard_views.ManagerCreateView.as_view()),
     path('jiraticket', pokerboard_views.TicketDetailView.as_view()),
+    path('responsecache', pokerboard_views.ResponseCacheStatsView.as_view(), name='response-cache-stats'),
 ]
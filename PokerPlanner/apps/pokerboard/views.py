@@ -1,17 +1,36 @@
+import functools
 import json
 import requests
 
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
-from django.db.models.query_utils import Q
+from django.db.models import Prefetch
+from django.http import Http404
 from rest_framework import generics, mixins, viewsets, status, serializers
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from apps.pokerboard import access_cache, jira_outbox, ordering, response_cache
 from apps.pokerboard import models as pokerboard_models
 from apps.pokerboard import serializer as pokerboard_serializers
+from libs import conditional, pagination
+from libs import serializers as util_serializers
 
 from atlassian import Jira
 
+
+def pokerboard_id(value):
+    """
+    Pokerboard id given in a URL, responses are cached under this one
+    form of it.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise Http404
+
+
 class PokerBoardViewSet(viewsets.ModelViewSet):
     """
     Pokerboard View for CRUD operations
@@ -23,15 +42,63 @@ class PokerBoardViewSet(viewsets.ModelViewSet):
             return pokerboard_serializers.PokerBoardCreationSerializer
         return pokerboard_serializers.PokerBoardSerializer
     
+    def visible_boards(self):
+        # Ids of the boards managed and of the ones invited to, looked up
+        # once each through an index, rather than a join of every invite
+        # which needed de-duplicating boards.
+        invited = pokerboard_models.Invite.objects.filter(
+            user=self.request.user, status=pokerboard_models.Invite.ACCEPTED
+        ).values('pokerboard')
+        managed = pokerboard_models.Pokerboard.objects.filter(manager=self.request.user).values('id')
+        return pokerboard_models.Pokerboard.objects.filter(id__in=managed.union(invited))
+
     def get_queryset(self):
-        user = pokerboard_models.Pokerboard.objects.filter(Q(manager=self.request.user) |
-                             Q(invites__user=self.request.user, invites__status=1)).distinct()
-        return user
+        queryset = self.visible_boards()
+        if util_serializers.requested(self.request, 'manager'):
+            queryset = queryset.select_related('manager')
+        if util_serializers.expanded(self.request, 'ticket'):
+            # Their pokerboard is the board they are prefetched for.
+            queryset = queryset.prefetch_related(
+                Prefetch('tickets', queryset=pokerboard_models.Ticket.objects.order_by('order', 'id'))
+            )
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        related = [
+            name for name, shown in (
+                ('manager', util_serializers.requested(request, 'manager')),
+                ('tickets', util_serializers.expanded(request, 'ticket')),
+            ) if shown
+        ]
+        return conditional.respond(
+            request, functools.partial(super().list, request, *args, **kwargs),
+            conditional.fingerprint(self.visible_boards(), *related)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Pokerboard detail, shared by its viewers through the response cache
+        once each of them is allowed to see the board.
+        """
+        board_id = pokerboard_id(kwargs['pk'])
+        allowed = self.visible_boards().filter(id=board_id).exists
+        return conditional.respond(
+            request,
+            functools.partial(
+                response_cache.respond, request, board_id,
+                functools.partial(super().retrieve, request, *args, **kwargs), allowed=allowed
+            ),
+            [response_cache.version(board_id)], allowed=allowed
+        )
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context["manager_id"] = self.request.user.id
         return context
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        access_cache.invalidate_pokerboard(instance.id)
     
 
 class ManagerCreateView(generics.CreateAPIView):
@@ -109,9 +176,27 @@ class PokerboardMembersView(mixins.RetrieveModelMixin,
         """
         Gets all the pokerboard's members
         """
-        group_members = pokerboard_models.PokerboardUser.objects.filter(pokerboard=pk)
-        members = self.serializer_class(group_members, many=True)
-        return Response(members.data)
+        board_id = pokerboard_id(pk)
+        return conditional.respond(
+            request,
+            functools.partial(
+                response_cache.respond, request, board_id, functools.partial(self.list_members, request, pk)
+            ),
+            [response_cache.version(board_id)]
+        )
+
+    def list_members(self, request, pk):
+        group_members = pokerboard_models.PokerboardUser.objects.filter(
+            pokerboard=pk
+        ).select_related('user', 'group')
+        if util_serializers.expanded(request, 'pokerboard'):
+            group_members = group_members.select_related('pokerboard')
+        members = self.get_serializer(self.paginate_queryset(group_members), many=True)
+        return self.get_paginated_response(members.data)
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        access_cache.invalidate_member(instance.pokerboard_id, instance.user_id)
     
         
 class VoteViewSet(viewsets.ModelViewSet):
@@ -122,6 +207,18 @@ class VoteViewSet(viewsets.ModelViewSet):
     serializer_class = pokerboard_serializers.VoteSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        queryset = pokerboard_models.UserTicketEstimate.objects.all()
+        if util_serializers.requested(self.request, 'user'):
+            queryset = queryset.select_related('user')
+        if util_serializers.expanded(self.request, 'ticket_id'):
+            queryset = queryset.select_related('ticket_id__pokerboard')
+        return queryset
+
+
+class TicketPagination(pagination.KeysetPagination):
+    ordering = ('pokerboard', 'order', 'id')
+
 
 class TicketViewSet(viewsets.ModelViewSet):
     """
@@ -130,6 +227,74 @@ class TicketViewSet(viewsets.ModelViewSet):
     queryset = pokerboard_models.Ticket.objects.all()
     serializer_class = pokerboard_serializers.PokerboardTicketSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = TicketPagination
+
+    def get_queryset(self):
+        queryset = pokerboard_models.Ticket.objects.all()
+        if self.action == 'list' and 'pokerboard' in self.request.query_params:
+            queryset = queryset.filter(pokerboard=self.board_filter())
+        if util_serializers.expanded(self.request, 'pokerboard'):
+            queryset = queryset.select_related('pokerboard__manager')
+            if util_serializers.expanded(self.request, 'pokerboard', 'ticket'):
+                queryset = queryset.prefetch_related(Prefetch(
+                    'pokerboard__tickets', queryset=pokerboard_models.Ticket.objects.order_by('order', 'id')
+                ))
+        elif util_serializers.requested(self.request, 'pokerboard'):
+            queryset = queryset.select_related('pokerboard')
+        return queryset
+
+    def board_filter(self):
+        try:
+            return int(self.request.query_params['pokerboard'])
+        except ValueError:
+            raise serializers.ValidationError({'pokerboard': ['A valid integer is required.']})
+
+    def list(self, request, *args, **kwargs):
+        """
+        Lists tickets, the tickets of one pokerboard given by ?pokerboard=
+        come from the response cache.
+        """
+        view = functools.partial(super().list, request, *args, **kwargs)
+        if 'pokerboard' not in request.query_params:
+            return conditional.respond(request, view, self.fingerprint(self.get_queryset()))
+        board_id = self.board_filter()
+        return conditional.respond(
+            request, functools.partial(response_cache.respond, request, board_id, view),
+            [response_cache.version(board_id)]
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        view = functools.partial(super().retrieve, request, *args, **kwargs)
+        if not str(kwargs['pk']).isdigit():
+            return view()
+        return conditional.respond(
+            request, view, self.fingerprint(pokerboard_models.Ticket.objects.filter(id=kwargs['pk']))
+        )
+
+    def fingerprint(self, tickets):
+        related = ['pokerboard'] if util_serializers.requested(self.request, 'pokerboard') else []
+        return conditional.fingerprint(tickets, *related)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        access_cache.invalidate_ticket(serializer.instance.id)
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        access_cache.invalidate_ticket(instance.id)
+
+    @action(detail=True, methods=['post'])
+    def move(self, request, pk=None):
+        """
+        Moves a ticket before or after another ticket, or to the end.
+        """
+        ticket = self.get_object()
+        serializer = pokerboard_serializers.TicketMoveSerializer(
+            data=request.data, context={'ticket': ticket}
+        )
+        serializer.is_valid(raise_exception=True)
+        ordering.move(ticket, **serializer.validated_data)
+        return Response(self.get_serializer(ticket).data, status=status.HTTP_200_OK)
 
 
 class CommentView(generics.CreateAPIView, generics.RetrieveAPIView):
@@ -142,19 +307,18 @@ class CommentView(generics.CreateAPIView, generics.RetrieveAPIView):
 
     def perform_create(self, serializer):
         """
-        Create a comment on Jira.
+        Queue a comment for Jira, it is pushed by the outbox task.
         """
-        manager = pokerboard_models.ManagerCredentials.objects.get(user=self.request.user)
-        jira = Jira(
-            url = manager.url,
-            username = manager.username,
-            password = manager.password,
+        ticket = generics.get_object_or_404(
+            pokerboard_models.Ticket, id=serializer.validated_data['ticket_id']
         )
-        jira_ticket_id = pokerboard_models.Ticket.objects.get(id=serializer.validated_data['ticket_id']).ticket_id
         try:
-            jira.issue_add_comment(jira_ticket_id, serializer.validated_data['comment'])
-        except requests.exceptions.ConnectionError:
-            raise serializers.ValidationError("Connection Error from Jira")
+            jira_outbox.enqueue(
+                self.request.user.id, ticket, pokerboard_models.JiraOutbox.COMMENT,
+                {'comment': serializer.validated_data['comment']}
+            )
+        except pokerboard_models.ManagerCredentials.DoesNotExist:
+            raise serializers.ValidationError("Jira credentials not found")
 
     def get(self, request, *args, **kwargs):
         ticket_id = request.query_params.get('ticket_id')
@@ -240,4 +404,23 @@ class UserTicketEstimateRetrieveView(mixins.ListModelMixin, viewsets.GenericView
     serializer_class = pokerboard_serializers.UserEstimateSerializer
 
     def get_queryset(self):
-        return pokerboard_models.UserTicketEstimate.objects.filter(user=self.request.user)
+        return pokerboard_models.UserTicketEstimate.objects.filter(
+            user=self.request.user
+        ).select_related('ticket_id__pokerboard')
+
+    def list(self, request, *args, **kwargs):
+        estimates = pokerboard_models.UserTicketEstimate.objects.filter(user=request.user)
+        return conditional.respond(
+            request, functools.partial(super().list, request, *args, **kwargs),
+            conditional.fingerprint(estimates, 'ticket_id', 'ticket_id__pokerboard')
+        )
+
+
+class ResponseCacheStatsView(APIView):
+    """
+    Hits and misses of the pokerboard response cache in this process.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(response_cache.stats())
@@ -7,6 +7,7 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
 
+from apps.user import token_cache
 from libs import managers as util_managers
 from libs import models as util_models
 
@@ -63,3 +64,12 @@ class User(AbstractBaseUser, PermissionsMixin, util_models.CommonInfo, util_mode
 
     def __str__(self):
         return self.email
+
+
+@receiver(post_save, sender=User)
+def invalidate_tokens(sender, instance, created, **kwargs):
+    """
+    Cached tokens of a user updated or soft deleted carry the old user.
+    """
+    if not created:
+        token_cache.invalidate_user(instance.id)
@@ -1,3 +1,8 @@
+from asgiref.sync import async_to_sync
+from ddf import G
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
 from django.urls import reverse
 
 from rest_framework import status
@@ -6,6 +11,8 @@ from rest_framework.exceptions import ErrorDetail
 from rest_framework.test import APITestCase
 
 from apps.user import models as user_models
+from apps.user import token_cache
+from PokerPlanner.token_auth import TokenAuthMiddleware
 
 
 class UserTests(APITestCase):
@@ -334,3 +341,116 @@ class UserTests(APITestCase):
             "token": Token.objects.get(user=user).key
         }
         self.assertEqual(response.data, expected_data)
+
+
+class TokenCacheTests(APITestCase):
+    """
+    Test cases for cached token authentication
+    """
+    def setUp(self):
+        cache.clear()
+        token_cache.local_cache().clear()
+        self.user = G(user_models.User, email="cached@gmail.com", deleted_at=None)
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_token_lookup_is_cached(self):
+        """
+        Ensures a token is looked up once and requests get their own copy of the user.
+        """
+        with self.assertNumQueries(1):
+            first = token_cache.get_token(self.token.key)
+        with self.assertNumQueries(0):
+            second = token_cache.get_token(self.token.key)
+        self.assertEqual(second.user, self.user)
+        self.assertIsNot(second.user, first.user)
+        self.assertIsNone(token_cache.get_token("unknown"))
+
+    @override_settings(TOKEN_CACHE={'SHARED': True})
+    def test_shared_tier_is_used_by_other_processes(self):
+        """
+        Ensures a token cached by another process is not looked up again.
+        """
+        token_cache.get_token(self.token.key)
+        token_cache.local_cache().clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(token_cache.get_token(self.token.key).user, self.user)
+
+    def test_logout_invalidates_token(self):
+        """
+        Ensures a token stops working once its user logged out.
+        """
+        self.assertEqual(self.client.get('/users/').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.post(reverse('logout')).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get('/users/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_invalidates_token_in_other_processes(self):
+        """
+        Ensures a token cached by another process stops working once its user logged out.
+        """
+        token_cache.get_token(self.token.key)
+        other_process = token_cache.local_cache()
+        token_cache._local = token_cache.LRUCache(10, 60)
+        self.assertEqual(self.client.post(reverse('logout')).status_code, status.HTTP_200_OK)
+        token_cache._local = other_process
+        self.assertIsNotNone(other_process.get(self.token.key))
+        with self.assertNumQueries(1):
+            self.assertIsNone(token_cache.get_token(self.token.key))
+
+    def test_deleted_user_token_is_rejected(self):
+        """
+        Ensures tokens of soft deleted users stop working.
+        """
+        self.assertEqual(self.client.get('/users/').status_code, status.HTTP_200_OK)
+        self.user.delete()
+        self.assertEqual(self.client.get('/users/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class TokenAuthMiddlewareTests(TransactionTestCase):
+    """
+    Test cases for websocket token authentication
+    """
+    def setUp(self):
+        token_cache.local_cache().clear()
+        self.user = G(user_models.User, email="socket@gmail.com", deleted_at=None)
+        self.token = Token.objects.create(user=self.user)
+
+    def test_websocket_middleware_resolves_token(self):
+        """
+        Ensures the websocket middleware authenticates from the query string, even with flags in it.
+        """
+        scopes = []
+
+        async def application(scope, receive, send):
+            scopes.append(scope)
+
+        middleware = TokenAuthMiddleware(application)
+        for query_string in (f"pid=1&flag&token={self.token.key}".encode(), b"flag", b"token=unknown"):
+            async_to_sync(middleware)({"type": "websocket", "query_string": query_string}, None, None)
+        self.assertEqual(scopes[0]["user"], self.user)
+        self.assertIsInstance(scopes[1]["user"], AnonymousUser)
+        self.assertIsInstance(scopes[2]["user"], AnonymousUser)
+
+
+class LRUCacheTests(SimpleTestCase):
+    """
+    Test cases for the in-process token cache
+    """
+    def test_least_recently_used_is_evicted(self):
+        """
+        Ensures the cache stays bounded by evicting entries not used lately.
+        """
+        lru = token_cache.LRUCache(size=2, ttl=60)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+        self.assertEqual((lru.get("a"), lru.get("b"), lru.get("c")), (1, None, 3))
+
+    def test_entries_expire(self):
+        """
+        Ensures entries are not returned after their ttl.
+        """
+        lru = token_cache.LRUCache(size=2, ttl=0)
+        lru.set("a", 1)
+        self.assertIsNone(lru.get("a"))
@@ -0,0 +1,152 @@
+"""
+Resolution of auth tokens to users, shared by REST and websocket
+authentication.
+
+Tokens are kept in a bounded LRU cache of the process for
+TOKEN_CACHE['TTL'] seconds and, when TOKEN_CACHE['SHARED'] is set, in the
+Django cache so workers share lookups. Logging out and deleting or
+updating a user invalidate its tokens: they are dropped from the current
+process and a new revision of each token is written to the Django cache.
+Every hit of the process cache checks that revision, so other processes
+sharing the Django cache stop accepting the token right away.
+"""
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.test.signals import setting_changed
+from rest_framework.authtoken.models import Token
+
+DEFAULTS = {
+    'SIZE': 10000,
+    'TTL': 60,
+    'SHARED': False,
+}
+
+
+def config(name):
+    return getattr(settings, 'TOKEN_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def shared_key(key):
+    return f'auth_token:{key}'
+
+
+def revision_key(key):
+    return f'auth_token_revision:{key}'
+
+
+class LRUCache:
+    """
+    Thread safe mapping keeping at most size entries for ttl seconds,
+    least recently used ones are evicted first.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expiry = entry
+            if expiry <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_local = None
+
+
+def local_cache():
+    global _local
+    if _local is None:
+        _local = LRUCache(config('SIZE'), config('TTL'))
+    return _local
+
+
+def _reset_local_cache(setting, **kwargs):
+    global _local
+    if setting == 'TOKEN_CACHE':
+        _local = None
+
+
+setting_changed.connect(_reset_local_cache)
+
+
+def get_token(key):
+    """
+    Returns the token of key with its user, None if there is no such token
+    or its user is deleted.
+    """
+    # Read before the token, an invalidation racing with the lookup leaves
+    # a revision the cached token doesn't match.
+    revision = cache.get(revision_key(key))
+    entry = local_cache().get(key)
+    token = entry[0] if entry is not None and entry[1] == revision else None
+    if token is None and config('SHARED'):
+        token = cache.get(shared_key(key))
+        if token is not None:
+            local_cache().set(key, (token, revision))
+    if token is None:
+        token = Token.objects.select_related('user').filter(
+            key=key, user__deleted_at=None
+        ).first()
+        if token is None:
+            return None
+        local_cache().set(key, (token, revision))
+        if config('SHARED'):
+            cache.set(shared_key(key), token, config('TTL'))
+    # Requests may modify their user, they get a copy of it.
+    return copy.deepcopy(token)
+
+
+async def aget_token(key):
+    """
+    get_token for async code, run in a thread as even cached tokens check
+    their revision in the Django cache.
+    """
+    return await database_sync_to_async(get_token)(key)
+
+
+def invalidate(*keys):
+    for key in keys:
+        local_cache().delete(key)
+    # Tokens cached by other processes expire within the TTL, so does
+    # their revision.
+    cache.set_many({revision_key(key): uuid.uuid4().hex for key in keys}, config('TTL'))
+    if config('SHARED'):
+        cache.delete_many([shared_key(key) for key in keys])
+
+
+def invalidate_user(user_id):
+    """
+    Forgets every token of the user.
+    """
+    invalidate(*Token.objects.filter(user_id=user_id).values_list('key', flat=True))
@@ -4,7 +4,7 @@ from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from apps.user import (serializers as user_serializers, models as user_models)
+from apps.user import (serializers as user_serializers, models as user_models, token_cache)
 from .tasks import send_email_task
 from .verificationToken import account_activation_token
 
@@ -63,7 +63,9 @@ class LogoutView(APIView):
     def post(self, request, format=None):
         '''Removes token from user when they log out.'''
         try:
+            key = request.user.auth_token.key
             request.user.auth_token.delete()
+            token_cache.invalidate(key)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
         return Response(status=status.HTTP_200_OK)
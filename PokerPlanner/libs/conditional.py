@@ -0,0 +1,62 @@
+"""
+Conditional GET of API responses.
+
+A view's ETag is derived from a cheap fingerprint of the data it returns,
+such as a version counter or the latest updated_at and row count of its
+queryset, so a request whose If-None-Match holds it is answered 304
+before the data is read or serialized.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.http import Http404
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def fingerprint(queryset, *related):
+    """
+    Latest updated_at and number of rows of queryset, and latest
+    updated_at of the related objects it is serialized with, in one
+    query.
+    """
+    aggregates = {'updated_at': Max('updated_at'), 'rows': Count('pk', distinct=True)}
+    for name in related:
+        aggregates[name] = Max(f'{name}__updated_at')
+    values = queryset.order_by().aggregate(**aggregates)
+    return [values[name] for name in aggregates]
+
+
+def etag(request, *parts):
+    """
+    Strong ETag of the response of request to its user for parts.
+    """
+    user_id = getattr(request.user, 'pk', None)
+    value = repr([user_id, request.build_absolute_uri(), *parts])
+    return quote_etag(hashlib.sha1(value.encode()).hexdigest())
+
+
+def not_modified(request, tag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+    tags = parse_etags(if_none_match)
+    return '*' in tags or tag in tags
+
+
+def respond(request, view, parts, allowed=None):
+    """
+    Answers 304 when request already holds the ETag of parts and allowed()
+    (if given) passes, otherwise returns view() with the ETag set on
+    success.
+    """
+    tag = etag(request, *parts)
+    if not_modified(request, tag):
+        if allowed is not None and not allowed():
+            raise Http404
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': tag})
+    response = view()
+    if response.status_code == status.HTTP_200_OK:
+        response['ETag'] = tag
+    return response
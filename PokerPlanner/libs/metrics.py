@@ -0,0 +1,58 @@
+import statistics
+import threading
+from collections import Counter, deque
+
+# Observations kept per metric for summaries
+HISTORY_SIZE = 10000
+
+_lock = threading.Lock()
+_counters = Counter()
+_observations = {}
+
+
+def incr(name, value=1):
+    """
+    Increments a counter of the current process.
+    """
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name, value):
+    """
+    Records a measurement (latency, batch size, ...) of the current process.
+    """
+    with _lock:
+        _observations.setdefault(name, deque(maxlen=HISTORY_SIZE)).append(value)
+
+
+def summarize(values):
+    ordered = sorted(values)
+    if not ordered:
+        return {'count': 0}
+    return {
+        'count': len(ordered),
+        'mean': round(statistics.mean(ordered), 3),
+        'p50': ordered[(len(ordered) - 1) // 2],
+        'p95': ordered[int(round(0.95 * (len(ordered) - 1)))],
+        'max': ordered[-1],
+    }
+
+
+def snapshot():
+    """
+    Returns counters and summaries of observations.
+    """
+    with _lock:
+        counters = dict(_counters)
+        observations = {name: list(values) for name, values in _observations.items()}
+    return {
+        'counters': counters,
+        'observations': {name: summarize(values) for name, values in observations.items()},
+    }
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _observations.clear()
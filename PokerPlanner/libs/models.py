@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
 
 from libs import managers as util_managers
@@ -15,6 +16,11 @@ class CommonInfo(models.Model):
         abstract = True
 
 
+# Condition of partial indexes of soft deletion models, matching the
+# deleted_at IS NULL their default manager adds to every query
+ALIVE = Q(deleted_at=None)
+
+
 class SoftDeletionModel(models.Model):
     """
     Class handling soft deletion of all models.
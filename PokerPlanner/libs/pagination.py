@@ -0,0 +1,150 @@
+"""
+Keyset (cursor) pagination of list endpoints.
+
+A page is read after the last row of the previous one on the ordering of
+the view, which ends with the primary key. Each page is a range scan of
+page_size rows of the index matching the ordering however deep it is, and
+rows inserted meanwhile neither shift nor repeat the rows of later pages.
+"""
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(position, reverse=False):
+    data = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Returns the position and direction held by a cursor, raises ValueError
+    for a malformed one.
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return list(data['p']), bool(data['r'])
+    except (binascii.Error, UnicodeError, TypeError, KeyError, AttributeError) as err:
+        raise ValueError(cursor) from err
+
+
+def flip(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+def after(ordering, position):
+    """
+    Filter of the rows coming after position on ordering.
+
+    The comparison is lexicographic, the leading bound on the first field
+    lets the database scan the index from position on.
+    """
+    lookups = [
+        (field.lstrip('-'), 'lt' if field.startswith('-') else 'gt', value)
+        for field, value in zip(ordering, position)
+    ]
+    name, lookup, value = lookups[-1]
+    condition = Q(**{f'{name}__{lookup}': value})
+    for name, lookup, value in reversed(lookups[:-1]):
+        condition = Q(**{f'{name}__{lookup}': value}) | Q(**{name: value}) & condition
+    name, lookup, value = lookups[0]
+    return Q(**{f'{name}__{lookup}e': value}) & condition
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginates on ordering, a list of unique fields ending with the primary
+    key, with next and previous links holding the first or last row's
+    position.
+    """
+    ordering = ('created_at', 'id')
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    @property
+    def page_size(self):
+        return getattr(settings, 'REST_FRAMEWORK', {}).get('PAGE_SIZE') or 50
+
+    @property
+    def max_page_size(self):
+        return getattr(settings, 'MAX_PAGE_SIZE', 500)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.model = queryset.model
+        page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        position, self.reverse = self.decode_position(cursor) if cursor else (None, False)
+        ordering = [flip(field) for field in self.ordering] if self.reverse else list(self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(after(ordering, position))
+
+        rows = list(queryset[:page_size + 1])
+        more = len(rows) > page_size
+        rows = rows[:page_size]
+        if self.reverse:
+            rows.reverse()
+        # Going forward there are rows before the cursor, going back there
+        # are rows after it.
+        self.has_next = more if not self.reverse else position is not None
+        self.has_previous = position is not None if not self.reverse else more
+        self.rows = rows
+        return rows
+
+    def decode_position(self, cursor):
+        try:
+            position, reverse = decode_cursor(cursor)
+            if len(position) != len(self.ordering):
+                raise ValueError(cursor)
+            return [
+                self.field(name).to_python(value) for name, value in zip(self.ordering, position)
+            ], reverse
+        except (ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def field(self, name):
+        return self.model._meta.get_field(name.lstrip('-'))
+
+    def position(self, row):
+        return [self.field(name).value_to_string(row) for name in self.ordering]
+
+    def link(self, row, reverse):
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param,
+            encode_cursor(self.position(row), reverse)
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.rows:
+            return None
+        return self.link(self.rows[-1], False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.rows:
+            return None
+        return self.link(self.rows[0], True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
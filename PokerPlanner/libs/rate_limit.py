@@ -0,0 +1,63 @@
+import time
+
+
+class TokenBucket:
+    """
+    Allows rate events per second on average, with bursts of up to burst
+    events.
+    """
+
+    def __init__(self, rate, burst):
+        if rate <= 0 or burst < 1:
+            raise ValueError(f'Token bucket needs rate > 0 and burst >= 1, got {rate} and {burst}')
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def retry_after(self):
+        """
+        Seconds until a token is available.
+        """
+        return max(0, (1 - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    """
+    Token buckets of a single client: one shared by all its events and
+    one per event type having its own limit.
+
+    limits maps an event type (or "default" for the shared bucket) to
+    {"rate": events per second, "burst": events}, rate must be above 0
+    and burst at least 1.
+    """
+
+    def __init__(self, limits):
+        buckets = {}
+        for key, limit in limits.items():
+            try:
+                buckets[key] = TokenBucket(**limit)
+            except ValueError as error:
+                raise ValueError(f'Invalid rate limit "{key}": {error}') from None
+        self.default = buckets.pop('default', None)
+        self.buckets = buckets
+
+    def throttle(self, key):
+        """
+        Takes a token from every bucket of the event type and returns 0,
+        or returns seconds to wait if one of them is empty.
+        """
+        buckets = [bucket for bucket in (self.default, self.buckets.get(key)) if bucket]
+        for bucket in buckets:
+            bucket.refill()
+        retry_after = max([bucket.retry_after() for bucket in buckets], default=0)
+        if retry_after:
+            return retry_after
+        for bucket in buckets:
+            bucket.tokens -= 1
+        return 0
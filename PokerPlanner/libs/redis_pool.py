@@ -0,0 +1,41 @@
+import asyncio
+import weakref
+
+import aioredis
+
+_pools = weakref.WeakKeyDictionary()
+
+
+def _connection_kwargs(host):
+    """
+    Normalise a host entry (same format as channels_redis "hosts") into
+    aioredis connection kwargs.
+    """
+    if isinstance(host, dict):
+        kwargs = dict(host)
+        if 'address' not in kwargs:
+            kwargs['address'] = 'redis://localhost:6379'
+        return kwargs
+    if isinstance(host, (list, tuple)):
+        return {'address': tuple(host)}
+    return {'address': host}
+
+
+async def get_redis_pool(host):
+    """
+    Returns an aioredis pool for given host, shared by every caller
+    running on the current event loop.
+    """
+    loop = asyncio.get_event_loop()
+    loop_pools = _pools.setdefault(loop, {})
+    key = repr(host)
+    if key not in loop_pools:
+        kwargs = _connection_kwargs(host)
+        address = kwargs.pop('address')
+        pool = await aioredis.create_redis_pool(address, **kwargs)
+        if key in loop_pools:
+            # Another coroutine won the race while we were connecting.
+            pool.close()
+        else:
+            loop_pools[key] = pool
+    return loop_pools[key]
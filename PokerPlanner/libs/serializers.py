@@ -0,0 +1,97 @@
+"""
+Sparse fieldsets and explicit expansion of nested serializers.
+
+?fields=id,title,pokerboard.title keeps only the given fields and
+?expand=pokerboard,pokerboard.ticket replaces the lightweight
+representation of expandable fields by their full serializer. Dotted
+paths reach the fields of expanded serializers.
+"""
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def query_paths(request, param):
+    """
+    Dotted paths listed in a query parameter, None when it is not given.
+    """
+    if request is None or param not in request.query_params:
+        return None
+    value = request.query_params[param]
+    return [path for path in value.replace(' ', '').split(',') if path]
+
+
+def names(paths):
+    return {path.split('.', 1)[0] for path in paths}
+
+
+def under(paths, name):
+    prefix = f'{name}.'
+    return [path[len(prefix):] for path in paths if path.startswith(prefix)]
+
+
+def requested(request, name):
+    """
+    Whether the response of request holds the top level field name.
+    """
+    fields = query_paths(request, FIELDS_PARAM)
+    return fields is None or name in names(fields)
+
+
+def expanded(request, name, path=None):
+    """
+    Whether the field name, or the dotted path under it, is expanded in
+    the response of request.
+    """
+    expand = query_paths(request, EXPAND_PARAM) or []
+    if path is not None:
+        return expanded(request, name) and path in under(expand, name)
+    return requested(request, name) and name in names(expand)
+
+
+class ExpandableFieldsMixin:
+    """
+    Serializer keeping the fields and expanding the fields asked for by
+    the request, or by its parent serializer when nested.
+
+    Meta.expandable maps field names to the serializer class (or its
+    dotted path) and options used when the field is expanded. Expandable
+    fields missing from Meta.fields are left out until expanded.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requested_fields = fields
+        self.requested_expand = expand
+
+    def is_root(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def shape(self):
+        if self.requested_fields is None and self.requested_expand is None and self.is_root():
+            request = self.context.get('request')
+            return query_paths(request, FIELDS_PARAM), query_paths(request, EXPAND_PARAM) or []
+        return self.requested_fields, self.requested_expand or []
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested_fields, expand = self.shape()
+        expandable = getattr(self.Meta, 'expandable', {})
+        for name in names(expand) & set(expandable):
+            serializer_class, options = expandable[name]
+            if isinstance(serializer_class, str):
+                serializer_class = import_string(serializer_class)
+            fields[name] = serializer_class(
+                fields=under(requested_fields or [], name) or None,
+                expand=under(expand, name),
+                **options
+            )
+        if requested_fields is not None:
+            kept = names(requested_fields)
+            fields = type(fields)((name, field) for name, field in fields.items() if name in kept)
+        return fields